@@ -0,0 +1,99 @@
+import math
+
+
+class LeaderboardAggregates:
+    """Накопительная статистика таблицы лидеров.
+
+    Хранит число игроков, суммы очков и процентов и гистограмму очков.
+    Обновляется за O(1) при изменении лучшего результата игрока, а
+    перцентили считаются по гистограмме без обхода всех игроков.
+    """
+
+    __slots__ = ("count", "score_sum", "percentage_sum", "histogram")
+
+    def __init__(self, count=0, score_sum=0, percentage_sum=0.0, histogram=None):
+        self.count = count
+        self.score_sum = score_sum
+        self.percentage_sum = percentage_sum
+        self.histogram = list(histogram or [])
+
+    @classmethod
+    def from_records(cls, records):
+        """Считает статистику заново по записям игроков"""
+        aggregates = cls()
+        for record in records:
+            aggregates.add(record)
+        return aggregates
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            count=data.get("count", 0),
+            score_sum=data.get("score_sum", 0),
+            percentage_sum=data.get("percentage_sum", 0.0),
+            histogram=data.get("histogram"),
+        )
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "score_sum": self.score_sum,
+            "percentage_sum": self.percentage_sum,
+            "histogram": list(self.histogram),
+        }
+
+    def add(self, record):
+        score = record["score"]
+        self.count += 1
+        self.score_sum += score
+        self.percentage_sum += record["percentage"]
+        if score >= len(self.histogram):
+            self.histogram.extend([0] * (score + 1 - len(self.histogram)))
+        self.histogram[score] += 1
+
+    def remove(self, record):
+        score = record["score"]
+        self.count -= 1
+        self.score_sum -= score
+        self.percentage_sum -= record["percentage"]
+        self.histogram[score] -= 1
+
+    def replace(self, old_record, new_record):
+        """Учитывает замену записи игрока (old_record может быть None)"""
+        if old_record is not None:
+            self.remove(old_record)
+        self.add(new_record)
+
+    def clear(self):
+        self.count = 0
+        self.score_sum = 0
+        self.percentage_sum = 0.0
+        self.histogram = []
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.count if self.count else 0.0
+
+    @property
+    def avg_percentage(self):
+        return self.percentage_sum / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Счёт, не ниже которого набрали fraction игроков (метод ближайшего ранга)"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for score, players in enumerate(self.histogram):
+            seen += players
+            if seen >= target:
+                return score
+        return len(self.histogram) - 1
+
+    @property
+    def median(self):
+        return self.percentile(0.5)
+
+    @property
+    def p90(self):
+        return self.percentile(0.9)
@@ -0,0 +1,75 @@
+from collections import Counter
+
+# callback_data кнопки ответа: "a:<вопрос>:<вариант>" (id вопроса в шестнадцатеричном виде),
+# в групповом раунде — префикс "g". Данные не зависят от сессии, поэтому клавиатура вопроса
+# собирается один раз, а устаревшие нажатия отсеиваются по message_id сообщения с кнопками
+ANSWER_PREFIX = "a"
+GROUP_ANSWER_PREFIX = "g"
+
+
+def encode_answer(question_id, option, prefix=ANSWER_PREFIX):
+    """Кодирует нажатие кнопки ответа в callback_data (не длиннее 64 байт)"""
+    return f"{prefix}:{question_id:x}:{option}"
+
+
+def decode_answer(data, prefix=ANSWER_PREFIX):
+    """Разбирает callback_data кнопки ответа в (question_id, вариант); None, если формат не тот.
+
+    Кнопки прежнего формата "a:<сессия>:<вопрос>:<вариант>", отправленные до
+    обновления бота, тоже разбираются: id сессии в них больше не нужен.
+    """
+    parts = data.split(":") if data else ()
+    if len(parts) not in (3, 4) or parts[0] != prefix:
+        return None
+    try:
+        return int(parts[-2], 16), int(parts[-1])
+    except ValueError:
+        return None
+
+
+class AnswerValidator:
+    """Отсеивает устаревшие и повторные нажатия до обращений к Bot API.
+
+    Проверка занимает O(1): нажатие принимается, только если оно пришло
+    с последнего отправленного сессии сообщения (message_id) и относится
+    к вопросу, который сейчас ждёт ответа, а вариант есть среди вариантов
+    этого вопроса.
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = Counter()
+
+    def check(self, session, message_id, data, questions):
+        """Возвращает (question_id, вариант) или None, если нажатие отклонено.
+
+        message_id — сообщение, на кнопку которого нажали (None, если
+        Telegram его не прислал); questions — банк вопросов
+        (get(question_id) с полем options).
+        """
+        answer = decode_answer(data)
+        if answer is None:
+            # Чужие или повреждённые данные
+            return self._reject("malformed")
+        question_id, option = answer
+        if message_id is None or message_id != session.message_id:
+            # Сообщение из прошлой викторины или с прошлым вопросом
+            return self._reject("stale")
+        index = session.current_question
+        if session.pending_step or index >= len(session.question_ids) or session.question_ids[index] != question_id:
+            if index > 0 and session.question_ids[index - 1] == question_id:
+                # Повторное нажатие на уже отвеченный вопрос
+                return self._reject("duplicate")
+            return self._reject("stale")
+        if not 0 <= option < len(questions.get(question_id).options):
+            # Подделанные данные или кнопки другой раскладки вариантов
+            return self._reject("malformed")
+        self.accepted += 1
+        return question_id, option
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return None
+
+    def stats(self):
+        return {"accepted": self.accepted, **self.rejected}
@@ -0,0 +1,277 @@
+"""Сжатые бэкапы недель таблицы лидеров с манифестом и ротацией.
+
+Просмотр и восстановление (бота перед восстановлением нужно остановить):
+    python3 backups.py list [--dir .]
+    python3 backups.py restore 20250105_200000 [--dir .] [--to leaderboard.json]
+"""
+import argparse
+import glob
+import gzip
+import heapq
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+
+from ranking import RankingIndex
+from results_journal import ResultsJournal
+from storage import parse_leaderboard, write_json_atomic
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "backups_manifest.json"
+MANIFEST_FORMAT = 1
+BACKUP_PATTERN = re.compile(r"leaderboard_backup_(\d{8}_\d{6})\.json(\.gz|\.zst)?$")
+EXTENSIONS = {"gzip": ".json.gz", "zstd": ".json.zst"}
+COMPRESSION_BY_SUFFIX = {None: "none", ".gz": "gzip", ".zst": "zstd"}
+# Игроков сериализуется за одну запись в архив
+DUMP_CHUNK = 1000
+
+
+def top_players(leaderboard, n=3):
+    """n лучших игроков в порядке рейтинга: [user_id, имя, счёт, вопросов]"""
+    best = heapq.nsmallest(n, leaderboard.items(), key=lambda item: RankingIndex.make_key(*item))
+    return [
+        [user_id_str, record["username"], record["score"], record["total_questions"]]
+        for user_id_str, record in best
+    ]
+
+
+class BackupStore:
+    """Каталог бэкапов прошедших недель.
+
+    Неделя сериализуется потоково (без одной огромной строки) прямо в
+    gzip или zstd. Манифест хранит метку, файл, число игроков и победителей
+    каждой недели, так что список недель не требует открывать архивы.
+    После записи применяется ротация: последние keep_weekly бэкапов плюс
+    последний бэкап каждого из keep_monthly последних месяцев.
+
+    Методы блокирующие: из цикла событий их вызывают через asyncio.to_thread.
+    """
+
+    def __init__(self, directory, compression="gzip", keep_weekly=8, keep_monthly=12):
+        if compression == "zstd" and zstandard is None:
+            logger.error("Модуль zstandard не установлен, бэкапы будут сжиматься gzip")
+            compression = "gzip"
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Неизвестный формат сжатия бэкапов: {compression}")
+        self.directory = directory
+        self.compression = compression
+        self.keep_weekly = keep_weekly
+        self.keep_monthly = keep_monthly
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def entries(self):
+        """Бэкапы из манифеста, от старых к новым"""
+        with self._lock:
+            return list(self._load())
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        entries = {}
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    entries = {entry["label"]: entry for entry in json.load(f)["backups"]}
+        except Exception as e:
+            logger.error(f"Ошибка при чтении манифеста бэкапов, собираю заново: {e}")
+            entries = {}
+        # Бэкапы, которых нет в манифесте (старые несжатые JSON), добавляем один раз
+        added = 0
+        for path in glob.glob(os.path.join(self.directory, "leaderboard_backup_*")):
+            match = BACKUP_PATTERN.search(os.path.basename(path))
+            if not match or match.group(1) in entries:
+                continue
+            try:
+                compression = COMPRESSION_BY_SUFFIX[match.group(2)]
+                leaderboard = self._read_file(path, compression)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать бэкап {path}: {e}")
+                continue
+            entries[match.group(1)] = self._entry(match.group(1), path, compression, leaderboard)
+            added += 1
+        self._entries = sorted(entries.values(), key=lambda entry: entry["label"])
+        if added:
+            logger.info(f"В манифест бэкапов добавлено найденных файлов: {added}")
+            self._save()
+        return self._entries
+
+    def _save(self):
+        payload = json.dumps({"format": MANIFEST_FORMAT, "backups": self._entries}, ensure_ascii=False, indent=2)
+        write_json_atomic(self.manifest_path, payload)
+
+    def _entry(self, label, path, compression, leaderboard):
+        return {
+            "label": label,
+            "file": os.path.basename(path),
+            "compression": compression,
+            "players": len(leaderboard),
+            "bytes": os.path.getsize(path),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "winners": top_players(leaderboard),
+        }
+
+    def write(self, label, leaderboard):
+        """Сохраняет неделю label, обновляет манифест и удаляет лишние бэкапы.
+
+        leaderboard не должен меняться во время записи (записи игроков
+        в хранилище заменяются, а не изменяются, так что снимка достаточно).
+        """
+        path = os.path.join(self.directory, f"leaderboard_backup_{label}{EXTENSIONS[self.compression]}")
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=EXTENSIONS[self.compression], dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                with self._writer(raw) as f:
+                    self._dump(f, leaderboard)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            entries = [entry for entry in self._load() if entry["label"] != label]
+            entry = self._entry(label, path, self.compression, leaderboard)
+            entries.append(entry)
+            self._entries = sorted(entries, key=lambda item: item["label"])
+            removed = self._apply_retention()
+            self._save()
+        logger.info(
+            f"Создан бэкап таблицы лидеров: {path} ({entry['players']} игроков, {entry['bytes']} байт), "
+            f"удалено старых: {len(removed)}"
+        )
+        return entry
+
+    def _writer(self, raw):
+        if self.compression == "zstd":
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb', filename="")
+        return io.TextIOWrapper(stream, encoding='utf-8')
+
+    @staticmethod
+    def _dump(f, leaderboard):
+        """Пишет словарь игроков кусками по DUMP_CHUNK записей"""
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        f.write("{")
+        separator = ""
+        chunk = []
+        for user_id_str, record in leaderboard.items():
+            chunk.append(f"{encode(user_id_str)}:{encode(record)}")
+            if len(chunk) >= DUMP_CHUNK:
+                f.write(separator + ",".join(chunk))
+                separator = ","
+                chunk = []
+        if chunk:
+            f.write(separator + ",".join(chunk))
+        f.write("}")
+
+    def _apply_retention(self):
+        """Оставляет keep_weekly последних бэкапов и последний бэкап keep_monthly последних месяцев"""
+        keep = {entry["label"] for entry in self._entries[-self.keep_weekly:]} if self.keep_weekly else set()
+        months = set()
+        for entry in reversed(self._entries):
+            month = entry["label"][:6]
+            if month not in months and len(months) < self.keep_monthly:
+                months.add(month)
+                keep.add(entry["label"])
+        removed = [entry for entry in self._entries if entry["label"] not in keep]
+        for entry in removed:
+            try:
+                os.unlink(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Не удалось удалить старый бэкап {entry['file']}: {e}")
+        self._entries = [entry for entry in self._entries if entry["label"] in keep]
+        return removed
+
+    def read(self, label):
+        """Словарь игроков недели label"""
+        for entry in self.entries():
+            if entry["label"] == label:
+                return self._read_file(os.path.join(self.directory, entry["file"]), entry["compression"])
+        raise KeyError(f"Бэкап недели {label} не найден")
+
+    @staticmethod
+    def _read_file(path, compression):
+        if compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("для чтения бэкапа нужен модуль zstandard")
+            with open(path, 'rb') as raw:
+                with io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding='utf-8') as f:
+                    raw_data = json.load(f)
+        elif compression == "gzip":
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                raw_data = json.load(f)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw_data = json.load(f)
+        leaderboard, _ = parse_leaderboard(raw_data)
+        return leaderboard
+
+    def restore(self, label, leaderboard_path, journal_path=None):
+        """Делает неделю label текущей таблицей лидеров (файл JSON-хранилища).
+
+        Список чатов для рассылок из текущего файла сохраняется, а журнал
+        результатов journal_path очищается — его записи относятся к
+        заменяемой таблице.
+        """
+        leaderboard = self.read(label)
+        state = {}
+        if os.path.exists(leaderboard_path):
+            with open(leaderboard_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        if not isinstance(state, dict) or "format" not in state:
+            state = {}
+        # Статистика пересчитается при загрузке
+        state.pop("aggregates", None)
+        state["format"] = state.get("format", 2)
+        state["players"] = leaderboard
+        write_json_atomic(leaderboard_path, json.dumps(state, ensure_ascii=False, separators=(',', ':')))
+        if journal_path and os.path.exists(journal_path):
+            ResultsJournal(journal_path).truncate()
+        return len(leaderboard)
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Бэкапы таблицы лидеров")
+    parser.add_argument("--dir", default=".", help="каталог с бэкапами")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="список недель")
+    restore_parser = commands.add_parser("restore", help="восстановить неделю как текущую таблицу")
+    restore_parser.add_argument("label", help="метка недели, например 20250105_200000")
+    restore_parser.add_argument("--to", default="leaderboard.json", help="файл таблицы лидеров")
+    restore_parser.add_argument("--journal", default="leaderboard.journal", help="журнал результатов игр")
+    args = parser.parse_args()
+
+    store = BackupStore(args.dir)
+    if args.command == "list":
+        for entry in store.entries():
+            winner = entry["winners"][0][1] if entry["winners"] else "—"
+            print(f"{entry['label']}  {entry['players']:>8} игроков  {entry['bytes']:>10} байт  "
+                  f"{entry['file']}  победитель: {winner}")
+    else:
+        players = store.restore(args.label, args.to, args.journal)
+        print(f"Неделя {args.label} восстановлена в {args.to}: {players} игроков")
+
+
+if __name__ == '__main__':
+    main()
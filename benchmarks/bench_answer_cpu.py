@@ -0,0 +1,133 @@
+"""Процессорное время подготовки ответа: сборка на лету против скомпилированных вопросов.
+
+Измеряет только CPU-работу одного ответа (проверка, текст результата,
+клавиатура следующего вопроса), без обращений к Bot API. Тексты и
+клавиатура замеряются отдельно. Прежний путь собирал клавиатуру с id
+сессии в кнопках на каждый вопрос, новый берёт готовую клавиатуру вопроса.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_answer_cpu.py [--answers 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from question_bank import compile_questions, question_headers
+from quiz_data import QUESTIONS
+
+SESSION_ID = 0x5EED  # сессия, id которой прежний путь вписывал в кнопки
+
+
+def texts_on_the_fly(question_index, selected_option, score):
+    """Прежний путь handle_answer + send_next_question: тексты результата и вопроса"""
+    question_data = QUESTIONS[question_index]
+    is_correct = selected_option == question_data["correct_option"]
+    if is_correct:
+        score += 1
+    fun_fact = question_data.get('fun_fact', '')
+    if is_correct:
+        result_text = "✅ **Верно!** Отличный ответ!"
+    else:
+        correct_answer = question_data["options"][question_data["correct_option"]]
+        result_text = f"❌ **Неверно!**\n\n📌 Правильный ответ: *{correct_answer}*"
+    if fun_fact:
+        result_text += f"\n\n📚 **Интересный факт:**\n{fun_fact}"
+    result_text += f"\n\n📊 **Ваш счет:** {score}/{question_index + 1}"
+
+    next_index = (question_index + 1) % len(QUESTIONS)
+    next_data = QUESTIONS[next_index]
+    text = (
+        f"🎥 **Вопрос {next_index + 1}/{len(QUESTIONS)}**\n\n"
+        f"❓ {next_data['question']}"
+    )
+    return result_text, text
+
+
+def keyboard_on_the_fly(question_index, selected_option, score):
+    """Прежний путь: клавиатура следующего вопроса с id сессии в данных кнопок"""
+    next_index = (question_index + 1) % len(QUESTIONS)
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{i+1}. {option}", callback_data=f"a:{SESSION_ID:x}:{next_index:x}:{i}")]
+        for i, option in enumerate(QUESTIONS[next_index]["options"])
+    ])
+
+
+def answer_on_the_fly(question_index, selected_option, score):
+    """Прежний путь целиком: тексты и клавиатура"""
+    return (
+        *texts_on_the_fly(question_index, selected_option, score),
+        keyboard_on_the_fly(question_index, selected_option, score),
+    )
+
+
+def make_compiled_texts():
+    compiled = compile_questions(QUESTIONS)
+    headers = question_headers(len(QUESTIONS))
+
+    def texts_compiled(question_index, selected_option, score):
+        """Новый путь: всё, кроме строки со счётом, собрано заранее"""
+        question = compiled[question_index]
+        is_correct = selected_option == question.correct_option
+        if is_correct:
+            score += 1
+        result_text = (
+            f"{question.result_text(is_correct)}"
+            f"\n\n📊 **Ваш счет:** {score}/{question_index + 1}"
+        )
+        next_index = (question_index + 1) % len(compiled)
+        return result_text, headers[next_index] + compiled[next_index].body
+
+    return texts_compiled
+
+
+def make_compiled_answer():
+    compiled = compile_questions(QUESTIONS)
+    texts_compiled = make_compiled_texts()
+
+    def answer_compiled(question_index, selected_option, score):
+        """Новый путь целиком: тексты и готовая клавиатура вопроса (CompiledQuestion.reply_markup)"""
+        next_index = (question_index + 1) % len(compiled)
+        return (
+            *texts_compiled(question_index, selected_option, score),
+            compiled[next_index].reply_markup,
+        )
+
+    return answer_compiled
+
+
+def measure(func, answers, repeats=5):
+    """Возвращает среднее процессорное время одного ответа в микросекундах (лучший из repeats прогонов)"""
+    total = len(QUESTIONS)
+    runs = []
+    for _ in range(repeats):
+        started = time.process_time()
+        for n in range(answers // repeats):
+            func(n % total, n % 4, n % 7)
+        runs.append((time.process_time() - started) / (answers // repeats) * 1_000_000)
+    return min(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк CPU на один ответ")
+    parser.add_argument("--answers", type=int, default=200_000)
+    args = parser.parse_args()
+
+    texts_before = measure(texts_on_the_fly, args.answers)
+    texts_after = measure(make_compiled_texts(), args.answers)
+    before = measure(answer_on_the_fly, args.answers)
+    after = measure(make_compiled_answer(), args.answers)
+    print(f"Тексты:    до {texts_before:6.2f}, после {texts_after:6.2f} мкс на ответ "
+          f"({texts_before / texts_after:.1f}x быстрее)")
+    print(f"Клавиатура: до {measure(keyboard_on_the_fly, args.answers):6.2f} мкс на ответ, "
+          f"после — готовая клавиатура вопроса")
+    print(f"Всего:     до {before:6.2f}, после {after:6.2f} мкс на ответ "
+          f"(разница {after - before:+.2f} мкс, {(after - before) / before:+.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Нагрузочный тест обработчиков без сети: тысячи одновременных игроков.
+
+Каждый игрок проходит викторину целиком: /quiz, ответы на все вопросы
+(нажатия кнопок из присланных ботом сообщений) и итоги. Обновления
+передаются прямо в Application.process_update, а Bot API подменён
+InProcessRequest — запросы не выходят даже на localhost. Лимиты Telegram
+и пауза между вопросами отключены, так что замеряется сам бот: обработчики,
+таблица лидеров, сессии.
+
+Каждый размер таблицы лидеров прогоняется в отдельном процессе, чтобы
+память (RSS) одного прогона не влияла на другой.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_load.py [--users 2000] [--sizes 0 10000 100000 1000000] [--backend json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from telegram import Update
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ranking import make_leaderboard
+from bench_utils import BENCHMARK_TOKEN, callback_update, command_update, first_button_data, import_bot, percentile
+from bench_webhook import ResponseWaiter
+from fake_bot_api import FakeBotApi, InProcessRequest
+
+# id игроков теста не пересекаются с id из заранее заполненной таблицы
+FIRST_USER_ID = 10_000_000
+
+
+def rss_mb():
+    """Текущий RSS процесса в МБ"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def populate(bot, size, backend):
+    """Заполняет таблицу лидеров size игроками до запуска бота"""
+    if not size:
+        return
+    leaderboard = make_leaderboard(size)
+    if backend == "sqlite":
+        bot.leaderboard_storage.load()
+        bot.leaderboard_storage.import_players(leaderboard)
+    else:
+        with open(bot.LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"format": 2, "players": leaderboard}, f, ensure_ascii=False)
+
+
+async def play(application, api, waiter, user_id, questions, latencies):
+    """Один игрок: /quiz, ответ на каждый вопрос, итоги"""
+
+    async def send(kind, data):
+        started = time.perf_counter()
+        await application.process_update(Update.de_json(data, application.bot))
+        latencies[kind].append(time.perf_counter() - started)
+
+    reply = waiter.expect("sendMessage", user_id)
+    await send("quiz", command_update(user_id, "/quiz"))
+    await reply
+    for _ in range(questions):
+        data = first_button_data(waiter.params[("sendMessage", user_id)])
+        message_id = api.last_message_ids[user_id]
+        # Следующий вопрос (или итоги после последнего) приходит отдельным сообщением
+        reply = waiter.expect("sendMessage", user_id)
+        await send("answer", callback_update(user_id, data, message_id))
+        answered = time.perf_counter()
+        await reply
+        latencies["next_step"].append(time.perf_counter() - answered)
+
+
+async def run_load(bot, users, concurrency, size, backend):
+    populate(bot, size, backend)
+    waiter = ResponseWaiter()
+    api = FakeBotApi(on_call=waiter.on_call)
+    rate_limiter = bot.PriorityRateLimiter(
+        global_rate=1e9, global_burst=1e9, private_chat_rate=1e9, private_chat_burst=1e9
+    )
+    application = bot.build_application(
+        token=BENCHMARK_TOKEN, rate_limiter=rate_limiter, request=InProcessRequest(api)
+    )
+    latencies = {"quiz": [], "answer": [], "next_step": []}
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        rss_before = rss_mb()
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(user_id):
+            async with semaphore:
+                await play(application, api, waiter, user_id, bot.QUIZ_LENGTH, latencies)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(FIRST_USER_ID + n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+        rss_after = rss_mb()
+        await application.stop()
+    await bot.post_shutdown(application)
+
+    result = {
+        "size": size,
+        "updates": users * (bot.QUIZ_LENGTH + 1),
+        "elapsed": elapsed,
+        "rss_before": rss_before,
+        "rss_after": rss_after,
+        "peak_rss": peak_rss_mb(),
+        "api_calls": dict(api.calls),
+    }
+    for kind, values in latencies.items():
+        values.sort()
+        result[kind] = (percentile(values, 0.5), percentile(values, 0.99))
+    return result
+
+
+def run_size(size, users, concurrency, backend):
+    """Один прогон в отдельном процессе"""
+    bot = import_bot(STORAGE_BACKEND=backend)
+    bot.ANSWER_DELAY = 0
+    # Журнал на каждое обновление и задачу заметно искажает замер
+    logging.disable(logging.INFO)
+    return asyncio.run(run_load(bot, users, concurrency, size, backend))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков без сети")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=2000, help="игроков одновременно")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10_000, 100_000, 1_000_000],
+                        help="размеры таблицы лидеров")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    args = parser.parse_args()
+
+    print(f"Игроков: {args.users}, одновременно: {min(args.users, args.concurrency)}, хранилище: {args.backend}")
+    print(
+        f"{'таблица':>9} {'обновл/с':>9} {'quiz p50/p99, мс':>17} {'ответ p50/p99, мс':>18} "
+        f"{'след. шаг p50/p99, мс':>22} {'RSS до/после/пик, МБ':>21}"
+    )
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            r = pool.submit(run_size, size, args.users, args.concurrency, args.backend).result()
+        print(
+            f"{r['size']:>9} {r['updates'] / r['elapsed']:>9.0f} "
+            f"{r['quiz'][0] * 1000:>8.2f}/{r['quiz'][1] * 1000:<8.2f} "
+            f"{r['answer'][0] * 1000:>9.2f}/{r['answer'][1] * 1000:<8.2f} "
+            f"{r['next_step'][0] * 1000:>11.2f}/{r['next_step'][1] * 1000:<10.2f} "
+            f"{r['rss_before']:>6.0f}/{r['rss_after']:.0f}/{r['peak_rss']:.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Сравнение поиска места игрока: полная сортировка против RankingIndex.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_ranking.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import RankingIndex
+
+TOTAL_QUESTIONS = 10
+# Дата игры у всех записей одна: на место в рейтинге она не влияет
+LAST_PLAYED = "2025-01-01T12:00:00"
+
+
+def make_leaderboard(size, seed=42):
+    """Генерирует таблицу лидеров заданного размера"""
+    rng = random.Random(seed)
+    leaderboard = {}
+    for user_id in range(size):
+        score = rng.randint(0, TOTAL_QUESTIONS)
+        leaderboard[str(user_id)] = {
+            "username": f"Игрок_{user_id}",
+            "score": score,
+            "total_questions": TOTAL_QUESTIONS,
+            "percentage": score / TOTAL_QUESTIONS * 100,
+            "last_played": LAST_PLAYED,
+            "games_played": 1,
+            "best_time": round(rng.uniform(10, 200), 2),
+        }
+    return leaderboard
+
+
+def rank_by_sort(leaderboard, user_id_str):
+    """Прежний способ из mystats_command: сортировка и линейный поиск"""
+    sorted_players = sorted(
+        leaderboard.items(),
+        key=lambda x: (x[1]["score"], x[1]["percentage"]),
+        reverse=True
+    )
+    return next(
+        (i + 1 for i, (uid, _) in enumerate(sorted_players) if uid == user_id_str),
+        None
+    )
+
+
+def measure(func, repeats):
+    """Возвращает среднее время вызова в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def run(size, lookups):
+    leaderboard = make_leaderboard(size)
+    rng = random.Random(size)
+    user_ids = [str(rng.randrange(size)) for _ in range(lookups)]
+
+    started = time.perf_counter()
+    index = RankingIndex(leaderboard)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    sort_repeats = max(1, min(lookups, 2_000_000 // size))
+    sort_ms = measure(lambda: rank_by_sort(leaderboard, user_ids[0]), sort_repeats)
+
+    lookup_iter = iter(user_ids * 2)
+    index_rank_us = measure(lambda: index.rank(next(lookup_iter)), lookups) * 1000
+
+    # Инкрементальное обновление: игрок улучшает результат
+    update_iter = iter(user_ids)
+
+    def improve():
+        user_id_str = next(update_iter)
+        record = dict(leaderboard[user_id_str])
+        record["score"] = min(TOTAL_QUESTIONS, record["score"] + 1)
+        record["percentage"] = record["score"] / TOTAL_QUESTIONS * 100
+        leaderboard[user_id_str] = record
+        index.update(user_id_str, record)
+
+    update_us = measure(improve, lookups) * 1000
+    top_us = measure(lambda: index.top(10), lookups) * 1000
+
+    print(
+        f"{size:>9} | sort+scan {sort_ms:10.2f} мс | index.rank {index_rank_us:7.2f} мкс | "
+        f"index.update {update_us:7.2f} мкс | index.top(10) {top_us:6.2f} мкс | "
+        f"построение {build_ms:8.1f} мс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска места в рейтинге")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Проверка ограничителя исходящих запросов против фейкового Bot API с лимитами.
+
+Отправляет пачку сообщений в несколько чатов без ограничителя и с
+PriorityRateLimiter и сравнивает число ответов 429 и время отправки.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_rate_limiter.py [--chats 20] [--messages 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+from fake_bot_api import FakeBotApi
+from rate_limiter import PRIORITY_DEFAULT, PRIORITY_QUIZ, PriorityRateLimiter
+
+
+async def run(chats, messages, rate_limiter):
+    api = await FakeBotApi(port=0, chat_limit=(3, 1.0), global_limit=(30, 1.0)).start()
+    bot = ExtBot(
+        token="123456:FAKE",
+        base_url=f"{api.base_url}/bot",
+        rate_limiter=rate_limiter,
+    )
+    failed = 0
+
+    async def send(chat_id, n):
+        nonlocal failed
+        kwargs = {}
+        if rate_limiter is not None:
+            kwargs["rate_limit_args"] = PRIORITY_QUIZ if n % 2 else PRIORITY_DEFAULT
+        try:
+            await bot.send_message(chat_id=chat_id, text=f"Сообщение {n}", **kwargs)
+        except RetryAfter:
+            failed += 1
+
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            send(chat_id, n) for n in range(messages) for chat_id in range(1, chats + 1)
+        ))
+        elapsed = time.perf_counter() - started
+    await api.stop()
+    return elapsed, failed, api.flood_errors
+
+
+async def main_async(args):
+    total = args.chats * args.messages
+    elapsed, failed, flood = await run(args.chats, args.messages, None)
+    print(f"Без ограничителя: {total} сообщений за {elapsed:.2f} с, ответов 429: {flood}, потеряно: {failed}")
+
+    limiter = PriorityRateLimiter()
+    elapsed, failed, flood = await run(args.chats, args.messages, limiter)
+    print(f"С ограничителем:  {total} сообщений за {elapsed:.2f} с, ответов 429: {flood}, потеряно: {failed}")
+    stats = limiter.stats()
+    print(f"Макс. глубина очереди: {stats['queue_depth_max']}, повторов: {stats['retries_total']}")
+    for priority, count in sorted(stats["wait_count"].items()):
+        average = stats["wait_time_total"][priority] / count
+        print(f"  приоритет {priority}: среднее ожидание {average * 1000:.0f} мс, "
+              f"максимум {stats['wait_time_max'][priority] * 1000:.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ограничителя исходящих запросов")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
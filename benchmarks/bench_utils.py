@@ -0,0 +1,90 @@
+"""Общие помощники бенчмарков: импорт бота в изолированном каталоге и синтетические обновления."""
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_TOKEN = "123456:BENCHMARK"
+
+_update_ids = itertools.count(1)
+
+
+def import_bot(workdir=None, **settings):
+    """Импортирует bot.py с отдельным config и во временном каталоге.
+
+    Настоящий config.py (токен, пути к таблице лидеров) не используется,
+    чтобы бенчмарк не трогал рабочие данные. workdir — общий каталог
+    для нескольких процессов (по умолчанию создаётся новый).
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir or tempfile.mkdtemp(prefix="kino_bench_"))
+    config = types.ModuleType("config")
+    config.TOKEN = BENCHMARK_TOKEN
+    for name, value in settings.items():
+        setattr(config, name, value)
+    sys.modules["config"] = config
+    import bot
+    return bot
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Игрок{user_id}"}
+
+
+def command_update(user_id, command, chat_id=None, chat_type="private"):
+    """JSON обновления с командой от пользователя"""
+    chat_id = chat_id or user_id
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": _user(user_id),
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split()[0])}],
+        },
+    }
+
+
+def callback_update(user_id, data, message_id=1, chat_id=None, chat_type="private"):
+    """JSON обновления с нажатием кнопки"""
+    chat_id = chat_id or user_id
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "text": "вопрос",
+            },
+        },
+    }
+
+
+def first_button_data(params):
+    """callback_data первой кнопки из параметров sendMessage"""
+    markup = params.get("reply_markup")
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    if not markup:
+        return None
+    return markup["inline_keyboard"][0][0]["callback_data"]
+
+
+def percentile(values, fraction):
+    """Перцентиль отсортированного списка (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
@@ -0,0 +1,149 @@
+"""Нагрузочный тест режима webhook в сравнении с long polling.
+
+Поднимает фейковый Bot API, запускает бота в выбранном режиме и
+прогоняет синтетических пользователей: /quiz, затем нажатие кнопки.
+Замеряется время от доставки нажатия боту (POST на webhook или выдача
+через getUpdates) до вызова editMessageText в фейковом API.
+
+Бот, фейковый API и генератор нагрузки работают в одном процессе, поэтому
+абсолютные цифры занижены; показательно сравнение режимов между собой.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_webhook.py [--users 500] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import collections
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from bench_utils import BENCHMARK_TOKEN, callback_update, command_update, first_button_data, import_bot, percentile
+from fake_bot_api import FakeBotApi
+
+WEBHOOK_SECRET = "benchmark-secret"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ResponseWaiter:
+    """Ждёт ответа бота в фейковом API по (метод, chat_id)"""
+
+    def __init__(self):
+        self._futures = collections.defaultdict(collections.deque)
+        self.params = {}
+
+    def expect(self, method, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        self._futures[(method, chat_id)].append(future)
+        return future
+
+    def on_call(self, method, params):
+        chat_id = params.get("chat_id")
+        if chat_id is None:
+            return
+        key = (method, int(chat_id))
+        self.params[key] = params
+        queue = self._futures.get(key)
+        while queue:
+            future = queue.popleft()
+            if not future.done():
+                future.set_result(time.perf_counter())
+                break
+
+
+async def run_mode(bot, mode, users, concurrency):
+    waiter = ResponseWaiter()
+    api = await FakeBotApi(port=0, on_call=waiter.on_call).start()
+    # Лимиты Telegram снимаем: меряем приём обновлений, а не ограничитель
+    application = bot.build_application(
+        token=BENCHMARK_TOKEN,
+        base_url=api.base_url,
+        rate_limiter=bot.PriorityRateLimiter(
+            global_rate=1e9, global_burst=1e9, private_chat_rate=1e9, private_chat_burst=1e9
+        ),
+    )
+    client = httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency))
+    port = free_port()
+
+    async with application:
+        await bot.post_init(application)
+        if mode == "webhook":
+            await application.updater.start_webhook(
+                listen="127.0.0.1", port=port, url_path="telegram",
+                secret_token=WEBHOOK_SECRET, max_connections=concurrency,
+            )
+
+            async def deliver(update):
+                response = await client.post(
+                    f"http://127.0.0.1:{port}/telegram", json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET},
+                )
+                response.raise_for_status()
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+
+            async def deliver(update):
+                api.push_update(update)
+        await application.start()
+
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def play(user_id):
+            async with semaphore:
+                question_sent = waiter.expect("sendMessage", user_id)
+                await deliver(command_update(user_id, "/quiz"))
+                await question_sent
+                data = first_button_data(waiter.params[("sendMessage", user_id)])
+                answered = waiter.expect("editMessageText", user_id)
+                started = time.perf_counter()
+                await deliver(callback_update(user_id, data, api.last_message_ids[user_id]))
+                latencies.append(await answered - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(play(1000 + n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    await client.aclose()
+    await api.stop()
+    latencies.sort()
+    return {
+        "updates_per_sec": users * 2 / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def main_async(args):
+    bot = import_bot()
+    for mode in ("polling", "webhook"):
+        result = await run_mode(bot, mode, args.users, args.concurrency)
+        print(
+            f"{mode:>8}: {result['updates_per_sec']:8.0f} обновлений/с, "
+            f"задержка ответа p50 {result['p50_ms']:6.1f} мс, p99 {result['p99_ms']:6.1f} мс"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение webhook и polling")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
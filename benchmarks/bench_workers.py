@@ -0,0 +1,115 @@
+"""Масштабирование по воркерам: пропускная способность при 1, 2, 4, ... процессах.
+
+Супервизор запускает воркеры с общей базой SQLite, а вместо getUpdates
+обновления раздаёт сам бенчмарк (подставной диспетчер). Ответы бота
+принимает фейковый Bot API. Каждый пользователь присылает /quiz, отвечает
+на первый вопрос и запрашивает /mystats; замеряется число обработанных
+обновлений в секунду.
+
+Фейковый API и генератор нагрузки работают в главном процессе и сами
+занимают ядро, поэтому рост заметен, только если ядер больше, чем воркеров.
+
+Запуск из корня репозитория:
+    python3 benchmarks/bench_workers.py [--users 2000] [--concurrency 400] [--max-workers 4]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import REPO_ROOT, BENCHMARK_TOKEN, callback_update, command_update, first_button_data, import_bot
+from bench_webhook import ResponseWaiter
+from fake_bot_api import FakeBotApi
+
+sys.path.insert(0, REPO_ROOT)
+
+from workers import Supervisor, serve_worker
+
+
+def bench_worker(index, workers, queue, workdir, base_url):
+    """Процесс-воркер бенчмарка: бот с общей базой и без лимитов Bot API"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot = import_bot(workdir=workdir, STORAGE_BACKEND="sqlite")
+    bot.ANSWER_DELAY = 0
+    rate_limiter = bot.PriorityRateLimiter(
+        global_rate=1e9, global_burst=1e9, private_chat_rate=1e9, private_chat_burst=1e9
+    )
+    asyncio.run(serve_worker(
+        bot, index, workers, queue,
+        token=BENCHMARK_TOKEN, base_url=base_url, rate_limiter=rate_limiter
+    ))
+
+
+async def run_workers(workers, users, concurrency):
+    waiter = ResponseWaiter()
+    ready = asyncio.Event()
+    started_workers = 0
+
+    def on_call(method, params):
+        nonlocal started_workers
+        if method == "getMe":
+            started_workers += 1
+            if started_workers == workers:
+                ready.set()
+        waiter.on_call(method, params)
+
+    api = await FakeBotApi(port=0, on_call=on_call).start()
+    supervisor = Supervisor(workers, bench_worker, target_args=(tempfile.mkdtemp(prefix="kino_bench_"), api.base_url))
+    supervisor.start()
+    await ready.wait()
+    # Даём воркерам загрузить хранилище после initialize
+    await asyncio.sleep(1)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def play(user_id):
+        async with semaphore:
+            question_sent = waiter.expect("sendMessage", user_id)
+            supervisor.dispatch([command_update(user_id, "/quiz")])
+            await question_sent
+            data = first_button_data(waiter.params[("sendMessage", user_id)])
+            answered = waiter.expect("editMessageText", user_id)
+            supervisor.dispatch([callback_update(user_id, data, api.last_message_ids[user_id])])
+            await answered
+            stats_sent = waiter.expect("sendMessage", user_id)
+            supervisor.dispatch([command_update(user_id, "/mystats")])
+            await stats_sent
+
+    started = time.perf_counter()
+    await asyncio.gather(*(play(1000 + n) for n in range(users)))
+    elapsed = time.perf_counter() - started
+
+    await asyncio.to_thread(supervisor.stop)
+    await api.stop()
+    return users * 3 / elapsed
+
+
+async def main_async(args):
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        throughput = await run_workers(workers, args.users, args.concurrency)
+        baseline = baseline or throughput
+        print(
+            f"воркеров {workers:2}: {throughput:8.0f} обновлений/с, "
+            f"ускорение {throughput / baseline:4.2f}x (эффективность {throughput / baseline / workers:4.0%})"
+        )
+        workers *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование по воркерам")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=400)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    print(f"Ядер: {os.cpu_count()}")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
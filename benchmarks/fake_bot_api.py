@@ -0,0 +1,217 @@
+"""Локальный фейковый Bot API для нагрузочных тестов без сети.
+
+Отвечает на основные методы (getMe, sendMessage, editMessageText,
+answerCallbackQuery, getUpdates, setWebhook, ...) и по желанию имитирует
+flood control Telegram, возвращая 429 с retry_after.
+
+Запуск отдельно:
+    python3 benchmarks/fake_bot_api.py --port 8081
+и в config.py бота: BOT_API_BASE_URL = "http://127.0.0.1:8081"
+
+InProcessRequest отвечает теми же данными без HTTP и сокетов — для
+нагрузочных тестов, где сеть только мешает замерам.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest
+
+
+class FakeBotApi:
+    """Минимальный HTTP-сервер, совместимый с Bot API по формату ответов"""
+
+    def __init__(self, host="127.0.0.1", port=8081, chat_limit=None, global_limit=None, latency=0.0,
+                 on_call=None):
+        self.host = host
+        self.port = port
+        # (число сообщений, окно в секундах) — как лимиты Telegram
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.latency = latency
+        # on_call(method, params) вызывается на каждый запрос — для замеров задержки
+        self.on_call = on_call
+        self.calls = collections.Counter()
+        self.flood_errors = 0
+        self.updates = collections.deque()
+        self._updates_event = asyncio.Event()
+        self._chat_history = collections.defaultdict(collections.deque)
+        self._global_history = collections.deque()
+        self._message_id = 0
+        # chat_id -> message_id последнего sendMessage: нажатия кнопок бот сверяет по нему
+        self.last_message_ids = {}
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def push_update(self, update):
+        """Кладёт обновление в очередь для getUpdates"""
+        self.updates.append(update)
+        self._updates_event.set()
+
+    @staticmethod
+    def _over_limit(history, limit, now):
+        count, window = limit
+        while history and history[0] <= now - window:
+            history.popleft()
+        if len(history) >= count:
+            return window - (now - history[0])
+        history.append(now)
+        return 0
+
+    def _check_flood(self, params):
+        now = time.monotonic()
+        retry_after = 0
+        if self.global_limit:
+            retry_after = self._over_limit(self._global_history, self.global_limit, now)
+        chat_id = params.get("chat_id")
+        if not retry_after and self.chat_limit and chat_id is not None:
+            retry_after = self._over_limit(self._chat_history[str(chat_id)], self.chat_limit, now)
+        return retry_after
+
+    def _result(self, method, params, message_id=None):
+        if method == "getMe":
+            return {
+                "id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": message_id or int(params.get("message_id", 0)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": params.get("text", ""),
+            }
+        if method == "getUpdates":
+            limit = int(params.get("limit", 100))
+            offset = int(params.get("offset", 0))
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+            return [self.updates[i] for i in range(min(limit, len(self.updates)))]
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        return True
+
+    async def _respond(self, method, params):
+        self.calls[method] += 1
+        message_id = None
+        if method == "sendMessage":
+            # id выдаётся до on_call: тот, кто дождался сообщения, сразу знает его id
+            self._message_id += 1
+            message_id = self.last_message_ids[int(params.get("chat_id", 0))] = self._message_id
+        if self.on_call is not None:
+            self.on_call(method, params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.startswith(("send", "edit")):
+            retry_after = self._check_flood(params)
+            if retry_after:
+                self.flood_errors += 1
+                return 429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {int(retry_after) + 1}",
+                    "parameters": {"retry_after": int(retry_after) + 1},
+                }
+        if method == "getUpdates" and not self.updates:
+            # Длинный опрос: ждём обновления не дольше timeout
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), float(params.get("timeout", 0) or 0))
+            except asyncio.TimeoutError:
+                pass
+        return 200, {"ok": True, "result": self._result(method, params, message_id)}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if headers.get("content-type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                method = path.rsplit("/", 1)[-1]
+                status, payload = await self._respond(method, params)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class InProcessRequest(BaseRequest):
+    """Транспорт Bot API для бота, который отвечает через FakeBotApi в том же процессе"""
+
+    def __init__(self, api=None):
+        self.api = api or FakeBotApi()
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        params = request_data.parameters if request_data is not None else {}
+        status, payload = await self.api._respond(url.rsplit("/", 1)[-1], params)
+        return status, json.dumps(payload).encode()
+
+
+async def serve(port, chat_limit, global_limit):
+    api = await FakeBotApi(port=port, chat_limit=chat_limit, global_limit=global_limit).start()
+    print(f"Фейковый Bot API слушает {api.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный фейковый Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--flood", action="store_true", help="имитировать лимиты Telegram (1/с на чат, 30/с всего)")
+    args = parser.parse_args()
+    chat_limit, global_limit = ((1, 1.0), (30, 1.0)) if args.flood else (None, None)
+    asyncio.run(serve(args.port, chat_limit, global_limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
+import asyncio
 import logging
-import json
 import os
+import random
+from collections import Counter
 from datetime import datetime, time, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -11,8 +14,25 @@ from telegram.ext import (
 )
 
 # Импортируем данные из других файлов
+import config
 from config import TOKEN
-from quiz_data import QUESTIONS
+from question_bank import open_question_bank, question_headers
+from quiz_session import QuizSession, SessionPersistence, evict_idle_sessions
+from answer_callback import GROUP_ANSWER_PREFIX, AnswerValidator, decode_answer
+from workers import Supervisor, poll_updates, run_worker
+from metrics import InstrumentedRequest, MetricsServer, instrument_handler, instrument_methods, registry
+from backups import BackupStore
+from history import week_date
+from storage import backup_label, create_storage
+from chat_leaderboards import create_chat_leaderboards
+from leaderboard_cache import LeaderboardMessageCache
+from message_templates import ResetPeriodTemplates, format_countdown, plural
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import GLOBAL_BURST, GLOBAL_RATE, PRIORITY_QUIZ, PriorityRateLimiter
+from broadcast import Broadcaster
+from timing_wheel import TimingWheel
+from group_quiz import CoalescedEdit, GroupRound
+from question_stats import QuestionStats
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,83 +45,172 @@ logger = logging.getLogger(__name__)
 LEADERBOARD_FILE = "leaderboard.json"
 LEADERBOARD_RESET_DAY = 6  # 0=Понедельник, 6=Воскресенье
 LEADERBOARD_RESET_TIME = time(hour=20, minute=0)  # 20:00
+LEADERBOARD_FLUSH_DELAY = 5.0  # секунд между изменением и записью на диск
+# Журнал результатов игр JSON-хранилища: файл таблицы переписывается целиком
+# только после стольких игр (и при остановке бота)
+LEADERBOARD_JOURNAL_FILE = "leaderboard.journal"
+LEADERBOARD_COMPACT_EVERY = 10000
+# Индекс прошедших недель для /history (у SQLite-хранилища — в его базе)
+HISTORY_DB_FILE = getattr(config, "HISTORY_DB_FILE", "history.db")
+HISTORY_WEEKS = 5  # недель с победителями в /history
+HISTORY_TREND_WEEKS = 8  # последних недель игрока в /history
+# Таблицы лидеров групповых чатов: загружаются при первом обращении и
+# выгружаются из памяти после CHAT_LEADERBOARD_IDLE_TTL секунд без игр и команд
+CHAT_LEADERBOARD_DIR = getattr(config, "CHAT_LEADERBOARD_DIR", "chat_leaderboards")
+CHAT_LEADERBOARD_IDLE_TTL = 3600
+CHAT_LEADERBOARD_EVICT_INTERVAL = 600  # секунд между проверками неактивных чатов
+ANSWER_DELAY = 2  # секунд между ответом и следующим вопросом
+# Время на ответ (секунд; None — без ограничения). Дедлайны всех игроков
+# ведёт одно колесо таймеров, а не задача JobQueue на каждого
+QUESTION_TIMEOUT = getattr(config, "QUESTION_TIMEOUT", 20)
+DEADLINE_TICK = 0.5  # секунд, точность дедлайнов
+DEADLINE_BATCH_SIZE = 1000  # истёкших вопросов обрабатывается за раз
+# Групповые раунды (/groupquiz): один вопрос на чат и фиксированное время на ответ.
+# Счётчик ответов под вопросом правится не чаще раза в GROUP_EDIT_INTERVAL секунд
+# (Telegram пропускает в группу около 20 сообщений в минуту)
+GROUP_QUESTION_TIMEOUT = getattr(config, "GROUP_QUESTION_TIMEOUT", 20)
+GROUP_EDIT_INTERVAL = 3
+GROUP_RESULTS_TOP = 10  # игроков в итогах раунда
+CONCURRENT_UPDATES = 256  # обновлений разных пользователей обрабатываются одновременно
+# Локальный HTTP-порт метрик Prometheus (None — выключено); у воркера N — порт + N
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")
+METRICS_PORT = getattr(config, "METRICS_PORT", None)
+# Процессов-воркеров: пользователи распределяются между ними по user_id.
+# При WORKERS > 1 нужен STORAGE_BACKEND = "sqlite" (общая база для всех воркеров)
+WORKERS = getattr(config, "WORKERS", 1)
 
-# Функции для работы с таблицей лидеров
-def load_leaderboard():
-    """Загружает таблицу лидеров из файла"""
-    try:
-        if os.path.exists(LEADERBOARD_FILE):
-            with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return {}
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке таблицы лидеров: {e}")
-        return {}
+# Бэкапы прошедших недель (JSON-хранилище): сжатие "gzip" или "zstd" (нужен пакет zstandard)
+# и ротация — последние BACKUP_KEEP_WEEKLY недель плюс по одной за BACKUP_KEEP_MONTHLY месяцев
+BACKUP_DIR = getattr(config, "BACKUP_DIR", ".")
+BACKUP_COMPRESSION = getattr(config, "BACKUP_COMPRESSION", "gzip")
+BACKUP_KEEP_WEEKLY = getattr(config, "BACKUP_KEEP_WEEKLY", 8)
+BACKUP_KEEP_MONTHLY = getattr(config, "BACKUP_KEEP_MONTHLY", 12)
 
-def save_leaderboard(data):
-    """Сохраняет таблицу лидеров в файл"""
-    try:
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.info("Таблица лидеров сохранена")
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении таблицы лидеров: {e}")
+# Хранилище таблицы лидеров: "json" (по умолчанию) или "sqlite"
+STORAGE_BACKEND = getattr(config, "STORAGE_BACKEND", "json")
+SQLITE_DB_FILE = getattr(config, "SQLITE_DB_FILE", "leaderboard.db")
 
-def update_leaderboard(user_id, username, score, total_questions):
-    """Обновляет таблицу лидеров для пользователя"""
-    leaderboard = load_leaderboard()
-    
+# Внешний банк вопросов (собирается build_question_bank.py)
+QUESTION_BANK_FILE = getattr(config, "QUESTION_BANK_FILE", "questions.jsonl")
+QUESTION_CACHE_SIZE = 4096  # скомпилированных вопросов в LRU-кэше
+QUIZ_QUESTIONS = 10  # вопросов в одной викторине
+
+# Статистика ответов по вопросам (/qstats): счётчики в памяти, в базу раз в
+# QUESTION_STATS_FLUSH_INTERVAL секунд. Команда доступна пользователям из ADMIN_IDS
+QUESTION_STATS_DB_FILE = getattr(config, "QUESTION_STATS_DB_FILE", "question_stats.db")
+QUESTION_STATS_FLUSH_INTERVAL = 60
+QSTATS_TOP = 5  # самых трудных и самых лёгких вопросов в /qstats
+QSTATS_MIN_SHOWN = 20  # показов, после которых вопрос попадает в рейтинг трудности
+ADMIN_IDS = set(getattr(config, "ADMIN_IDS", ()))
+
+# Адрес Bot API (например, локальный фейковый сервер для нагрузочных тестов)
+BOT_API_BASE_URL = getattr(config, "BOT_API_BASE_URL", None)
+
+# Получение обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = getattr(config, "BOT_MODE", "polling")
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)  # публичный адрес, например https://example.com
+WEBHOOK_LISTEN = getattr(config, "WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = getattr(config, "WEBHOOK_SECRET_TOKEN", None)
+WEBHOOK_MAX_CONNECTIONS = getattr(config, "WEBHOOK_MAX_CONNECTIONS", 40)
+
+# Рассылка уведомлений о сбросе во все чаты, где играли
+BROADCAST_CHECKPOINT_FILE = "broadcast_checkpoint.json"
+BROADCAST_CONCURRENCY = 20  # сообщений рассылки в работе одновременно
+BROADCAST_BATCH_SIZE = 500  # чатов читается из хранилища за раз
+BROADCAST_MAX_FAILURES = 3  # ошибок доставки подряд, после которых чат удаляется
+
+# Сессии викторины переживают перезапуск бота
+SESSION_DB_FILE = getattr(config, "SESSION_DB_FILE", "sessions.db")
+SESSION_FLUSH_INTERVAL = 5  # секунд между сохранениями изменившихся сессий
+# Секунд без активности, после которых сессия удаляется вместе с памятью о заданных вопросах
+SESSION_TTL = getattr(config, "SESSION_TTL", 30 * 24 * 3600)
+SESSION_EVICT_INTERVAL = 3600  # секунд между проверками устаревших сессий
+
+def load_builtin_questions():
+    """Встроенные вопросы из quiz_data (если внешний банк не собран)"""
+    from quiz_data import QUESTIONS
+    return QUESTIONS
+
+# Банк вопросов: внешний JSONL с индексом (читается по запросу) или встроенный список.
+# Вопросы компилируются при первом обращении: клавиатуры и тексты готовы заранее
+question_bank = open_question_bank(QUESTION_BANK_FILE, load_builtin_questions, cache_size=QUESTION_CACHE_SIZE)
+QUIZ_LENGTH = min(QUIZ_QUESTIONS, len(question_bank))
+QUESTION_HEADERS = question_headers(QUIZ_LENGTH)
+# Счётчики ответов по вопросам банка (воркеры складывают их в общей базе)
+question_stats = QuestionStats(QUESTION_STATS_DB_FILE, len(question_bank), shared=WORKERS > 1)
+
+# Хранилище таблицы лидеров (JSON в памяти или SQLite)
+leaderboard_storage = create_storage(
+    STORAGE_BACKEND,
+    json_path=LEADERBOARD_FILE,
+    sqlite_path=SQLITE_DB_FILE,
+    flush_delay=LEADERBOARD_FLUSH_DELAY,
+    journal_path=LEADERBOARD_JOURNAL_FILE,
+    compact_every=LEADERBOARD_COMPACT_EVERY,
+    history_path=HISTORY_DB_FILE,
+    backups=BackupStore(
+        BACKUP_DIR,
+        compression=BACKUP_COMPRESSION,
+        keep_weekly=BACKUP_KEEP_WEEKLY,
+        keep_monthly=BACKUP_KEEP_MONTHLY
+    )
+)
+# Замеряем время операций хранилища
+instrument_methods(
+    leaderboard_storage,
+    ("load", "get", "set", "record_result", "top", "rank", "archive_and_clear", "flush")
+)
+
+# Таблицы лидеров групповых чатов (в дополнение к общей)
+chat_leaderboards = create_chat_leaderboards(
+    STORAGE_BACKEND,
+    directory=CHAT_LEADERBOARD_DIR,
+    sqlite_path=SQLITE_DB_FILE,
+    flush_delay=LEADERBOARD_FLUSH_DELAY,
+    idle_ttl=CHAT_LEADERBOARD_IDLE_TTL
+)
+
+def is_group_chat(chat_id):
+    """Группы и супергруппы в Telegram имеют отрицательные id"""
+    return chat_id < 0
+
+# Функции для работы с таблицей лидеров
+def update_leaderboard(user_id, username, score, total_questions, chat_id=None, answer_time=None):
+    """Учитывает результат игры в общей таблице лидеров и в таблице группового чата.
+
+    answer_time — сумма времени ответов: при равном счёте выше тот, кто быстрее.
+    """
     # Преобразуем user_id в строку для JSON
     user_id_str = str(user_id)
     
-    # Рассчитываем процент правильных ответов
-    percentage = (score / total_questions) * 100
-    
-    # Проверяем, есть ли уже запись о пользователе
-    if user_id_str in leaderboard:
-        # Обновляем только если новый результат лучше
-        old_score = leaderboard[user_id_str]["score"]
-        old_percentage = leaderboard[user_id_str]["percentage"]
-        
-        if score > old_score or (score == old_score and percentage > old_percentage):
-            leaderboard[user_id_str].update({
-                "username": username,
-                "score": score,
-                "total_questions": total_questions,
-                "percentage": percentage,
-                "last_played": datetime.now().isoformat(),
-                "games_played": leaderboard[user_id_str].get("games_played", 0) + 1
-            })
-    else:
-        # Создаем новую запись
-        leaderboard[user_id_str] = {
-            "username": username,
-            "score": score,
-            "total_questions": total_questions,
-            "percentage": percentage,
-            "last_played": datetime.now().isoformat(),
-            "games_played": 1
-        }
-    
-    # Сохраняем обновленную таблицу
-    save_leaderboard(leaderboard)
-    return leaderboard
-
-def format_leaderboard_message(leaderboard, top_n=10):
+    # Хранилище оставляет лучший результат и считает каждую сыгранную игру
+    leaderboard_storage.record_result(user_id_str, username, score, total_questions, answer_time=answer_time)
+    leaderboard_message_cache.on_player_changed(leaderboard_storage, user_id_str)
+    if chat_id is not None and is_group_chat(chat_id):
+        update_chat_leaderboard(chat_id, user_id_str, username, score, total_questions, answer_time)
+
+def update_chat_leaderboard(chat_id, user_id_str, username, score, total_questions, answer_time=None):
+    """Учитывает результат игры только в таблице группового чата"""
+    try:
+        chat_leaderboards.get(chat_id).record_result(
+            user_id_str, username, score, total_questions, answer_time=answer_time
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении таблицы чата {chat_id}: {e}")
+
+def format_leaderboard_message(storage, top_n=10, title="ТАБЛИЦА ЛИДЕРОВ"):
     """Форматирует таблицу лидеров для отображения"""
-    if not leaderboard:
+    aggregates = storage.aggregates()
+    if not aggregates.count:
         return "🏆 Таблица лидеров пуста. Будьте первым, кто сыграет в викторину!\n\nИспользуйте /quiz чтобы начать."
     
-    # Сортируем пользователей по убыванию счета, затем по проценту
-    sorted_players = sorted(
-        leaderboard.items(),
-        key=lambda x: (x[1]["score"], x[1]["percentage"]),
-        reverse=True
-    )[:top_n]
+    # Берем лучших пользователей по убыванию счета, затем по проценту
+    sorted_players = storage.top(top_n)
     
     # Формируем сообщение
-    message_lines = ["🏆 **ТАБЛИЦА ЛИДЕРОВ** 🏆\n"]
+    message_lines = [f"🏆 **{title}** 🏆\n"]
     
     # Определяем эмодзи для мест
     medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
@@ -113,6 +222,7 @@ def format_leaderboard_message(leaderboard, top_n=10):
         total = data["total_questions"]
         percentage = data["percentage"]
         games_played = data.get("games_played", 1)
+        best_time = data.get("best_time")
         
         # Сокращаем длинные имена
         if len(username) > 15:
@@ -120,47 +230,73 @@ def format_leaderboard_message(leaderboard, top_n=10):
         
         message_lines.append(
             f"{medal} **{username}** - {score}/{total} ({percentage:.0f}%) "
+            + (f"⏱ {best_time:.1f} с " if best_time is not None else "") +
             f"🎮 {games_played} игр"
         )
     
-    # Добавляем статистику
-    total_players = len(leaderboard)
-    avg_score = sum(data["score"] for data in leaderboard.values()) / total_players
-    avg_percentage = sum(data["percentage"] for data in leaderboard.values()) / total_players
-    
+    # Добавляем статистику (накапливается в хранилище, без обхода игроков)
     message_lines.extend([
         f"\n📊 **Статистика:**",
-        f"• Всего игроков: {total_players}",
-        f"• Средний счет: {avg_score:.1f}/{len(QUESTIONS)}",
-        f"• Средний процент: {avg_percentage:.1f}%",
+        f"• Всего игроков: {aggregates.count}",
+        f"• Средний счет: {aggregates.avg_score:.1f}/{QUIZ_LENGTH}",
+        f"• Средний процент: {aggregates.avg_percentage:.1f}%",
+        f"• Медиана: {aggregates.median}/{QUIZ_LENGTH}, 90-й перцентиль: {aggregates.p90}/{QUIZ_LENGTH}",
         f"\n🎯 Ваш лучший результат может быть здесь!",
         f"Используйте /quiz чтобы попробовать снова!"
     ])
     
     return "\n".join(message_lines)
 
+# Кэш текста /top: перестраивается только при видимых изменениях
+leaderboard_message_cache = LeaderboardMessageCache(format_leaderboard_message, top_n=10)
+
+# Рассылка по всем чатам с контрольными точками
+broadcaster = Broadcaster(
+    leaderboard_storage,
+    BROADCAST_CHECKPOINT_FILE,
+    concurrency=BROADCAST_CONCURRENCY,
+    batch_size=BROADCAST_BATCH_SIZE,
+    max_failures=BROADCAST_MAX_FAILURES
+)
+
+MEDALS = ["🥇", "🥈", "🥉"]
+
+def format_winners(winners):
+    """Формирует блок с победителями прошедшей недели"""
+    if not winners:
+        return ""
+    lines = ["🏅 **Победители недели:**"]
+    for medal, (user_id, data) in zip(MEDALS, winners):
+        username = escape_markdown(data["username"])
+        lines.append(f"{medal} {username} - {data['score']}/{data['total_questions']}")
+    return "\n".join(lines) + "\n\n"
+
 # Функция сброса таблицы лидеров
+@instrument_handler
 async def reset_leaderboard(context: ContextTypes.DEFAULT_TYPE):
-    """Сбрасывает таблицу лидеров"""
+    """Сбрасывает таблицу лидеров и сообщает об этом во все чаты"""
     try:
-        # Получаем текущую таблицу лидеров перед сбросом
-        old_leaderboard = load_leaderboard()
+        # Запоминаем победителей до сброса
+        winners = leaderboard_storage.top(3)
         
-        if old_leaderboard:
-            # Сохраняем бэкап старой таблицы лидеров
-            backup_file = f"leaderboard_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                json.dump(old_leaderboard, f, ensure_ascii=False, indent=2)
-            logger.info(f"Создан бэкап таблицы лидеров: {backup_file}")
+        # Архивируем прошедшую неделю и сбрасываем таблицу лидеров
+        leaderboard_storage.archive_and_clear(backup_label())
+        leaderboard_message_cache.invalidate()
+        reset_templates.invalidate()
+        try:
+            await chat_leaderboards.clear_all()
+        except Exception as e:
+            logger.error(f"Ошибка при сбросе таблиц чатов: {e}")
         
-        # Сбрасываем таблицу лидеров
-        save_leaderboard({})
+        # Сразу сохраняем сброс на диск
+        await leaderboard_storage.flush()
         logger.info("Таблица лидеров сброшена (еженедельный сброс)")
         
         # Отправляем сообщение об обнулении
         reset_message = (
             "🔄 **ТАБЛИЦА ЛИДЕРОВ ОБНОВЛЕНА!**\n\n"
             "🎬 Рейтинг обнулен! Начинается новая игровая неделя!\n\n"
+            + format_winners(winners) +
             "🏆 **Призы недели:**\n"
             "• 1 место: Звание 'Киногений недели' 🥇\n"
             "• 2 место: Почетное звание 'Киноман' 🥈\n"
@@ -169,16 +305,11 @@ async def reset_leaderboard(context: ContextTypes.DEFAULT_TYPE):
             "📊 Таблица лидеров: /top"
         )
         
-        # Отправляем сообщение в чат (если указан chat_id)
-        if hasattr(context.job, 'chat_id') and context.job.chat_id:
-            try:
-                await context.bot.send_message(
-                    chat_id=context.job.chat_id,
-                    text=reset_message,
-                    parse_mode='Markdown'
-                )
-            except Exception as e:
-                logger.error(f"Не удалось отправить сообщение о сбросе: {e}")
+        # Рассылаем сообщение во все чаты, где играли
+        try:
+            await broadcaster.start(context.bot, reset_message, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Не удалось разослать сообщение о сбросе: {e}")
                 
     except Exception as e:
         logger.error(f"Ошибка при сбросе таблицы лидеров: {e}")
@@ -198,116 +329,266 @@ def get_next_reset_time():
     # Комбинируем дату и время
     return datetime.combine(next_reset_date, LEADERBOARD_RESET_TIME)
 
+def render_reset_texts(next_reset):
+    """Тексты, в которых из переменного есть только дата следующего сброса.
+
+    Собираются один раз за период (ResetPeriodTemplates); поля {countdown}
+    и {players} в "nextreset" заполняются при каждом запросе.
+    """
+    reset_at = next_reset.strftime("%d.%m.%Y в %H:%M")
+    return {
+        "start": (
+            "🎬 **Добро пожаловать в увлекательную викторину о кино!**\n\n"
+            "🎯 **Основные команды:**\n"
+            "• /quiz - Начать новую викторину (10 вопросов)\n"
+            "• /groupquiz - Групповой раунд в чате\n"
+            "• /top - Показать таблицу лидеров\n"
+            "• /mystats - Показать вашу статистику\n"
+            "• /nextreset - Время следующего сброса рейтинга\n"
+            "• /history - Победители прошлых недель\n"
+            "• /help - Справка по всем командам\n\n"
+            "🔄 **Система рейтинга:**\n"
+            "• Таблица лидеров обновляется еженедельно\n"
+            "• Следующий сброс: " + reset_at + "\n"
+            "• Сохраняются только лучшие результаты\n\n"
+            "🎮 **Удачи в викторине!**"
+        ),
+        "help": (
+            "📖 **КОМАНДЫ БОТА-ВИКТОРИНЫ**\n\n"
+            "🎮 **Игра:**\n"
+            "• /quiz - Начать новую викторину (10 вопросов)\n"
+            "• /groupquiz - Групповой раунд: все участники чата отвечают на общий вопрос\n\n"
+            "🏆 **Рейтинг и статистика:**\n"
+            "• /top - Показать таблицу лидеров\n"
+            "• /mystats - Ваша персональная статистика\n"
+            "• /nextreset - Время следующего сброса рейтинга\n"
+            "• /history - Победители прошлых недель и ваши результаты\n\n"
+            "ℹ️ **Информация:**\n"
+            "• /start - Главное меню\n"
+            "• /help - Эта справка\n\n"
+            "🔄 **Система рейтинга:**\n"
+            "• Таблица лидеров обновляется еженедельно\n"
+            "• Следующий сброс: " + reset_at + "\n"
+            "• Сохраняются только лучшие результаты\n"
+            "• При равном счёте выше тот, кто ответил быстрее\n\n"
+            "🎯 **Как играть:**\n"
+            "1. Используйте /quiz для начала\n"
+            "2. Отвечайте на вопросы, выбирая варианты\n"
+            + (f"   На ответ даётся {plural(QUESTION_TIMEOUT, 'секунду', 'секунды', 'секунд')}\n" if QUESTION_TIMEOUT else "") +
+            "3. Узнавайте интересные факты о кино\n"
+            "4. Соревнуйтесь с другими игроками!\n\n"
+            "🎬 **Удачи в викторине о кино!**"
+        ),
+        "nextreset": (
+            f"⏰ **СЛЕДУЮЩИЙ СБРОС ТАБЛИЦЫ ЛИДЕРОВ**\n\n"
+            f"📅 Дата: {next_reset.strftime('%d.%m.%Y')}\n"
+            f"🕐 Время: {next_reset.strftime('%H:%M')}\n"
+            "⏳ До сброса: {countdown}\n\n"
+            f"📊 **Текущая статистика:**\n"
+            "• Активных игроков: {players}\n"
+            f"• Всего вопросов: {len(question_bank)}\n"
+            f"• Частота сброса: раз в неделю (воскресенье)\n\n"
+            f"🏆 Успейте улучшить свой результат!\n"
+            f"🎮 Сыграть: /quiz\n"
+            f"📊 Текущий рейтинг: /top"
+        ),
+        "results_footer": (
+            f"🏆 **Ваш результат сохранен в таблице лидеров!**\n"
+            f"Таблица обнуляется: {reset_at}\n\n"
+            f"📊 Ваша статистика: /mystats\n"
+            f"🏆 Текущий рейтинг: /top\n"
+            f"⏰ Следующий сброс: /nextreset\n\n"
+            f"🔄 Хотите улучшить результат? /quiz"
+        ),
+        "mystats_footer": (
+            f"\n\n🔄 **Следующий сброс рейтинга:**\n{reset_at}"
+            "\n\n🎮 Сыграть еще раз: /quiz"
+        ),
+        "mystats_empty": (
+            "📊 **У вас еще нет статистики!**\n\n"
+            "Вы еще не играли в викторину.\n"
+            "🎮 Используйте команду /quiz, чтобы начать игру и "
+            "появиться в таблице лидеров!\n\n"
+            f"🔄 **Следующий сброс рейтинга:**\n{reset_at}"
+        ),
+    }
+
+# Тексты команд пересобираются только при смене даты сброса
+reset_templates = ResetPeriodTemplates(get_next_reset_time, render_reset_texts)
+
 # Обработчик команды /start
+@instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправляет приветственное сообщение при команде /start"""
-    # Получаем время следующего сброса
-    next_reset = get_next_reset_time()
+    # Запоминаем чат для рассылок
+    leaderboard_storage.register_chat(update.effective_chat.id)
     
-    await update.message.reply_text(
-        "🎬 **Добро пожаловать в увлекательную викторину о кино!**\n\n"
-        "🎯 **Основные команды:**\n"
-        "• /quiz - Начать новую викторину (10 вопросов)\n"
-        "• /top - Показать таблицу лидеров\n"
-        "• /mystats - Показать вашу статистику\n"
-        "• /nextreset - Время следующего сброса рейтинга\n"
-        "• /help - Справка по всем командам\n\n"
-        "🔄 **Система рейтинга:**\n"
-        "• Таблица лидеров обновляется еженедельно\n"
-        "• Следующий сброс: " + next_reset.strftime("%d.%m.%Y в %H:%M") + "\n"
-        "• Сохраняются только лучшие результаты\n\n"
-        "🎮 **Удачи в викторине!**"
-    )
+    await update.message.reply_text(reset_templates["start"])
 
 # Функция для отправки вопроса
-async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, question_index: int) -> None:
-    """Отправляет вопрос по указанному индексу"""
-    question_data = QUESTIONS[question_index]
+async def send_question(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, question_index: int) -> None:
+    """Отправляет вопрос викторины по его номеру (клавиатура и текст собраны заранее)"""
+    session = context.user_data
+    session_id = session.session_id
+    question = question_bank.get(session.question_ids[question_index])
     
-    # Создаем клавиатуру с вариантами ответов
-    keyboard = []
-    for i, option in enumerate(question_data["options"]):
-        keyboard.append([InlineKeyboardButton(f"{i+1}. {option}", callback_data=str(i))])
+    # Отправляем вопрос с готовой клавиатурой (нажатия сверяются по message_id)
+    message = await context.bot.send_message(
+        chat_id=chat_id,
+        text=QUESTION_HEADERS[question_index] + question.body,
+        reply_markup=question.reply_markup,
+        rate_limit_args=PRIORITY_QUIZ
+    )
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Пока вопрос отправлялся, пользователь мог начать новую викторину
+    if session.session_id != session_id:
+        return
     
-    # Отправляем вопрос с клавиатурой
-    await update.message.reply_text(
-        f"🎥 **Вопрос {question_index + 1}/{len(QUESTIONS)}**\n\n"
-        f"❓ {question_data['question']}",
-        reply_markup=reply_markup
-    )
+    # Время на ответ отсчитывается с момента отправки
+    session.question_sent(message.message_id)
+    arm_question_deadline(user_id, session)
+
+# Дедлайны ответов всех игроков: одна задача asyncio, отмена за O(1)
+question_deadlines = TimingWheel(tick=DEADLINE_TICK, batch_size=DEADLINE_BATCH_SIZE)
+
+def arm_question_deadline(user_id: int, session: QuizSession, delay=None) -> None:
+    """Ставит дедлайн ответа на текущий вопрос"""
+    if QUESTION_TIMEOUT:
+        question_deadlines.schedule(
+            user_id,
+            QUESTION_TIMEOUT if delay is None else delay,
+            (session.session_id, session.current_question)
+        )
+
+def expire_deadlines(application: Application, batch) -> None:
+    """Разбирает пачку истёкших дедлайнов: вопросы игроков и вопросы групповых раундов"""
+    personal = []
+    for key, data in batch:
+        if isinstance(key, tuple):
+            application.create_task(close_group_question(application, key[1], *data))
+        else:
+            personal.append((key, data))
+    if personal:
+        expire_questions(application, personal)
+
+def expire_questions(application: Application, batch) -> None:
+    """Засчитывает неотвеченные вовремя вопросы как неверные (пачка от колеса таймеров)"""
+    timed_out = []
+    for user_id, (session_id, question_index) in batch:
+        session = application.user_data.get(user_id)
+        # Ответ мог прийти, а викторина смениться, пока таймер ждал своего тика
+        if (session is None or session.session_id != session_id
+                or session.current_question != question_index or not session.awaiting_answer):
+            continue
+        question = question_bank.get(session.question_ids[question_index])
+        message_id = session.message_id
+        session.answer(False, QUESTION_TIMEOUT)
+        question_stats.record_timeout(question.question_id)
+        timed_out.append((user_id, session, question, message_id))
+    if timed_out:
+        application.mark_data_for_update_persistence(user_ids=[user_id for user_id, *_ in timed_out])
+        # Сообщения отправляются в фоне, колесо не ждёт Bot API
+        application.create_task(asyncio.gather(
+            *(notify_timeout(application, *item) for item in timed_out)
+        ))
+        logger.info(f"Время на ответ истекло: {len(timed_out)}")
+
+async def notify_timeout(application: Application, user_id: int, session: QuizSession, question, message_id: int) -> None:
+    """Показывает вместо вопроса правильный ответ и планирует следующий шаг"""
+    try:
+        await application.bot.edit_message_text(
+            chat_id=session.chat_id,
+            message_id=message_id,
+            text=(
+                f"⏰ **Время вышло!**\n\n{question.result_text(False)}"
+                f"\n\n📊 **Ваш счет:** {session.score}/{session.current_question}"
+            ),
+            parse_mode='Markdown',
+            rate_limit_args=PRIORITY_QUIZ
+        )
+    except Exception as e:
+        logger.error(f"Не удалось сообщить пользователю {user_id} об истечении времени: {e}")
+    schedule_next_step(application.job_queue, user_id, session)
 
 # Обработчик команды /quiz
+@instrument_handler
 async def quiz(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Начинает викторину"""
     
-    # Инициализируем данные пользователя
-    context.user_data['current_question'] = 0
-    context.user_data['score'] = 0
+    # Отменяем переход к следующему вопросу и дедлайн прошлой викторины
+    cancel_next_step(context, update.effective_user.id)
+    question_deadlines.cancel(update.effective_user.id)
     
-    # Отправляем первый вопрос
-    await send_question(update, context, 0)
+    # Запоминаем чат для рассылок
+    leaderboard_storage.register_chat(update.effective_chat.id)
     
-    logger.info(f"Пользователь {update.effective_user.id} начал викторину")
-
-async def send_next_question(update: Update, context: ContextTypes.DEFAULT_TYPE, question_index: int) -> None:
-    """Отправляет следующий вопрос"""
-    question_data = QUESTIONS[question_index]
+    # Выбираем вопросы викторины, которые пользователь еще не видел
+    session = context.user_data
+    seen = session.use_seen(len(question_bank))
     
-    # Создаем клавиатуру с вариантами ответов
-    keyboard = []
-    for i, option in enumerate(question_data["options"]):
-        keyboard.append([InlineKeyboardButton(f"{i+1}. {option}", callback_data=str(i))])
+    # Инициализируем сессию пользователя
+    user = update.effective_user
+    session.start(
+        chat_id=update.effective_chat.id,
+        username=user.first_name or user.username or f"Игрок_{user.id}",
+        question_ids=seen.draw(QUIZ_LENGTH)
+    )
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Отправляем первый вопрос
+    await send_question(context, update.effective_chat.id, update.effective_user.id, 0)
     
-    # Отправляем следующий вопрос
-    await context.bot.send_message(
-        chat_id=update.callback_query.message.chat_id,
-        text=f"🎥 **Вопрос {question_index + 1}/{len(QUESTIONS)}**\n\n"
-             f"❓ {question_data['question']}",
-        reply_markup=reply_markup
-    )
+    logger.info(f"Пользователь {update.effective_user.id} начал викторину")
+
+def next_step_job_name(user_id: int) -> str:
+    """Имя отложенной задачи перехода к следующему вопросу"""
+    return f"next_step_{user_id}"
+
+def cancel_next_step(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Отменяет запланированный переход к следующему вопросу"""
+    for job in context.job_queue.get_jobs_by_name(next_step_job_name(user_id)):
+        job.schedule_removal()
+
+# Проверка нажатий на кнопки ответов (со счётчиками отклонённых)
+answer_validator = AnswerValidator()
 
 # Обработчик нажатий на кнопки с вариантами ответов
+@instrument_handler
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает выбор варианта ответа"""
     query = update.callback_query
+    session = context.user_data
     
-    # Подтверждаем получение callback
-    await query.answer()
-    
-    # Получаем выбранный вариант
-    selected_option = int(query.data)
-    
-    # Получаем текущий вопрос из user_data
-    current_question_index = context.user_data.get('current_question', 0)
-    question_data = QUESTIONS[current_question_index]
-    
-    # Проверяем, правильный ли ответ
-    is_correct = selected_option == question_data["correct_option"]
-    
-    # Обновляем счет, если ответ правильный
-    if is_correct:
-        context.user_data['score'] = context.user_data.get('score', 0) + 1
+    # Повторные нажатия, кнопки старых вопросов и несуществующие варианты отсеиваем
+    # сразу: на нажатие только отвечаем, чтобы у клиента не висел индикатор загрузки
+    answer = answer_validator.check(
+        session, query.message.message_id if query.message else None, query.data, question_bank
+    )
+    if answer is None:
+        await query.answer()
+        return
+    question_id, selected_option = answer
     
-    # Получаем интересный факт
-    fun_fact = question_data.get('fun_fact', '')
+    # Ответ пришёл вовремя: снимаем дедлайн
+    question_deadlines.cancel(query.from_user.id)
+    elapsed = session.elapsed()
     
-    # Формируем сообщение с результатом
-    if is_correct:
-        result_text = "✅ **Верно!** Отличный ответ!"
-    else:
-        correct_answer = question_data["options"][question_data["correct_option"]]
-        result_text = f"❌ **Неверно!**\n\n📌 Правильный ответ: *{correct_answer}*"
+    # Проверяем, правильный ли ответ, обновляем счет и переходим к следующему вопросу
+    # (до первого await, чтобы повторное нажатие уже было отклонено)
+    question = question_bank.get(question_id)
+    is_correct = selected_option == question.correct_option
+    session.answer(is_correct, elapsed)
+    question_stats.record_answer(question_id, selected_option, is_correct)
+    next_question_index = session.current_question
     
-    # Добавляем интересный факт
-    if fun_fact:
-        result_text += f"\n\n📚 **Интересный факт:**\n{fun_fact}"
+    # Подтверждаем получение callback
+    await query.answer()
     
-    # Добавляем текущий счет
-    result_text += f"\n\n📊 **Ваш счет:** {context.user_data['score']}/{current_question_index + 1}"
+    # Текст результата с интересным фактом собран заранее, добавляем только счет
+    result_text = (
+        f"{question.result_text(is_correct)}"
+        f"\n\n📊 **Ваш счет:** {session.score}/{next_question_index}"
+        f"\n⏱ **Время ответа:** {elapsed:.1f} с"
+    )
     
     # Редактируем сообщение с вопросом, показывая результат
     await query.edit_message_text(
@@ -315,34 +596,64 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         parse_mode='Markdown'
     )
     
-    # Увеличиваем номер текущего вопроса
-    next_question_index = current_question_index + 1
-    context.user_data['current_question'] = next_question_index
+    # Следующий шаг отправляем через ANSWER_DELAY секунд из JobQueue,
+    # чтобы обработчик не держал корутину во время паузы
+    schedule_next_step(context.job_queue, query.from_user.id, session)
+
+def schedule_next_step(job_queue, user_id: int, session: QuizSession) -> None:
+    """Планирует отправку следующего вопроса или итогов викторины"""
+    job_queue.run_once(
+        send_next_step,
+        when=ANSWER_DELAY,
+        chat_id=session.chat_id,
+        user_id=user_id,
+        name=next_step_job_name(user_id),
+        data={"session_id": session.session_id, "question_index": session.current_question},
+        # По умолчанию APScheduler пропускает задачу, опоздавшую больше чем на
+        # секунду, и под нагрузкой игрок остался бы без следующего вопроса
+        job_kwargs={"misfire_grace_time": None}
+    )
+
+@instrument_handler
+async def send_next_step(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отправляет следующий вопрос или итоги викторины (задача JobQueue)"""
+    job = context.job
+    session_id = job.data["session_id"]
+    next_question_index = job.data["question_index"]
     
-    # Ждем 2 секунды перед следующим действием
-    import asyncio
-    await asyncio.sleep(2)
+    # Пользователь мог начать новую викторину, пока задача ждала
+    session = context.user_data
+    if (session.session_id != session_id or not session.pending_step
+            or session.current_question != next_question_index):
+        return
     
     # Проверяем, есть ли еще вопросы
-    if next_question_index < len(QUESTIONS):
+    if next_question_index < len(session.question_ids):
         # Отправляем следующий вопрос
-        await send_next_question(update, context, next_question_index)
+        await send_question(context, job.chat_id, job.user_id, next_question_index)
     else:
         # Викторина окончена
-        await show_final_results(update, context)
+        await show_final_results(context, job.chat_id, job.user_id, session.username)
+    # Задача выполняется вне очереди обновлений пользователя: пока шла отправка,
+    # он мог начать новую викторину, и её сессию трогать нельзя
+    if session.session_id != session_id:
+        return
+    session.step_sent()
 
-async def show_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def show_final_results(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, username: str) -> None:
     """Показывает финальные результаты викторины и обновляет таблицу лидеров"""
-    score = context.user_data.get('score', 0)
-    total_questions = len(QUESTIONS)
-    user = update.callback_query.from_user
+    score = context.user_data.score
+    total_questions = len(context.user_data.question_ids)
+    answer_time = context.user_data.answer_time
     
     # Обновляем таблицу лидеров
     update_leaderboard(
-        user_id=user.id,
-        username=user.first_name or user.username or f"Игрок_{user.id}",
+        user_id=user_id,
+        username=username,
         score=score,
-        total_questions=total_questions
+        total_questions=total_questions,
+        chat_id=chat_id,
+        answer_time=answer_time
     )
     
     # Определяем оценку
@@ -364,41 +675,226 @@ async def show_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
         rating = "🎞️ **ВРЕМЯ ПЕРЕСМОТРЕТЬ КЛАССИКУ!** 🍿"
         emoji = "🍿"
     
-    # Получаем время следующего сброса
-    next_reset = get_next_reset_time()
-    
-    # Формируем сообщение с результатами
+    # Формируем сообщение с результатами (постоянная часть собрана заранее)
     results_text = (
         f"🏁 **ВИКТОРИНА ЗАВЕРШЕНА!**\n\n"
         f"{emoji} {rating}\n\n"
         f"📊 **Ваш результат:** *{score} из {total_questions}*\n"
-        f"📈 **Процент правильных ответов:** *{percentage:.0f}%*\n\n"
-        f"🏆 **Ваш результат сохранен в таблице лидеров!**\n"
-        f"Таблица обнуляется: {next_reset.strftime('%d.%m.%Y в %H:%M')}\n\n"
-        f"📊 Ваша статистика: /mystats\n"
-        f"🏆 Текущий рейтинг: /top\n"
-        f"⏰ Следующий сброс: /nextreset\n\n"
-        f"🔄 Хотите улучшить результат? /quiz"
+        f"📈 **Процент правильных ответов:** *{percentage:.0f}%*\n"
+        f"⏱ **Время ответов:** *{answer_time:.1f} с* (в среднем {answer_time / total_questions:.1f} с на вопрос)\n\n"
+        + reset_templates["results_footer"]
     )
     
     await context.bot.send_message(
-        chat_id=update.callback_query.message.chat_id,
+        chat_id=chat_id,
         text=results_text,
+        parse_mode='Markdown',
+        rate_limit_args=PRIORITY_QUIZ
+    )
+    
+    logger.info(f"Пользователь {user_id} завершил викторину с результатом {score}/{total_questions}")
+
+# Идущие групповые раунды: chat_id -> GroupRound
+group_rounds = {}
+# Нажатия в групповых раундах по исходу и правки счётчика ответов
+group_round_stats = Counter()
+
+GROUP_ANSWER_REPLIES = {
+    "accepted": "✅ Ответ принят! Правильный ответ — после окончания времени",
+    "duplicate": "Вы уже ответили на этот вопрос",
+    "closed": "⌛ Приём ответов на этот вопрос закрыт",
+}
+
+def group_deadline_key(chat_id: int):
+    """Ключ дедлайна группового раунда в колесе таймеров (ключи игроков — числа)"""
+    return ("group", chat_id)
+
+def render_group_question(round_: GroupRound) -> str:
+    """Текст вопроса раунда со счётчиком ответивших"""
+    question = question_bank.get(round_.question_id)
+    return (
+        QUESTION_HEADERS[round_.current_question] + question.body
+        + f"\n\n👥 Ответили: {len(round_.answers)} · ⏳ {round_.timeout} с на ответ"
+    )
+
+# Обработчик команды /groupquiz
+@instrument_handler
+async def group_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Начинает групповой раунд викторины в чате"""
+    chat_id = update.effective_chat.id
+    if not is_group_chat(chat_id):
+        await update.message.reply_text(
+            "👥 Групповой раунд проводится в групповых чатах. Для одиночной игры используйте /quiz"
+        )
+        return
+    if chat_id in group_rounds:
+        await update.message.reply_text("⏳ В этом чате уже идёт раунд — отвечайте на текущий вопрос!")
+        return
+    
+    # Запоминаем чат для рассылок
+    leaderboard_storage.register_chat(chat_id)
+    
+    round_ = GroupRound(chat_id, random.sample(range(len(question_bank)), QUIZ_LENGTH), GROUP_QUESTION_TIMEOUT)
+    group_rounds[chat_id] = round_
+    await update.message.reply_text(
+        f"🎬 **Групповой раунд!**\n\n"
+        f"Вопросов: {QUIZ_LENGTH}, на каждый — {plural(GROUP_QUESTION_TIMEOUT, 'секунда', 'секунды', 'секунд')}.\n"
+        f"Отвечать может каждый участник чата, правильный ответ — после окончания времени.\n"
+        f"Итоги раунда попадут в таблицу лидеров чата (/top).",
         parse_mode='Markdown'
     )
+    await send_group_question(context.application, round_)
+    logger.info(f"В чате {chat_id} начат групповой раунд")
+
+async def send_group_question(application: Application, round_: GroupRound) -> None:
+    """Отправляет текущий вопрос раунда и ставит дедлайн ответа"""
+    question = question_bank.get(round_.question_id)
+    reply_markup = question.group_reply_markup
+    try:
+        message = await application.bot.send_message(
+            chat_id=round_.chat_id,
+            text=render_group_question(round_),
+            reply_markup=reply_markup,
+            rate_limit_args=PRIORITY_QUIZ
+        )
+    except Exception as e:
+        logger.error(f"Не удалось отправить вопрос раунда в чат {round_.chat_id}, раунд прерван: {e}")
+        group_rounds.pop(round_.chat_id, None)
+        return
+    round_.open_question(message.message_id, len(question.options))
+    # Нажатия только отмечают счётчик устаревшим, правка уходит не чаще раза в интервал
+    round_.editor = CoalescedEdit(
+        lambda: application.bot.edit_message_text(
+            chat_id=round_.chat_id,
+            message_id=round_.message_id,
+            text=render_group_question(round_),
+            reply_markup=reply_markup,
+            rate_limit_args=PRIORITY_QUIZ
+        ),
+        GROUP_EDIT_INTERVAL
+    )
+    question_deadlines.schedule(
+        group_deadline_key(round_.chat_id), round_.timeout, (round_.round_id, round_.current_question)
+    )
+
+# Обработчик нажатий на кнопки группового раунда
+@instrument_handler
+async def handle_group_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Учитывает ответ участника группового раунда (без правки сообщения на каждое нажатие)"""
+    query = update.callback_query
+    answer = decode_answer(query.data, GROUP_ANSWER_PREFIX)
+    round_ = group_rounds.get(update.effective_chat.id) if update.effective_chat else None
+    # Кнопки одинаковы для всех раундов: нажатие относится к раунду, только если пришло с его вопроса
+    message_id = query.message.message_id if query.message else None
+    if answer is None or round_ is None or message_id != round_.message_id or round_.finished:
+        status = "closed"
+    else:
+        question_id, option = answer
+        user = query.from_user
+        correct_option = question_bank.get(round_.question_id).correct_option
+        status = round_.accept(
+            user.id,
+            user.first_name or user.username or f"Игрок_{user.id}",
+            question_id,
+            option,
+            correct_option
+        )
+        if status == "accepted":
+            question_stats.record_answer(question_id, option, option == correct_option)
+            round_.editor.request()
+    group_round_stats[status] += 1
+    await query.answer(GROUP_ANSWER_REPLIES[status])
+
+async def close_group_question(application: Application, chat_id: int, round_id: int, question_index: int) -> None:
+    """Время на вопрос раунда вышло: показывает ответ и статистику, затем следующий вопрос"""
+    round_ = group_rounds.get(chat_id)
+    if (round_ is None or round_.round_id != round_id
+            or round_.current_question != question_index or not round_.accepting):
+        return
+    # Участники раунда, не ответившие вовремя, идут в статистику вопроса как пропуски
+    question_stats.record_timeout(round_.question_id, round_.close_question())
+    await round_.editor.close()
+    group_round_stats["edit_requests"] += round_.editor.requests
+    group_round_stats["edits"] += round_.editor.edits
     
-    logger.info(f"Пользователь {user.id} завершил викторину с результатом {score}/{total_questions}")
+    # Вместо кнопок — правильный ответ и распределение ответов
+    question = question_bank.get(round_.question_id)
+    counts = round_.option_counts
+    lines = [
+        QUESTION_HEADERS[round_.current_question] + question.body,
+        "",
+        f"✅ Правильный ответ: {question.options[question.correct_option]}",
+        f"👥 Ответили: {len(round_.answers)}, верно: {counts[question.correct_option]}",
+        "",
+    ]
+    for i, text in enumerate(question.button_texts):
+        lines.append(f"{'✅' if i == question.correct_option else '▫️'} {text} — {counts[i]}")
+    try:
+        await application.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=round_.message_id,
+            text="\n".join(lines),
+            rate_limit_args=PRIORITY_QUIZ
+        )
+    except Exception as e:
+        logger.error(f"Не удалось показать ответ на вопрос раунда в чате {chat_id}: {e}")
+    
+    round_.next_question()
+    if round_.finished:
+        await finish_group_round(application, round_)
+        return
+    await asyncio.sleep(ANSWER_DELAY)
+    if group_rounds.get(chat_id) is round_:
+        await send_group_question(application, round_)
+
+async def finish_group_round(application: Application, round_: GroupRound) -> None:
+    """Подводит итоги раунда и записывает результаты участников в таблицу лидеров чата.
+
+    В общую таблицу и число сыгранных игр раунд не идёт: там учитываются
+    только личные викторины /quiz.
+    """
+    group_rounds.pop(round_.chat_id, None)
+    standings = round_.standings()
+    total_questions = len(round_.question_ids)
+    for user_id, username, score, answer_time in standings:
+        update_chat_leaderboard(round_.chat_id, str(user_id), username, score, total_questions, answer_time)
+    
+    if not standings:
+        text = "🏁 Групповой раунд окончен — на этот раз никто не ответил.\n\n🔄 Сыграть ещё: /groupquiz"
+    else:
+        lines = ["🏁 ИТОГИ ГРУППОВОГО РАУНДА", ""]
+        for i, (user_id, username, score, answer_time) in enumerate(standings[:GROUP_RESULTS_TOP]):
+            place = MEDALS[i] if i < len(MEDALS) else f"{i + 1}."
+            lines.append(f"{place} {username} — {score}/{total_questions} ⏱ {answer_time:.1f} с")
+        lines.extend([
+            "",
+            f"👥 Участников: {len(standings)}",
+            "🏆 Результаты учтены в таблице лидеров чата: /top",
+            "🔄 Сыграть ещё: /groupquiz",
+        ])
+        text = "\n".join(lines)
+    try:
+        await application.bot.send_message(chat_id=round_.chat_id, text=text, rate_limit_args=PRIORITY_QUIZ)
+    except Exception as e:
+        logger.error(f"Не удалось отправить итоги раунда в чат {round_.chat_id}: {e}")
+    logger.info(f"Групповой раунд в чате {round_.chat_id} окончен: {len(standings)} участников")
 
 # Обработчик команды /top
+@instrument_handler
 async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Показывает таблицу лидеров"""
-    leaderboard = load_leaderboard()
-    message = format_leaderboard_message(leaderboard, top_n=10)
+    """Показывает таблицу лидеров (в групповом чате — таблицу этого чата)"""
+    chat_id = update.effective_chat.id
+    if is_group_chat(chat_id):
+        # Своя таблица чата: стоимость зависит только от числа его игроков
+        message = format_leaderboard_message(chat_leaderboards.get(chat_id), title="ТАБЛИЦА ЛИДЕРОВ ЧАТА")
+        message += "\n\n🌍 Общий рейтинг всех игроков — /top в личном чате с ботом"
+    else:
+        message = leaderboard_message_cache.get(leaderboard_storage)
     
     # Добавляем информацию о следующем сбросе
-    next_reset = get_next_reset_time()
-    time_until_reset = next_reset - datetime.now()
-    days_until_reset = time_until_reset.days
+    now = datetime.now()
+    reset_templates.get(now)
+    days_until_reset = (reset_templates.next_reset - now).days
     
     reset_info = f"\n\n🔄 **Следующий сброс таблицы:** через {days_until_reset} дней в 20:00"
     message += reset_info
@@ -409,44 +905,16 @@ async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     )
 
 # Обработчик команды /nextreset
+@instrument_handler
 async def nextreset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает время следующего сброса таблицы лидеров"""
-    next_reset = get_next_reset_time()
-    time_until_reset = next_reset - datetime.now()
-    
-    # Преобразуем разницу во времени в читаемый формат
-    days = time_until_reset.days
-    hours = time_until_reset.seconds // 3600
-    minutes = (time_until_reset.seconds % 3600) // 60
-    
-    # Формируем читаемое время до сброса
-    time_parts = []
-    if days > 0:
-        time_parts.append(f"{days} {'день' if days == 1 else 'дня' if 2 <= days <= 4 else 'дней'}")
-    if hours > 0:
-        time_parts.append(f"{hours} {'час' if hours == 1 else 'часа' if 2 <= hours <= 4 else 'часов'}")
-    if minutes > 0:
-        time_parts.append(f"{minutes} {'минуту' if minutes == 1 else 'минуты' if 2 <= minutes <= 4 else 'минут'}")
-    
-    time_until_str = ", ".join(time_parts)
-    
-    # Загружаем текущую таблицу лидеров для статистики
-    leaderboard = load_leaderboard()
-    total_players = len(leaderboard)
+    now = datetime.now()
+    template = reset_templates.get(now)["nextreset"]
     
-    # Формируем сообщение
-    message = (
-        f"⏰ **СЛЕДУЮЩИЙ СБРОС ТАБЛИЦЫ ЛИДЕРОВ**\n\n"
-        f"📅 Дата: {next_reset.strftime('%d.%m.%Y')}\n"
-        f"🕐 Время: {next_reset.strftime('%H:%M')}\n"
-        f"⏳ До сброса: {time_until_str}\n\n"
-        f"📊 **Текущая статистика:**\n"
-        f"• Активных игроков: {total_players}\n"
-        f"• Всего вопросов: {len(QUESTIONS)}\n"
-        f"• Частота сброса: раз в неделю (воскресенье)\n\n"
-        f"🏆 Успейте улучшить свой результат!\n"
-        f"🎮 Сыграть: /quiz\n"
-        f"📊 Текущий рейтинг: /top"
+    # В готовый текст подставляем только обратный отсчёт и число игроков
+    message = template.format(
+        countdown=format_countdown(reset_templates.next_reset - now),
+        players=leaderboard_storage.count()
     )
     
     await update.message.reply_text(
@@ -454,41 +922,40 @@ async def nextreset_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='Markdown'
     )
 
+def chat_rank_line(chat_id, user_id_str):
+    """Строка /mystats с местом игрока в таблице группового чата"""
+    if not is_group_chat(chat_id):
+        return ""
+    chat_leaderboard = chat_leaderboards.get(chat_id)
+    position = chat_leaderboard.rank(user_id_str)
+    if position is None:
+        return "👥 **Место в чате:** ещё не играли здесь\n"
+    return f"👥 **Место в чате:** {position} из {chat_leaderboard.count()}\n"
+
 # Обработчик команды /mystats
+@instrument_handler
 async def mystats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает статистику текущего пользователя"""
     user = update.effective_user
-    leaderboard = load_leaderboard()
     user_id_str = str(user.id)
+    data = leaderboard_storage.get(user_id_str)
     
-    if user_id_str in leaderboard:
-        data = leaderboard[user_id_str]
-        
+    if data is not None:
         # Находим место пользователя в рейтинге
-        sorted_players = sorted(
-            leaderboard.items(),
-            key=lambda x: (x[1]["score"], x[1]["percentage"]),
-            reverse=True
-        )
-        
-        position = next(
-            (i + 1 for i, (uid, _) in enumerate(sorted_players) if uid == user_id_str),
-            None
-        )
+        position = leaderboard_storage.rank(user_id_str)
         
         # Преобразуем дату последней игры
         last_played = datetime.fromisoformat(data["last_played"])
         last_played_str = last_played.strftime("%d.%m.%Y %H:%M")
         
-        # Получаем время следующего сброса
-        next_reset = get_next_reset_time()
-        
         stats_text = (
             f"📊 **ВАША СТАТИСТИКА**\n\n"
             f"👤 **Игрок:** {data['username']}\n"
             f"🏆 **Лучший результат:** {data['score']}/{data['total_questions']}\n"
             f"📈 **Процент правильных:** {data['percentage']:.1f}%\n"
             f"🥇 **Место в рейтинге:** {position}\n"
+            + chat_rank_line(update.effective_chat.id, user_id_str)
+            + (f"⏱ **Время лучшей игры:** {data['best_time']:.1f} с\n" if "best_time" in data else "") +
             f"🎮 **Сыграно игр:** {data.get('games_played', 1)}\n"
             f"🕐 **Последняя игра:** {last_played_str}\n\n"
         )
@@ -503,112 +970,384 @@ async def mystats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         else:
             stats_text += "📚 Есть куда расти! Пробуйте снова!"
             
-        stats_text += f"\n\n🔄 **Следующий сброс рейтинга:**\n{next_reset.strftime('%d.%m.%Y в %H:%M')}"
-        stats_text += "\n\n🎮 Сыграть еще раз: /quiz"
+        stats_text += reset_templates["mystats_footer"]
         
     else:
-        # Получаем время следующего сброса для новых пользователей
-        next_reset = get_next_reset_time()
-        
-        stats_text = (
-            "📊 **У вас еще нет статистики!**\n\n"
-            "Вы еще не играли в викторину.\n"
-            "🎮 Используйте команду /quiz, чтобы начать игру и "
-            "появиться в таблице лидеров!\n\n"
-            f"🔄 **Следующий сброс рейтинга:**\n{next_reset.strftime('%d.%m.%Y в %H:%M')}"
-        )
+        stats_text = reset_templates["mystats_empty"]
     
     await update.message.reply_text(
         text=stats_text,
         parse_mode='Markdown'
     )
 
+# Обработчик команды /history
+@instrument_handler
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает победителей прошедших недель и результаты пользователя по неделям"""
+    history = leaderboard_storage.history
+    weeks = history.winners(HISTORY_WEEKS, len(MEDALS)) if history is not None else []
+    if not weeks:
+        await update.message.reply_text(
+            "📜 История пока пуста: ещё не прошло ни одной игровой недели.\n\n"
+            "🏆 Текущая таблица лидеров: /top"
+        )
+        return
+    
+    lines = ["📜 **ИСТОРИЯ НЕДЕЛЬ**\n"]
+    for week, players, winners in weeks:
+        lines.append(f"🗓 **Неделя до {week_date(week)}** ({players} игроков):")
+        for medal, (user_id, data) in zip(MEDALS, winners):
+            username = escape_markdown(data["username"])
+            lines.append(f"{medal} {username} - {data['score']}/{data['total_questions']}")
+        lines.append("")
+    
+    # Лучший результат и результаты пользователя по неделям
+    user_id_str = str(update.effective_user.id)
+    best = history.player_best(user_id_str)
+    if best is not None:
+        week, data, rank, players = best
+        lines.append("👤 **Ваши результаты:**")
+        lines.append(
+            f"🏆 Лучший: {data['score']}/{data['total_questions']} ({data['percentage']:.1f}%), "
+            f"неделя до {week_date(week)}, {rank} место из {players}"
+        )
+        trend = [
+            f"{week_date(week)[:5]}: {data['score']}/{data['total_questions']} ({rank} место)"
+            for week, data, rank, players in history.player_weeks(user_id_str, HISTORY_TREND_WEEKS)
+        ]
+        lines.append("📈 По неделям: " + ", ".join(trend))
+    else:
+        lines.append("👤 Вас пока нет в истории. Сыграйте /quiz до конца недели!")
+    
+    await update.message.reply_text(
+        text="\n".join(lines),
+        parse_mode='Markdown'
+    )
+
+def question_line(question_id: int, rate: float, shown: int) -> str:
+    """Строка вопроса в /qstats: номер, доля верных, показы и начало текста"""
+    body = question_bank.get(question_id).body
+    if len(body) > 60:
+        body = body[:59] + "…"
+    return f"№{question_id + 1}: {rate:.0%} верных из {shown} — {body}"
+
+# Обработчик команды /qstats
+@instrument_handler
+async def qstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Статистика ответов по вопросам (для администраторов): сводка или один вопрос"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Команда доступна только администраторам бота")
+        return
+    
+    # /qstats <номер> — один вопрос, счётчики читаются за O(1)
+    if context.args:
+        try:
+            question_id = int(context.args[0]) - 1
+        except ValueError:
+            question_id = -1
+        if not 0 <= question_id < len(question_bank):
+            await update.message.reply_text(f"Укажите номер вопроса от 1 до {len(question_bank)}: /qstats 42")
+            return
+        question = question_bank.get(question_id)
+        stats = question_stats.question(question_id, len(question.options))
+        shown = stats["answers"] + stats["timeouts"]
+        lines = [
+            f"📊 ВОПРОС №{question_id + 1}",
+            "",
+            question.body,
+            "",
+            f"👁 Показов: {shown}, ответов: {stats['answers']}, без ответа вовремя: {stats['timeouts']}",
+        ]
+        if shown:
+            lines.append(f"✅ Верных: {stats['correct']} ({stats['correct'] / shown:.0%})")
+        lines.append("")
+        for i, (text, picks) in enumerate(zip(question.button_texts, stats["picks"])):
+            share = f" ({picks / stats['answers']:.0%})" if stats["answers"] else ""
+            lines.append(f"{'✅' if i == question.correct_option else '▫️'} {text} — {picks}{share}")
+        await update.message.reply_text("\n".join(lines))
+        return
+    
+    # Сводка по банку считается один раз между записями статистики
+    summary = question_stats.summary(QSTATS_TOP, QSTATS_MIN_SHOWN)
+    shown = summary["answers"] + summary["timeouts"]
+    lines = [
+        "📊 СТАТИСТИКА ВОПРОСОВ",
+        "",
+        f"📚 Вопросов в банке: {summary['questions']}, с ответами: {summary['answered']}",
+        f"👁 Показов: {shown}, ответов: {summary['answers']}, без ответа вовремя: {summary['timeouts']}",
+    ]
+    if shown:
+        lines.append(f"✅ Верных: {summary['correct']} ({summary['correct'] / shown:.0%})")
+    if summary["rated"]:
+        lines.extend(["", f"🧠 Самые трудные (от {QSTATS_MIN_SHOWN} показов):"])
+        lines.extend(question_line(*item) for item in summary["hardest"])
+        lines.extend(["", "🍀 Самые лёгкие:"])
+        lines.extend(question_line(*item) for item in summary["easiest"])
+    else:
+        lines.extend(["", f"Пока ни один вопрос не набрал {QSTATS_MIN_SHOWN} показов."])
+    lines.extend(["", "🔎 Подробно о вопросе: /qstats <номер>"])
+    await update.message.reply_text("\n".join(lines))
+
 # Обработчик команды /help
+@instrument_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправляет справку по командам"""
-    # Получаем время следующего сброса
-    next_reset = get_next_reset_time()
-    
-    help_text = (
-        "📖 **КОМАНДЫ БОТА-ВИКТОРИНЫ**\n\n"
-        "🎮 **Игра:**\n"
-        "• /quiz - Начать новую викторину (10 вопросов)\n\n"
-        "🏆 **Рейтинг и статистика:**\n"
-        "• /top - Показать таблицу лидеров\n"
-        "• /mystats - Ваша персональная статистика\n"
-        "• /nextreset - Время следующего сброса рейтинга\n\n"
-        "ℹ️ **Информация:**\n"
-        "• /start - Главное меню\n"
-        "• /help - Эта справка\n\n"
-        "🔄 **Система рейтинга:**\n"
-        "• Таблица лидеров обновляется еженедельно\n"
-        "• Следующий сброс: " + next_reset.strftime("%d.%m.%Y в %H:%M") + "\n"
-        "• Сохраняются только лучшие результаты\n\n"
-        "🎯 **Как играть:**\n"
-        "1. Используйте /quiz для начала\n"
-        "2. Отвечайте на вопросы, выбирая варианты\n"
-        "3. Узнавайте интересные факты о кино\n"
-        "4. Соревнуйтесь с другими игроками!\n\n"
-        "🎬 **Удачи в викторине о кино!**"
-    )
-    await update.message.reply_text(help_text)
+    await update.message.reply_text(reset_templates["help"])
 
-def main() -> None:
-    """Запуск бота"""
-    # Создаем приложение
-    application = Application.builder().token(TOKEN).build()
+async def resume_broadcast(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Продолжает рассылку, прерванную остановкой бота"""
+    try:
+        await broadcaster.resume(context.bot)
+    except Exception as e:
+        logger.error(f"Не удалось продолжить рассылку: {e}")
+
+def is_primary(application: Application) -> bool:
+    """Главный процесс: единственный или воркер 0 (сброс и рассылки только здесь)"""
+    shard = application.bot_data.get("shard")
+    return shard is None or shard[0] == 0
+
+async def post_init(application: Application) -> None:
+    """Открывает хранилище таблицы лидеров один раз при запуске"""
+    leaderboard_storage.load()
+    question_stats.load()
+    if STORAGE_BACKEND == "json" and not os.path.exists(LEADERBOARD_FILE):
+        logger.info("Создаю новую таблицу лидеров...")
+        leaderboard_storage.mark_dirty()
+    if METRICS_PORT:
+        shard = application.bot_data.get("shard")
+        port = METRICS_PORT + (shard[0] if shard else 0)
+        try:
+            application.bot_data["metrics_server"] = await MetricsServer(METRICS_HOST, port).start()
+        except OSError as e:
+            logger.error(f"Не удалось открыть порт метрик {port}: {e}")
+    if is_primary(application) and broadcaster.pending() is not None:
+        application.job_queue.run_once(resume_broadcast, when=0, name="resume_broadcast")
+    
+    # Продолжаем викторины, прерванные перезапуском между ответом и следующим вопросом,
+    # и возвращаем дедлайны вопросам, которые ждали ответа (с оставшимся временем)
+    question_deadlines.on_expire = lambda batch: expire_deadlines(application, batch)
+    question_deadlines.start()
+    resumed = 0
+    for user_id, session in application.user_data.items():
+        if session.pending_step:
+            schedule_next_step(application.job_queue, user_id, session)
+            resumed += 1
+        elif QUESTION_TIMEOUT and session.awaiting_answer:
+            arm_question_deadline(user_id, session, max(0.0, QUESTION_TIMEOUT - session.elapsed()))
+    if resumed:
+        logger.info(f"Продолжено прерванных викторин: {resumed}")
+    if question_deadlines:
+        logger.info(f"Восстановлено дедлайнов вопросов: {len(question_deadlines)}")
+
+async def evict_chat_leaderboards(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выгружает из памяти таблицы чатов без активности (задача JobQueue)"""
+    evicted = await chat_leaderboards.evict_idle()
+    if evicted:
+        logger.info(f"Выгружено неактивных таблиц чатов: {evicted}")
+
+async def flush_question_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Записывает накопленную статистику ответов по вопросам (задача JobQueue)"""
+    await question_stats.flush()
+
+async def evict_sessions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Удаляет сессии пользователей, давно не игравших (задача JobQueue)"""
+    evicted = evict_idle_sessions(context.application, SESSION_TTL)
+    if evicted:
+        logger.info(f"Удалено устаревших сессий викторины: {evicted}")
+
+def collect_runtime_metrics(application: Application) -> list:
+    """Метрики ограничителя запросов, кэшей и сессий на момент запроса"""
+    limiter = application.bot.rate_limiter.stats()
+    return [
+        ("rate_limiter_queue_depth", "gauge", "Запросов в очереди ограничителя",
+         {(): limiter["queue_depth"]}),
+        ("rate_limiter_requests_total", "counter", "Запросов через ограничитель",
+         {(): limiter["requests_total"]}),
+        ("rate_limiter_retries_total", "counter", "Повторов после 429",
+         {(): limiter["retries_total"]}),
+        ("rate_limiter_wait_seconds_total", "counter", "Суммарное ожидание в ограничителе",
+         {(("priority", priority),): seconds for priority, seconds in limiter["wait_time_total"].items()}),
+        ("quiz_sessions", "gauge", "Сессий викторины в памяти",
+         {(): len(application.user_data)}),
+        ("chat_leaderboards_loaded", "gauge", "Таблиц чатов в памяти",
+         {(): len(chat_leaderboards)}),
+        ("chat_leaderboards_total", "counter", "Загрузки и выгрузки таблиц чатов",
+         {(("event", "load"),): chat_leaderboards.loads, (("event", "eviction"),): chat_leaderboards.evictions}),
+        ("top_cache_total", "counter", "Обращения к кэшу /top",
+         {(("result", name),): value for name, value in leaderboard_message_cache.stats().items()}),
+        ("question_deadlines", "gauge", "Вопросов с дедлайном ответа",
+         {(): len(question_deadlines)}),
+        ("question_deadlines_total", "counter", "Дедлайны ответов по исходу",
+         {(("event", name),): value for name, value in question_deadlines.stats().items()}),
+        ("group_rounds", "gauge", "Идущих групповых раундов",
+         {(): len(group_rounds)}),
+        ("group_round_events_total", "counter", "Нажатия и правки сообщений групповых раундов",
+         {(("event", name),): value for name, value in group_round_stats.items()}),
+        ("question_stats_flushes_total", "counter", "Записей статистики вопросов в базу",
+         {(): question_stats.flushes}),
+        ("answer_clicks_total", "counter", "Нажатия кнопок ответа",
+         {(("result", name),): value for name, value in answer_validator.stats().items()}),
+    ]
+
+async def post_shutdown(application: Application) -> None:
+    """Гарантированно сохраняет таблицу лидеров при остановке бота"""
+    metrics_server = application.bot_data.get("metrics_server")
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await question_deadlines.stop()
+    await leaderboard_storage.close()
+    await chat_leaderboards.close()
+    await question_stats.close()
+    logger.info("Таблица лидеров сохранена перед остановкой")
+    logger.info(f"Кэш /top: {leaderboard_message_cache.stats()}")
+    logger.info(f"Нажатия кнопок ответа: {answer_validator.stats()}")
+
+def build_application(token: str = TOKEN, base_url: str = BOT_API_BASE_URL, rate_limiter=None, shard=None,
+                      request=None) -> Application:
+    """Создает приложение и регистрирует обработчики и задачи.
+    
+    shard=(номер, всего) — приложение воркера: обновления приходят от
+    супервизора, а общий лимит Bot API делится между воркерами.
+    request — свой транспорт Bot API вместо HTTP (нагрузочные тесты без сети).
+    """
+    if rate_limiter is None:
+        workers = shard[1] if shard else 1
+        rate_limiter = PriorityRateLimiter(
+            global_rate=GLOBAL_RATE / workers,
+            global_burst=max(1, GLOBAL_BURST // workers)
+        )
+    
+    # Исходящие запросы идут через ограничитель с приоритетами
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .rate_limiter(rate_limiter)
+        .request(request or InstrumentedRequest(connection_pool_size=256))
+        .context_types(ContextTypes(user_data=QuizSession))
+        .persistence(SessionPersistence(
+            SESSION_DB_FILE, ttl=SESSION_TTL, update_interval=SESSION_FLUSH_INTERVAL, shard=shard
+        ))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    if request is not None:
+        builder = builder.get_updates_request(request)
+    if shard:
+        # Обновления воркеру раздаёт супервизор
+        builder = builder.updater(None)
+    application = builder.build()
+    application.bot_data["shard"] = shard
+    registry.set_collector("runtime", lambda: collect_runtime_metrics(application))
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("quiz", quiz))
+    application.add_handler(CommandHandler("groupquiz", group_quiz_command))
     application.add_handler(CommandHandler("top", top_command))
     application.add_handler(CommandHandler("mystats", mystats_command))
     application.add_handler(CommandHandler("nextreset", nextreset_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("qstats", qstats_command))
     application.add_handler(CommandHandler("help", help_command))
     
     # Регистрируем обработчик callback-запросов (нажатий на кнопки)
+    application.add_handler(CallbackQueryHandler(handle_group_answer, pattern=f"^{GROUP_ANSWER_PREFIX}:"))
     application.add_handler(CallbackQueryHandler(handle_answer))
     
-    # Проверяем наличие файла таблицы лидеров
-    if not os.path.exists(LEADERBOARD_FILE):
-        logger.info("Создаю новую таблицу лидеров...")
-        save_leaderboard({})
-    
-    # Настройка еженедельного сброса таблицы лидеров
-    # ВАЖНО: Для работы уведомлений о сбросе укажите chat_id вашего чата
-    # Замените None на ID чата, куда бот будет отправлять уведомления
-    NOTIFICATION_CHAT_ID = None  # Пример: 123456789
-    
     # Планируем еженедельный сброс таблицы лидеров (по воскресеньям в 20:00)
-    if NOTIFICATION_CHAT_ID:
+    if is_primary(application):
         application.job_queue.run_daily(
             callback=reset_leaderboard,
             time=LEADERBOARD_RESET_TIME,
             days=(LEADERBOARD_RESET_DAY,),  # Воскресенье
-            chat_id=NOTIFICATION_CHAT_ID,
             name="weekly_leaderboard_reset"
         )
         logger.info(f"Запланирован еженедельный сброс таблицы лидеров на воскресенье в {LEADERBOARD_RESET_TIME.strftime('%H:%M')}")
-        logger.info(f"Уведомления о сбросе будут отправляться в чат: {NOTIFICATION_CHAT_ID}")
-    else:
-        logger.warning("NOTIFICATION_CHAT_ID не указан. Уведомления о сбросе таблицы лидеров отключены.")
-        logger.info("Чтобы включить уведомления, замените NOTIFICATION_CHAT_ID = None на ID вашего чата")
+        logger.info("Уведомления о сбросе будут разосланы во все чаты, где играли")
+    
+    # Периодически освобождаем память от сессий давно не игравших пользователей
+    application.job_queue.run_repeating(
+        evict_sessions,
+        interval=SESSION_EVICT_INTERVAL,
+        first=SESSION_EVICT_INTERVAL,
+        name="evict_idle_sessions"
+    )
+    application.job_queue.run_repeating(
+        evict_chat_leaderboards,
+        interval=CHAT_LEADERBOARD_EVICT_INTERVAL,
+        first=CHAT_LEADERBOARD_EVICT_INTERVAL,
+        name="evict_idle_chat_leaderboards"
+    )
+    application.job_queue.run_repeating(
+        flush_question_stats,
+        interval=QUESTION_STATS_FLUSH_INTERVAL,
+        first=QUESTION_STATS_FLUSH_INTERVAL,
+        name="flush_question_stats"
+    )
     
+    return application
+
+def run_workers() -> None:
+    """Запускает WORKERS воркеров и раздаёт им обновления из getUpdates"""
+    if STORAGE_BACKEND != "sqlite":
+        logger.error("WORKERS > 1 требует STORAGE_BACKEND = \"sqlite\": JSON-файл рассчитан на один процесс")
+        return
+    if BOT_MODE == "webhook":
+        logger.error("WORKERS > 1 пока работает только в режиме polling")
+        return
+    supervisor = Supervisor(WORKERS, run_worker)
+    supervisor.start()
+    if BOT_API_BASE_URL:
+        front_bot = Bot(TOKEN, base_url=f"{BOT_API_BASE_URL}/bot", base_file_url=f"{BOT_API_BASE_URL}/file/bot")
+    else:
+        front_bot = Bot(TOKEN)
+    try:
+        asyncio.run(poll_updates(front_bot, supervisor))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+
+def main() -> None:
+    """Запуск бота"""
     # Запускаем бота
     logger.info("Бот запущен...")
     print("=" * 50)
     print("🎬 Бот-викторина о кино успешно запущен!")
-    print(f"📚 Загружено вопросов: {len(QUESTIONS)}")
-    print(f"🏆 Таблица лидеров: {LEADERBOARD_FILE}")
+    print(f"📚 Загружено вопросов: {len(question_bank)}")
+    print(f"🏆 Таблица лидеров: {SQLITE_DB_FILE if STORAGE_BACKEND == 'sqlite' else LEADERBOARD_FILE}")
     print(f"🔄 Еженедельный сброс: Воскресенье в 20:00")
-    if NOTIFICATION_CHAT_ID:
-        print(f"🔔 Уведомления о сбросе: ВКЛЮЧЕНЫ (чат: {NOTIFICATION_CHAT_ID})")
-    else:
-        print(f"🔔 Уведомления о сбросе: ВЫКЛЮЧЕНЫ")
+    print(f"🔔 Уведомления о сбросе: рассылка во все чаты, где играли")
+    print(f"🌐 Режим получения обновлений: {BOT_MODE}")
+    print(f"⚙️ Воркеров: {WORKERS}")
     print("🤖 Ожидание команд...")
     print("=" * 50)
     
-    application.run_polling()
+    if WORKERS > 1:
+        run_workers()
+        return
+    
+    # Создаем приложение
+    application = build_application()
+    
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.error("BOT_MODE = \"webhook\", но WEBHOOK_URL не указан в config.py")
+            return
+        # Встроенный HTTP-сервер принимает обновления от Telegram
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, TelegramError
+
+from rate_limiter import PRIORITY_BULK
+from storage import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Ошибки BadRequest, после которых в чат писать бесполезно
+PERMANENT_BAD_REQUESTS = ("chat not found", "user not found", "peer_id_invalid", "have no rights to send")
+
+
+def classify_error(error):
+    """Возвращает True, если ошибка доставки окончательная (чат мёртв)"""
+    if isinstance(error, (Forbidden, ChatMigrated)):
+        return True
+    if isinstance(error, BadRequest):
+        message = error.message.lower()
+        return any(text in message for text in PERMANENT_BAD_REQUESTS)
+    return False
+
+
+class Broadcaster:
+    """Рассылка сообщения всем чатам из хранилища.
+
+    Получатели читаются из хранилища пачками по возрастанию chat_id, внутри
+    пачки сообщения уходят параллельно (не больше concurrency одновременно),
+    а частоту ограничивает rate limiter бота. После каждой пачки результаты
+    доставки сохраняются в хранилище, а прогресс — в файл контрольной точки,
+    поэтому после падения рассылка продолжается с места остановки.
+    """
+
+    def __init__(self, storage, checkpoint_path, concurrency=20, batch_size=500, max_failures=3):
+        self.storage = storage
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+        self._lock = None
+
+    def pending(self):
+        """Возвращает незавершённую рассылку из контрольной точки или None"""
+        try:
+            if not os.path.exists(self.checkpoint_path):
+                return None
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении контрольной точки рассылки: {e}")
+            return None
+        return None if state.get("done") else state
+
+    async def start(self, bot, text, parse_mode=None):
+        """Начинает новую рассылку и дожидается её окончания"""
+        state = {
+            "broadcast_id": uuid.uuid4().hex,
+            "text": text,
+            "parse_mode": parse_mode,
+            "started": datetime.now().isoformat(),
+            "last_chat_id": None,
+            "delivered": 0,
+            "failed": 0,
+            "pruned": 0,
+            "done": False,
+        }
+        await self._save(state)
+        return await self._run(bot, state)
+
+    async def resume(self, bot):
+        """Продолжает прерванную рассылку, если она есть"""
+        state = self.pending()
+        if state is None:
+            return None
+        logger.info(
+            f"Продолжаю рассылку {state['broadcast_id']} "
+            f"после чата {state['last_chat_id']} (доставлено: {state['delivered']})"
+        )
+        return await self._run(bot, state)
+
+    async def _run(self, bot, state):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Рассылки не пересекаются: следующая ждёт окончания текущей
+        async with self._lock:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            while True:
+                chat_ids = self.storage.chat_batch(state["last_chat_id"], self.batch_size)
+                if not chat_ids:
+                    break
+                results = await asyncio.gather(
+                    *(self._deliver(bot, semaphore, chat_id, state) for chat_id in chat_ids)
+                )
+                delivered = [chat_id for chat_id, failure in zip(chat_ids, results) if failure is None]
+                failed = [failure for failure in results if failure is not None]
+                pruned = self.storage.record_deliveries(delivered, failed, self.max_failures)
+                state["last_chat_id"] = chat_ids[-1]
+                state["delivered"] += len(delivered)
+                state["failed"] += len(failed)
+                state["pruned"] += len(pruned)
+                await self._save(state)
+            state["done"] = True
+            state["finished"] = datetime.now().isoformat()
+            await self._save(state)
+        logger.info(
+            f"Рассылка {state['broadcast_id']} завершена: доставлено {state['delivered']}, "
+            f"ошибок {state['failed']}, удалено чатов {state['pruned']}"
+        )
+        return state
+
+    async def _deliver(self, bot, semaphore, chat_id, state):
+        """Отправляет сообщение в один чат; возвращает None или (chat_id, ошибка, окончательная)"""
+        async with semaphore:
+            try:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=state["text"],
+                    parse_mode=state["parse_mode"],
+                    rate_limit_args=PRIORITY_BULK
+                )
+                return None
+            except TelegramError as e:
+                if isinstance(e, ChatMigrated):
+                    # Группа стала супергруппой: следующие рассылки пойдут по новому id
+                    self.storage.register_chat(e.new_chat_id)
+                return chat_id, str(e), classify_error(e)
+
+    async def _save(self, state):
+        payload = json.dumps(state, ensure_ascii=False)
+        await asyncio.to_thread(write_json_atomic, self.checkpoint_path, payload)
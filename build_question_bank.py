@@ -0,0 +1,115 @@
+"""Сборка внешнего банка вопросов: проверка схемы, JSONL и индекс смещений.
+
+Использование:
+    python3 build_question_bank.py [--input questions_source.jsonl] [--output questions.jsonl]
+
+Без --input берутся вопросы из quiz_data.QUESTIONS. Входной файл может
+быть JSONL (по вопросу в строке) или JSON-массивом.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from array import array
+
+from question_bank import INDEX_HEADER, INDEX_MAGIC, index_path_for
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+MAX_OPTIONS = 10
+MAX_BUTTON_TEXT = 60
+
+
+def validate_question(number, question_data):
+    """Проверяет схему вопроса, возвращает список ошибок"""
+    errors = []
+    if not isinstance(question_data, dict):
+        return [f"вопрос {number}: ожидается объект"]
+    question = question_data.get("question")
+    if not isinstance(question, str) or not question.strip():
+        errors.append(f"вопрос {number}: пустое поле question")
+    options = question_data.get("options")
+    if not isinstance(options, list) or not 2 <= len(options) <= MAX_OPTIONS:
+        errors.append(f"вопрос {number}: options должен быть списком из 2-{MAX_OPTIONS} вариантов")
+        options = []
+    for option in options:
+        if not isinstance(option, str) or not option.strip():
+            errors.append(f"вопрос {number}: пустой вариант ответа")
+        elif len(option) > MAX_BUTTON_TEXT:
+            errors.append(f"вопрос {number}: вариант длиннее {MAX_BUTTON_TEXT} символов")
+    correct_option = question_data.get("correct_option")
+    if not isinstance(correct_option, int) or not 0 <= correct_option < len(options):
+        errors.append(f"вопрос {number}: correct_option вне диапазона вариантов")
+    fun_fact = question_data.get("fun_fact", "")
+    if not isinstance(fun_fact, str):
+        errors.append(f"вопрос {number}: fun_fact должен быть строкой")
+    return errors
+
+
+def read_source(path):
+    """Читает вопросы из JSONL или JSON-массива; без пути — из quiz_data"""
+    if path is None:
+        from quiz_data import QUESTIONS
+        yield from QUESTIONS
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def build(source_path, output_path):
+    """Проверяет вопросы и записывает JSONL-файл с индексом смещений"""
+    offsets = array('Q', [0])
+    errors = []
+    tmp_output = output_path + ".tmp"
+    with open(tmp_output, 'wb') as out:
+        for number, question_data in enumerate(read_source(source_path), start=1):
+            errors.extend(validate_question(number, question_data))
+            record = {
+                "question": question_data.get("question"),
+                "options": question_data.get("options"),
+                "correct_option": question_data.get("correct_option"),
+            }
+            if question_data.get("fun_fact"):
+                record["fun_fact"] = question_data["fun_fact"]
+            out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+            offsets.append(out.tell())
+
+    if errors:
+        os.unlink(tmp_output)
+        for error in errors[:50]:
+            logger.error(error)
+        logger.error(f"Банк вопросов не собран: ошибок {len(errors)}")
+        return False
+
+    count = len(offsets) - 1
+    os.replace(tmp_output, output_path)
+    index_path = index_path_for(output_path)
+    with open(index_path + ".tmp", 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, count, offsets[-1]))
+        offsets.tofile(f)
+    os.replace(index_path + ".tmp", index_path)
+    logger.info(f"Собран банк вопросов: {output_path} ({count} вопросов), индекс: {index_path}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка внешнего банка вопросов")
+    parser.add_argument("--input", help="JSONL или JSON с вопросами (по умолчанию quiz_data.QUESTIONS)")
+    parser.add_argument("--output", default="questions.jsonl", help="куда записать банк вопросов")
+    args = parser.parse_args()
+    if not build(args.input, args.output):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
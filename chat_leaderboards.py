@@ -0,0 +1,269 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+from aggregates import LeaderboardAggregates
+from ranking import add_best_time_column, best_time_key, record_from_row
+from storage import JsonLeaderboardStorage, LeaderboardStorage, apply_result, connect_sqlite, write_transaction
+
+logger = logging.getLogger(__name__)
+
+CHAT_FILE_PATTERN = re.compile(r"chat_(-?\d+)\.json$")
+
+
+class ChatLeaderboards:
+    """Таблицы лидеров групповых чатов в дополнение к общей.
+
+    Таблица чата (раздел) открывается при первом обращении и живёт в
+    памяти со своим индексом рейтинга и статистикой, поэтому /top и
+    /mystats в чате стоят пропорционально размеру чата, а не всей базы.
+    Разделы, к которым не обращались дольше idle_ttl секунд, сохраняются
+    и выгружаются из памяти (evict_idle).
+    """
+
+    def __init__(self, backend, idle_ttl=3600):
+        self.backend = backend
+        self.idle_ttl = idle_ttl
+        self._partitions = {}
+        self._last_used = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def get(self, chat_id):
+        """Таблица лидеров чата (LeaderboardStorage), загружается при первом обращении"""
+        partition = self._partitions.get(chat_id)
+        if partition is None:
+            partition = self.backend.open(chat_id)
+            partition.load()
+            self._partitions[chat_id] = partition
+            self.loads += 1
+        self._last_used[chat_id] = time.monotonic()
+        return partition
+
+    async def evict_idle(self, now=None):
+        """Сохраняет и выгружает разделы без обращений дольше idle_ttl, возвращает их число"""
+        now = now or time.monotonic()
+        idle = [chat_id for chat_id, last_used in self._last_used.items() if now - last_used > self.idle_ttl]
+        evicted = 0
+        for chat_id in idle:
+            last_used = self._last_used[chat_id]
+            partition = self._partitions[chat_id]
+            try:
+                await partition.close()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении таблицы чата {chat_id}: {e}")
+                continue
+            # Раздел понадобился, пока сохранялся, — оставляем его в памяти
+            if self._last_used.get(chat_id) != last_used:
+                continue
+            del self._partitions[chat_id]
+            del self._last_used[chat_id]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    async def clear_all(self):
+        """Очищает таблицы всех чатов (еженедельный сброс)"""
+        await self.backend.clear_all(self._partitions)
+        logger.info("Таблицы лидеров чатов сброшены")
+
+    async def close(self):
+        for chat_id, partition in self._partitions.items():
+            try:
+                await partition.close()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении таблицы чата {chat_id}: {e}")
+        self._partitions.clear()
+        self._last_used.clear()
+        await self.backend.close()
+
+
+class JsonChatBackend:
+    """Таблица каждого чата — отдельный JSON-файл chat_<id>.json в directory"""
+
+    def __init__(self, directory, flush_delay=5.0):
+        self.directory = directory
+        self.flush_delay = flush_delay
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, chat_id):
+        return os.path.join(self.directory, f"chat_{chat_id}.json")
+
+    def open(self, chat_id):
+        return JsonLeaderboardStorage(self.path(chat_id), flush_delay=self.flush_delay)
+
+    async def clear_all(self, loaded):
+        for partition in loaded.values():
+            partition.clear()
+        loaded_paths = {os.path.abspath(partition.path) for partition in loaded.values()}
+        await asyncio.to_thread(self._remove_files, loaded_paths)
+
+    def _remove_files(self, keep):
+        """Удаляет файлы чатов, которые сейчас не загружены"""
+        for path in glob.glob(os.path.join(self.directory, "chat_*.json")):
+            if CHAT_FILE_PATTERN.search(path) and os.path.abspath(path) not in keep:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    async def close(self):
+        pass
+
+
+class SqliteChatBackend:
+    """Таблицы чатов в общей базе SQLite (таблица chat_players).
+
+    Раздел ничего не держит в памяти: рейтинг и статистика чата читаются
+    по индексу (chat_id, score, percentage, best_time, user_id), поэтому воркеры
+    видят изменения друг друга сразу.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chat_players (
+            chat_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            percentage REAL NOT NULL,
+            last_played TEXT NOT NULL,
+            games_played INTEGER NOT NULL DEFAULT 1,
+            best_time REAL NOT NULL DEFAULT 9e999,
+            PRIMARY KEY (chat_id, user_id)
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.path)
+            self._conn.executescript(self.SCHEMA)
+            add_best_time_column(self._conn, "chat_players")
+            self._conn.execute("DROP INDEX IF EXISTS idx_chat_players_rank")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_players_rank_time "
+                "ON chat_players (chat_id, score DESC, percentage DESC, best_time, user_id)"
+            )
+        return self._conn
+
+    def open(self, chat_id):
+        return SqliteChatLeaderboard(self._connect(), chat_id)
+
+    async def clear_all(self, loaded):
+        self._connect().execute("DELETE FROM chat_players")
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SqliteChatLeaderboard(LeaderboardStorage):
+    """Таблица лидеров одного чата в chat_players"""
+
+    COLUMNS = ("username", "score", "total_questions", "percentage", "last_played", "games_played", "best_time")
+    SELECT = (
+        "SELECT user_id, username, score, total_questions, percentage, last_played, games_played, best_time "
+        "FROM chat_players "
+    )
+
+    def __init__(self, conn, chat_id):
+        self._conn = conn
+        self.chat_id = chat_id
+
+    def _record(self, row):
+        return record_from_row(self.COLUMNS, row)
+
+    def get(self, user_id_str):
+        row = self._conn.execute(
+            self.SELECT + "WHERE chat_id = ? AND user_id = ?", (self.chat_id, user_id_str)
+        ).fetchone()
+        return self._record(row[1:]) if row else None
+
+    def set(self, user_id_str, record):
+        with write_transaction(self._conn):
+            self._replace(user_id_str, record)
+
+    def record_result(self, user_id_str, username, score, total_questions, played=None, answer_time=None):
+        # Чтение и запись в одной транзакции, чтобы воркеры не теряли обновления друг друга
+        with write_transaction(self._conn):
+            record = apply_result(
+                self.get(user_id_str), username, score, total_questions, played or datetime.now().isoformat(),
+                answer_time
+            )
+            self._replace(user_id_str, record)
+        return record
+
+    def _replace(self, user_id_str, record):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chat_players "
+            "(chat_id, user_id, username, score, total_questions, percentage, last_played, games_played, best_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.chat_id, user_id_str, record["username"], record["score"], record["total_questions"],
+                record["percentage"], record["last_played"], record.get("games_played", 1), best_time_key(record)
+            )
+        )
+
+    def change_token(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM chat_players WHERE chat_id = ?", (self.chat_id,)).fetchone()[0]
+
+    def top(self, n):
+        rows = self._conn.execute(
+            self.SELECT + "WHERE chat_id = ? ORDER BY score DESC, percentage DESC, best_time, user_id LIMIT ?",
+            (self.chat_id, n)
+        ).fetchall()
+        return [(row[0], self._record(row[1:])) for row in rows]
+
+    def rank(self, user_id_str):
+        record = self.get(user_id_str)
+        if record is None:
+            return None
+        score, percentage, best_time = record["score"], record["percentage"], best_time_key(record)
+        better = self._conn.execute(
+            "SELECT COUNT(*) FROM chat_players WHERE chat_id = ? AND (score > ? "
+            "OR (score = ? AND percentage > ?) "
+            "OR (score = ? AND percentage = ? AND best_time < ?) "
+            "OR (score = ? AND percentage = ? AND best_time = ? AND user_id < ?))",
+            (self.chat_id, score, score, percentage, score, percentage, best_time,
+             score, percentage, best_time, user_id_str)
+        ).fetchone()[0]
+        return better + 1
+
+    def aggregates(self):
+        aggregates = LeaderboardAggregates()
+        histogram = []
+        for score, players, percentage_sum in self._conn.execute(
+            "SELECT score, COUNT(*), SUM(percentage) FROM chat_players WHERE chat_id = ? GROUP BY score",
+            (self.chat_id,)
+        ):
+            histogram.extend([0] * (score + 1 - len(histogram)))
+            histogram[score] = players
+            aggregates.count += players
+            aggregates.score_sum += score * players
+            aggregates.percentage_sum += percentage_sum
+        aggregates.histogram = histogram
+        return aggregates
+
+
+def create_chat_leaderboards(backend, directory, sqlite_path, flush_delay=5.0, idle_ttl=3600):
+    """Создаёт таблицы чатов для бэкенда хранилища ("json" или "sqlite")"""
+    if backend == "json":
+        return ChatLeaderboards(JsonChatBackend(directory, flush_delay=flush_delay), idle_ttl=idle_ttl)
+    if backend == "sqlite":
+        return ChatLeaderboards(SqliteChatBackend(sqlite_path), idle_ttl=idle_ttl)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
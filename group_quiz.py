@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescedEdit:
+    """Правка сообщения, которую можно запрашивать сколько угодно часто.
+
+    request() только отмечает, что сообщение устарело, а сама правка
+    edit() выполняется не чаще раза в interval секунд и показывает
+    состояние на момент отправки: сотня нажатий за интервал стоит одного
+    запроса к Bot API.
+    """
+
+    def __init__(self, edit, interval):
+        self._edit = edit
+        self.interval = interval
+        self._dirty = False
+        self._editing = False
+        self._task = None
+        self._last_edit = 0.0
+        self.requests = 0
+        self.edits = 0
+
+    def request(self):
+        """Отмечает, что сообщение нужно обновить"""
+        self.requests += 1
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            delay = self._last_edit + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._dirty = False
+            self._last_edit = time.monotonic()
+            self.edits += 1
+            self._editing = True
+            try:
+                await self._edit()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении сообщения раунда: {e}")
+            finally:
+                self._editing = False
+
+    async def close(self):
+        """Отменяет ожидающую правку, а начатую дожидается (после неё сообщение правят итоги)"""
+        self._dirty = False
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        if self._editing:
+            await task
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+class GroupRound:
+    """Групповой раунд викторины: вопрос один на чат, отвечают все участники.
+
+    Ответы на текущий вопрос и итоги игроков хранятся в памяти раунда,
+    нажатие учитывается за O(1) без обращений к хранилищу и Bot API.
+    Игрок, не ответивший на вопрос (или присоединившийся позже), получает
+    за него полное время timeout — оно идёт в сравнение при равном счёте.
+    """
+
+    def __init__(self, chat_id, question_ids, timeout):
+        self.round_id = random.getrandbits(32)
+        self.chat_id = chat_id
+        self.question_ids = list(question_ids)
+        self.timeout = timeout
+        self.current_question = 0
+        self.message_id = 0
+        self.question_sent_at = 0.0
+        self.accepting = False
+        # user_id -> выбранный вариант (текущий вопрос)
+        self.answers = {}
+        self.option_counts = []
+        # user_id -> [имя, счёт, время ответов]
+        self.players = {}
+        self.editor = None
+
+    @property
+    def question_id(self):
+        return self.question_ids[self.current_question]
+
+    @property
+    def finished(self):
+        return self.current_question >= len(self.question_ids)
+
+    def open_question(self, message_id, options, sent_at=None):
+        """Вопрос отправлен в чат: начинаем принимать ответы"""
+        self.message_id = message_id
+        self.question_sent_at = sent_at or time.monotonic()
+        self.answers = {}
+        self.option_counts = [0] * options
+        self.accepting = True
+
+    def accept(self, user_id, username, question_id, option, correct_option, now=None):
+        """Учитывает нажатие: "accepted", "duplicate" (уже отвечал) или "closed" (вопрос не тот)"""
+        if not self.accepting or question_id != self.question_id or not 0 <= option < len(self.option_counts):
+            return "closed"
+        if user_id in self.answers:
+            return "duplicate"
+        elapsed = max(0.0, (now or time.monotonic()) - self.question_sent_at)
+        player = self.players.get(user_id)
+        if player is None:
+            player = self.players[user_id] = [username, 0, self.timeout * self.current_question]
+        player[0] = username
+        if option == correct_option:
+            player[1] += 1
+        player[2] += min(elapsed, self.timeout)
+        self.answers[user_id] = option
+        self.option_counts[option] += 1
+        return "accepted"
+
+    def close_question(self):
+        """Закрывает приём ответов на текущий вопрос; возвращает число участников, не ответивших на него"""
+        self.accepting = False
+        missed = 0
+        for user_id, player in self.players.items():
+            if user_id not in self.answers:
+                player[2] += self.timeout
+                missed += 1
+        return missed
+
+    def next_question(self):
+        """Переходит к следующему вопросу раунда"""
+        self.current_question += 1
+        self.answers = {}
+
+    def standings(self, n=None):
+        """Игроки раунда по местам: [(user_id, имя, счёт, время ответов)]"""
+        ranked = sorted(
+            ((user_id, *player) for user_id, player in self.players.items()),
+            key=lambda item: (-item[2], item[3], item[0])
+        )
+        return ranked if n is None else ranked[:n]
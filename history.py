@@ -0,0 +1,157 @@
+import logging
+from datetime import datetime
+
+from ranking import add_best_time_column, best_time_key, record_from_row
+
+logger = logging.getLogger(__name__)
+
+
+def week_date(label):
+    """Дата недели по метке бэкапа (20250105_200000 -> 05.01.2025)"""
+    return datetime.strptime(label, '%Y%m%d_%H%M%S').strftime('%d.%m.%Y')
+
+
+class WeeklyHistory:
+    """Индекс результатов прошедших недель в SQLite.
+
+    Каждая неделя хранится строками weekly_results с заранее посчитанным
+    местом игрока (rank), а таблица weeks — список недель с числом игроков.
+    Победители недели, лучший результат игрока и его результаты по неделям
+    читаются по индексам, без открытия бэкапов.
+
+    Работает с переданным соединением: SQLite-хранилище делит с индексом
+    свою базу, JSON-хранилище ведёт для него отдельный файл.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS weekly_results (
+            week TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            percentage REAL NOT NULL,
+            last_played TEXT NOT NULL,
+            games_played INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (week, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_weekly_results_user
+            ON weekly_results (user_id, week);
+        CREATE TABLE IF NOT EXISTS weeks (
+            week TEXT PRIMARY KEY,
+            players INTEGER NOT NULL
+        );
+    """
+
+    COLUMNS = ("username", "score", "total_questions", "percentage", "last_played", "games_played", "best_time")
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def ensure_schema(self):
+        """Создаёт таблицы и доводит до текущей схемы базы, где недели хранились без мест"""
+        self._conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(weekly_results)")}
+        if "rank" not in columns:
+            self._conn.execute("ALTER TABLE weekly_results ADD COLUMN rank INTEGER")
+        add_best_time_column(self._conn, "weekly_results")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_weekly_results_rank ON weekly_results (week, rank)")
+        unindexed = [
+            week for (week,) in self._conn.execute(
+                "SELECT DISTINCT week FROM weekly_results WHERE week NOT IN (SELECT week FROM weeks)"
+            ).fetchall()
+        ]
+        for week in unindexed:
+            self._transaction(self.finish_week, week)
+        if unindexed:
+            logger.info(f"В индекс истории добавлено недель: {len(unindexed)}")
+
+    def _transaction(self, func, *args):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    def add_week(self, label, leaderboard):
+        """Добавляет (или заменяет) неделю из словаря таблицы лидеров одной транзакцией"""
+        return self._transaction(self._add_week, label, leaderboard)
+
+    def _add_week(self, label, leaderboard):
+        self._conn.execute("DELETE FROM weekly_results WHERE week = ?", (label,))
+        self._conn.executemany(
+            "INSERT INTO weekly_results "
+            "(week, user_id, username, score, total_questions, percentage, last_played, games_played, best_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    label, user_id_str, record["username"], record["score"], record["total_questions"],
+                    record["percentage"], record.get("last_played", ""), record.get("games_played", 1),
+                    best_time_key(record)
+                )
+                for user_id_str, record in leaderboard.items()
+            )
+        )
+        return self.finish_week(label)
+
+    def finish_week(self, label):
+        """Расставляет места игроков недели и вносит её в список недель.
+
+        Вызывается внутри транзакции после записи строк недели. Порядок
+        мест тот же, что в RankingIndex: счёт, процент, время ответов, затем user_id.
+        """
+        ranked = self._conn.execute(
+            "SELECT user_id, ROW_NUMBER() OVER (ORDER BY score DESC, percentage DESC, best_time, user_id) "
+            "FROM weekly_results WHERE week = ?",
+            (label,)
+        ).fetchall()
+        self._conn.executemany(
+            "UPDATE weekly_results SET rank = ? WHERE week = ? AND user_id = ?",
+            ((rank, label, user_id_str) for user_id_str, rank in ranked)
+        )
+        self._conn.execute("INSERT OR REPLACE INTO weeks (week, players) VALUES (?, ?)", (label, len(ranked)))
+        return len(ranked)
+
+    def has_week(self, label):
+        return self._conn.execute("SELECT 1 FROM weeks WHERE week = ?", (label,)).fetchone() is not None
+
+    def winners(self, weeks=5, n=3):
+        """Последние weeks недель (от новых к старым): [(неделя, игроков, [(user_id, запись)])]"""
+        result = []
+        for week, players in self._conn.execute(
+            "SELECT week, players FROM weeks ORDER BY week DESC LIMIT ?", (weeks,)
+        ).fetchall():
+            rows = self._conn.execute(
+                "SELECT user_id, username, score, total_questions, percentage, last_played, games_played, best_time "
+                "FROM weekly_results WHERE week = ? AND rank <= ? ORDER BY rank",
+                (week, n)
+            ).fetchall()
+            result.append((week, players, [(row[0], record_from_row(self.COLUMNS, row[1:])) for row in rows]))
+        return result
+
+    def player_best(self, user_id_str):
+        """Лучшая неделя игрока: (неделя, запись, место, игроков) или None"""
+        row = self._conn.execute(
+            "SELECT r.week, r.username, r.score, r.total_questions, r.percentage, r.last_played, "
+            "r.games_played, r.best_time, r.rank, w.players "
+            "FROM weekly_results r JOIN weeks w ON w.week = r.week "
+            "WHERE r.user_id = ? ORDER BY r.score DESC, r.percentage DESC, r.best_time, r.week DESC LIMIT 1",
+            (user_id_str,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], record_from_row(self.COLUMNS, row[1:8]), row[8], row[9]
+
+    def player_weeks(self, user_id_str, limit=8):
+        """Результаты игрока за последние limit недель, где он играл: [(неделя, запись, место, игроков)]"""
+        rows = self._conn.execute(
+            "SELECT r.week, r.username, r.score, r.total_questions, r.percentage, r.last_played, "
+            "r.games_played, r.best_time, r.rank, w.players "
+            "FROM weekly_results r JOIN weeks w ON w.week = r.week "
+            "WHERE r.user_id = ? ORDER BY r.week DESC LIMIT ?",
+            (user_id_str, limit)
+        ).fetchall()
+        return [(row[0], record_from_row(self.COLUMNS, row[1:8]), row[8], row[9]) for row in rows]
@@ -0,0 +1,76 @@
+class LeaderboardMessageCache:
+    """Кэш готового текста таблицы лидеров для /top.
+
+    Текст перестраивается только тогда, когда изменение игрока видно
+    в сообщении: игрок попал в топ-N (или уже был в нём) либо изменились
+    отображаемые значения статистики. Изменения из других процессов
+    (несколько воркеров с общей базой) сбрасывают кэш по change_token хранилища.
+    """
+
+    def __init__(self, render, top_n=10):
+        self.render = render
+        self.top_n = top_n
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._message = None
+        self._top_ids = frozenset()
+        self._visible_stats = None
+        self._change_token = None
+
+    @staticmethod
+    def visible_stats(aggregates):
+        """Статистика в том виде, в каком она попадает в сообщение"""
+        if not aggregates.count:
+            return (0,)
+        return (
+            aggregates.count,
+            f"{aggregates.avg_score:.1f}",
+            f"{aggregates.avg_percentage:.1f}",
+            aggregates.median,
+            aggregates.p90,
+        )
+
+    def get(self, storage):
+        """Возвращает текст таблицы лидеров, перестраивая его только при промахе"""
+        change_token = storage.change_token()
+        if self._message is not None and change_token == self._change_token:
+            self.hits += 1
+            return self._message
+        self.misses += 1
+        self._change_token = change_token
+        self._message = self.render(storage, top_n=self.top_n)
+        self._top_ids = frozenset(user_id_str for user_id_str, _ in storage.top(self.top_n))
+        self._visible_stats = self.visible_stats(storage.aggregates())
+        return self._message
+
+    def on_player_changed(self, storage, user_id_str):
+        """Вызывается после изменения записи игрока в хранилище"""
+        if self._message is None:
+            return
+        if user_id_str in self._top_ids:
+            self.invalidate()
+            return
+        rank = storage.rank(user_id_str)
+        if rank is not None and rank <= self.top_n:
+            self.invalidate()
+            return
+        if self.visible_stats(storage.aggregates()) != self._visible_stats:
+            self.invalidate()
+
+    def invalidate(self):
+        """Сбрасывает кэш (например, после еженедельного сброса)"""
+        if self._message is not None:
+            self.invalidations += 1
+        self._message = None
+        self._top_ids = frozenset()
+        self._visible_stats = None
+        self._change_token = None
+
+    def stats(self):
+        """Счётчики попаданий и промахов кэша"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,68 @@
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1024)
+def plural(n, one, few, many):
+    """Число со словом в нужной форме: 1 день, 2–4 дня, остальные — дней"""
+    if n == 1:
+        return f"{n} {one}"
+    if 2 <= n <= 4:
+        return f"{n} {few}"
+    return f"{n} {many}"
+
+
+def format_countdown(delta):
+    """Оставшееся время словами: «2 дня, 3 часа, 15 минут»"""
+    hours = delta.seconds // 3600
+    minutes = (delta.seconds % 3600) // 60
+    parts = []
+    if delta.days > 0:
+        parts.append(plural(delta.days, "день", "дня", "дней"))
+    if hours > 0:
+        parts.append(plural(hours, "час", "часа", "часов"))
+    if minutes > 0:
+        parts.append(plural(minutes, "минуту", "минуты", "минут"))
+    return ", ".join(parts)
+
+
+class ResetPeriodTemplates:
+    """Тексты сообщений, которые меняются только вместе с датой сброса.
+
+    render(next_reset) собирает словарь готовых текстов (с датой сброса
+    внутри) один раз за период; обработчики подставляют в них только
+    живые данные — обратный отсчёт и числа игрока. Дата сброса зависит
+    лишь от текущего дня, поэтому она проверяется раз в сутки, а тексты
+    пересобираются, только когда она изменилась или после invalidate().
+    """
+
+    def __init__(self, next_reset_time, render):
+        self._next_reset_time = next_reset_time
+        self._render = render
+        self._checked_until = None
+        self.next_reset = None
+        self._texts = {}
+        self.renders = 0
+
+    def _refresh(self, now):
+        next_reset = self._next_reset_time()
+        if next_reset != self.next_reset:
+            self._texts = self._render(next_reset)
+            self.next_reset = next_reset
+            self.renders += 1
+        self._checked_until = datetime.combine(now.date() + timedelta(days=1), time.min)
+
+    def get(self, now=None):
+        """Словарь текстов текущего периода"""
+        now = now or datetime.now()
+        if self._checked_until is None or now >= self._checked_until:
+            self._refresh(now)
+        return self._texts
+
+    def __getitem__(self, name):
+        return self.get()[name]
+
+    def invalidate(self):
+        """Пересобрать тексты при следующем обращении (после сброса таблицы)"""
+        self._checked_until = None
+        self.next_reset = None
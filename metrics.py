@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "kinoquiz"
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus с фиксированными корзинами"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя ячейка — значения больше последней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Пары (граница, накопленное число наблюдений), включая +Inf"""
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Счётчики, гистограммы задержек и gauge-функции бота.
+
+    Значения обновляются в цикле событий без блокировок; render()
+    отдаёт их в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        # имя -> (описание, тип)
+        self._help = {}
+        self._histograms = defaultdict(dict)
+        self._counters = defaultdict(Counter)
+        self._gauges = defaultdict(Counter)
+        self._collectors = {}
+
+    def describe(self, name, help_text, metric_type):
+        self._help[name] = (help_text, metric_type)
+
+    def histogram(self, name, labels):
+        """Гистограмма name с метками labels (кортеж пар имя-значение)"""
+        histograms = self._histograms[name]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram()
+        return histogram
+
+    def inc(self, name, labels=(), amount=1):
+        self._counters[name][labels] += amount
+
+    def gauge_add(self, name, labels=(), amount=1):
+        self._gauges[name][labels] += amount
+
+    def set_collector(self, key, collect):
+        """collect() возвращает список (имя, тип, описание, {метки: значение}) на момент запроса.
+
+        Повторная регистрация с тем же key заменяет прежний сборщик.
+        """
+        self._collectors[key] = collect
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+
+        def header(name, help_text, metric_type):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+
+        for name, histograms in self._histograms.items():
+            header(name, *self._help.get(name, (name, "histogram")))
+            for labels, histogram in histograms.items():
+                for bound, total in histogram.cumulative():
+                    bucket_labels = format_labels((*labels, ("le", bound)))
+                    lines.append(f"{METRICS_PREFIX}_{name}_bucket{bucket_labels} {total}")
+                lines.append(f"{METRICS_PREFIX}_{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{METRICS_PREFIX}_{name}_count{format_labels(labels)} {histogram.count}")
+        for values in (self._counters, self._gauges):
+            for name, by_labels in values.items():
+                header(name, *self._help.get(name, (name, "untyped")))
+                for labels, value in by_labels.items():
+                    lines.append(f"{METRICS_PREFIX}_{name}{format_labels(labels)} {value}")
+        for collect in self._collectors.values():
+            try:
+                collected = collect()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик: {e}")
+                continue
+            for name, metric_type, help_text, by_labels in collected:
+                header(name, help_text, metric_type)
+                for labels, value in by_labels.items():
+                    lines.append(f"{METRICS_PREFIX}_{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("handler_latency_seconds", "Время работы обработчика", "histogram")
+registry.describe("handler_in_flight", "Обработчиков, выполняющихся сейчас", "gauge")
+registry.describe("handler_errors_total", "Исключений в обработчиках", "counter")
+registry.describe("storage_latency_seconds", "Время операций хранилища таблицы лидеров", "histogram")
+registry.describe("bot_api_latency_seconds", "Время HTTP-запроса к Bot API", "histogram")
+registry.describe("bot_api_errors_total", "Ошибок запросов к Bot API (сеть или код ответа)", "counter")
+
+
+def instrument_handler(func):
+    """Декоратор обработчика: задержка, число выполняющихся и ошибки"""
+    labels = (("handler", func.__name__),)
+    histogram = registry.histogram("handler_latency_seconds", labels)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        registry.gauge_add("handler_in_flight", labels, 1)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            registry.inc("handler_errors_total", labels)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+            registry.gauge_add("handler_in_flight", labels, -1)
+
+    return wrapper
+
+
+def instrument_methods(obj, names, metric="storage_latency_seconds"):
+    """Подменяет методы объекта обёртками, которые замеряют их время"""
+    for name in names:
+        method = getattr(obj, name)
+        histogram = registry.histogram(metric, (("operation", name),))
+        if inspect.iscoroutinefunction(method):
+            async def timed(*args, _method=method, _histogram=histogram, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await _method(*args, **kwargs)
+                finally:
+                    _histogram.observe(time.perf_counter() - started)
+        else:
+            def timed(*args, _method=method, _histogram=histogram, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    _histogram.observe(time.perf_counter() - started)
+        functools.update_wrapper(timed, method)
+        setattr(obj, name, timed)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет время каждого метода Bot API"""
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            registry.inc("bot_api_errors_total", (("method", endpoint), ("reason", type(e).__name__)))
+            raise
+        finally:
+            registry.histogram("bot_api_latency_seconds", (("method", endpoint),)).observe(
+                time.perf_counter() - started
+            )
+        if code >= 400:
+            registry.inc("bot_api_errors_total", (("method", endpoint), ("reason", str(code))))
+        return code, payload
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик потока цикла событий.
+
+    Фоновый поток раз в interval секунд снимает стек профилируемого потока
+    и считает одинаковые стеки. Результат — «свёрнутые» стеки
+    (формат flamegraph.pl / speedscope). Включается и выключается на ходу.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._target = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Начинает сэмплирование потока, из которого вызван"""
+        if self.running:
+            return
+        self.samples = Counter()
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("Профилировщик запущен")
+
+    def stop(self):
+        """Останавливает сэмплирование и возвращает свёрнутые стеки"""
+        if not self.running:
+            return ""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Профилировщик остановлен, снимков: {sum(self.samples.values())}")
+        return self.collapsed()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер метрик.
+
+    GET /metrics — метрики Prometheus, /profiler/start — включить
+    профилировщик, /profiler/stop — выключить и получить свёрнутые стеки.
+    """
+
+    def __init__(self, host, port, profiler=None):
+        self.host = host
+        self.port = port
+        self.profiler = profiler or SamplingProfiler()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+        return self
+
+    async def stop(self):
+        if self.profiler.running:
+            self.profiler.stop()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _route(self, path):
+        if path == "/metrics":
+            return 200, registry.render()
+        if path == "/profiler/start":
+            self.profiler.start()
+            return 200, "profiler started\n"
+        if path == "/profiler/stop":
+            return 200, self.profiler.stop()
+        return 404, "not found\n"
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode().split(" ")
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+            status, body = self._route(path)
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
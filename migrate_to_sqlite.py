@@ -0,0 +1,64 @@
+"""Одноразовый перенос таблицы лидеров и бэкапов из JSON в SQLite.
+
+Использование:
+    python3 migrate_to_sqlite.py [--json leaderboard.json] [--journal leaderboard.journal] [--db leaderboard.db]
+                                [--backups .]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from backups import BackupStore
+from results_journal import ResultsJournal
+from storage import JsonLeaderboardStorage, SqliteLeaderboardStorage
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+def migrate(json_path, db_path, backups_dir, journal_path=None):
+    """Переносит текущую таблицу и все недельные бэкапы в базу SQLite"""
+    storage = SqliteLeaderboardStorage(db_path)
+    storage.load()
+
+    chats_count = 0
+    journal_exists = journal_path and os.path.exists(journal_path)
+    if os.path.exists(json_path) or journal_exists:
+        # Загружаем так же, как бот: к снимку применяются результаты журнала,
+        # ещё не попавшие в него (например, после падения до уплотнения)
+        source = JsonLeaderboardStorage(json_path, journal=ResultsJournal(journal_path) if journal_exists else None)
+        source.load()
+        leaderboard = dict(source.items())
+        # Чаты рассылок и их ошибки доставки переносятся в той же транзакции, что и игроки
+        chats, chat_failures = source.chats()
+        storage.import_players(leaderboard, chats, chat_failures)
+        chats_count = len(chats)
+        logger.info(f"Перенесена текущая таблица: {len(leaderboard)} игроков, {chats_count} чатов")
+    else:
+        logger.warning(f"Файл {json_path} не найден, текущая таблица не перенесена")
+
+    backups = BackupStore(backups_dir)
+    for entry in backups.entries():
+        week = backups.read(entry["label"])
+        storage.import_week(entry["label"], week)
+        logger.info(f"Перенесен бэкап {entry['file']}: {len(week)} игроков")
+
+    logger.info(f"Миграция завершена, игроков в таблице: {storage.count()}, перенесено чатов: {chats_count}")
+    asyncio.run(storage.close())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос таблицы лидеров из JSON в SQLite")
+    parser.add_argument("--json", default="leaderboard.json", help="файл текущей таблицы лидеров")
+    parser.add_argument("--journal", default="leaderboard.journal", help="журнал результатов JSON-хранилища")
+    parser.add_argument("--db", default="leaderboard.db", help="файл базы SQLite")
+    parser.add_argument("--backups", default=".", help="каталог с бэкапами leaderboard_backup_*")
+    args = parser.parse_args()
+    migrate(args.json, args.db, args.backups, args.journal)
+
+
+if __name__ == '__main__':
+    main()
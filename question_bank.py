@@ -0,0 +1,155 @@
+import json
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from answer_callback import ANSWER_PREFIX, GROUP_ANSWER_PREFIX, encode_answer
+
+# Заголовок индексного файла: сигнатура, число вопросов, размер JSONL-файла
+INDEX_MAGIC = b"KQIDX001"
+INDEX_HEADER = struct.Struct("<8sQQ")
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledQuestion:
+    """Вопрос, подготовленный к отправке: тексты, кнопки и ответы собраны заранее"""
+    question_id: int
+    body: str
+    button_texts: tuple
+    options: tuple
+    correct_option: int
+    correct_text: str
+    incorrect_text: str
+    # Клавиатуры вариантов ответов: для личной викторины и для группового раунда
+    reply_markup: InlineKeyboardMarkup
+    group_reply_markup: InlineKeyboardMarkup
+
+    def result_text(self, is_correct):
+        """Текст результата ответа без строки со счётом"""
+        return self.correct_text if is_correct else self.incorrect_text
+
+
+def answer_keyboard(question_id, button_texts, prefix=ANSWER_PREFIX):
+    """Клавиатура с вариантами ответов вопроса (одна на все сессии)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=encode_answer(question_id, i, prefix))]
+        for i, text in enumerate(button_texts)
+    ])
+
+
+def compile_question(question_id, question_data):
+    """Собирает тексты кнопок и ответов одного вопроса"""
+    options = tuple(question_data["options"])
+    correct_option = question_data["correct_option"]
+    fun_fact = question_data.get('fun_fact', '')
+
+    # Тексты кнопок с вариантами ответов
+    button_texts = tuple(f"{i+1}. {option}" for i, option in enumerate(options))
+
+    # Формируем сообщения с результатом
+    correct_text = "✅ **Верно!** Отличный ответ!"
+    incorrect_text = f"❌ **Неверно!**\n\n📌 Правильный ответ: *{options[correct_option]}*"
+
+    # Добавляем интересный факт
+    if fun_fact:
+        fact_text = f"\n\n📚 **Интересный факт:**\n{fun_fact}"
+        correct_text += fact_text
+        incorrect_text += fact_text
+
+    return CompiledQuestion(
+        question_id=question_id,
+        body=f"❓ {question_data['question']}",
+        button_texts=button_texts,
+        options=options,
+        correct_option=correct_option,
+        correct_text=correct_text,
+        incorrect_text=incorrect_text,
+        reply_markup=answer_keyboard(question_id, button_texts),
+        group_reply_markup=answer_keyboard(question_id, button_texts, GROUP_ANSWER_PREFIX),
+    )
+
+
+def compile_questions(questions):
+    """Компилирует весь банк вопросов один раз при запуске"""
+    return tuple(compile_question(i, question_data) for i, question_data in enumerate(questions))
+
+
+def question_headers(total):
+    """Заголовки «Вопрос N/total» для каждой позиции в викторине"""
+    return tuple(f"🎥 **Вопрос {i + 1}/{total}**\n\n" for i in range(total))
+
+
+def index_path_for(jsonl_path):
+    """Путь к индексу смещений для файла вопросов"""
+    return os.path.splitext(jsonl_path)[0] + ".idx"
+
+
+class InMemoryQuestionBank:
+    """Банк вопросов из списка словарей (quiz_data.QUESTIONS), скомпилированный целиком"""
+
+    def __init__(self, questions):
+        self._compiled = compile_questions(questions)
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def get(self, question_id):
+        return self._compiled[question_id]
+
+    def close(self):
+        pass
+
+
+class FileQuestionBank:
+    """Банк вопросов во внешнем JSONL-файле с заранее построенным индексом смещений.
+
+    Файлы отображаются в память, вопросы читаются и компилируются по
+    запросу, а последние cache_size скомпилированных вопросов хранятся в
+    LRU-кэше. Схема проверяется при сборке (build_question_bank.py),
+    а не при каждом запуске.
+    """
+
+    def __init__(self, path, cache_size=4096):
+        self.path = path
+        self._data_file = open(path, 'rb')
+        self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_file = open(index_path_for(path), 'rb')
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, data_size = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path_for(path)}: неизвестный формат индекса")
+        if data_size != len(self._data):
+            raise ValueError(f"{index_path_for(path)}: индекс устарел, пересоберите банк вопросов")
+        self._count = count
+        # count + 1 смещений: конец i-й записи — начало (i + 1)-й
+        self._offsets = memoryview(self._index)[INDEX_HEADER.size:].cast('Q')
+        self.get = lru_cache(maxsize=cache_size)(self._load)
+
+    def __len__(self):
+        return self._count
+
+    def _load(self, question_id):
+        if not 0 <= question_id < self._count:
+            raise IndexError(question_id)
+        start, end = self._offsets[question_id], self._offsets[question_id + 1]
+        return compile_question(question_id, json.loads(self._data[start:end]))
+
+    def close(self):
+        self.get.cache_clear()
+        self._offsets.release()
+        self._index.close()
+        self._index_file.close()
+        self._data.close()
+        self._data_file.close()
+
+
+def open_question_bank(path, fallback_questions, cache_size=4096):
+    """Открывает внешний банк вопросов, а если его нет — использует встроенный список"""
+    if path and os.path.exists(path):
+        return FileQuestionBank(path, cache_size=cache_size)
+    return InMemoryQuestionBank(fallback_questions())
@@ -0,0 +1,105 @@
+import random
+
+# До этого размера пула отмечаем вопросы точной битовой картой (не больше 1 КБ)
+EXACT_BITMAP_LIMIT = 8192
+# Для больших пулов — фильтр Блума фиксированного размера
+BLOOM_BITS = 16384  # 2 КБ на пользователя
+BLOOM_HASHES = 3
+BLOOM_CAPACITY = 1600  # после стольких вопросов фильтр сбрасывается (ложные срабатывания ~2%)
+# Сколько случайных попыток делаем на один вопрос, прежде чем искать перебором
+ATTEMPTS_PER_QUESTION = 16
+
+
+class SeenQuestions:
+    """Компактная отметка уже показанных пользователю вопросов.
+
+    Для небольших пулов — точная битовая карта, для больших — фильтр
+    Блума фиксированного размера. Память на пользователя ограничена
+    (не больше 2 КБ) и не зависит от размера каталога. Когда непоказанных
+    вопросов не хватает на новую викторину, отметки сбрасываются.
+    """
+
+    __slots__ = ("pool_size", "count", "bits")
+
+    def __init__(self, pool_size, count=0, bits=None):
+        self.pool_size = pool_size
+        self.count = count
+        if bits is None:
+            bits = bytearray(self._bits_size(pool_size) // 8)
+        self.bits = bytearray(bits)
+
+    @staticmethod
+    def _bits_size(pool_size):
+        if pool_size <= EXACT_BITMAP_LIMIT:
+            return (pool_size + 7) // 8 * 8
+        return BLOOM_BITS
+
+    @property
+    def exact(self):
+        return self.pool_size <= EXACT_BITMAP_LIMIT
+
+    @property
+    def capacity(self):
+        """Сколько вопросов можно отметить до сброса"""
+        return self.pool_size if self.exact else BLOOM_CAPACITY
+
+    def _positions(self, question_id):
+        if self.exact:
+            return (question_id,)
+        h1 = (question_id * 0x9E3779B1) & 0xFFFFFFFF
+        h2 = ((question_id * 0x85EBCA77) & 0xFFFFFFFF) | 1
+        return tuple((h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES))
+
+    def __contains__(self, question_id):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(question_id))
+
+    def add(self, question_id):
+        bits = self.bits
+        for p in self._positions(question_id):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def reset(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def _scan_unseen(self, start, picked):
+        """Ищет непоказанный вопрос перебором битовой карты (только точный режим)"""
+        for offset in range(self.pool_size):
+            question_id = (start + offset) % self.pool_size
+            if question_id not in picked and question_id not in self:
+                return question_id
+        return None
+
+    def draw(self, k, rng=random):
+        """Выбирает k разных непоказанных вопросов и отмечает их показанными.
+
+        Ожидаемая стоимость O(k) и не зависит от размера каталога.
+        """
+        k = min(k, self.pool_size)
+        if self.capacity - self.count < k:
+            # Непоказанные вопросы закончились — начинаем новый круг
+            self.reset()
+
+        picked = []
+        picked_set = set()
+        attempts = 0
+        while len(picked) < k:
+            question_id = rng.randrange(self.pool_size)
+            attempts += 1
+            if question_id in picked_set:
+                continue
+            if question_id in self:
+                if attempts < ATTEMPTS_PER_QUESTION * k:
+                    continue
+                if self.exact:
+                    # Пул почти исчерпан: добираем перебором (не больше EXACT_BITMAP_LIMIT бит)
+                    question_id = self._scan_unseen(question_id, picked_set)
+                # В режиме Блума это может быть ложное срабатывание — принимаем вопрос
+            picked.append(question_id)
+            picked_set.add(question_id)
+
+        for question_id in picked:
+            self.add(question_id)
+        return picked
@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import logging
+from array import array
+
+from storage import connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+# Вариантов ответа у вопроса не больше, чем допускает build_question_bank.py
+MAX_OPTIONS = 10
+# Счётчики вопроса в массиве приращений: ответы, верные, без ответа вовремя, затем выборы вариантов
+ANSWERS, CORRECT, TIMEOUTS, PICKS = 0, 1, 2, 3
+
+
+class QuestionStats:
+    """Статистика ответов на вопросы банка: выборы вариантов и доля верных.
+
+    Счётчики — плоские массивы array с индексом по id вопроса (выборы
+    вариантов — id * max_options + вариант), поэтому ответ учитывается
+    несколькими инкрементами, а 100 тысяч вопросов занимают около
+    15 МБ. Приращения с прошлой записи копятся в отдельном массиве и
+    flush() прибавляет их к строкам SQLite (UPSERT с суммой), так что
+    воркеры пишут в одну базу, не затирая друг друга; при shared после
+    записи счётчики перечитываются из базы вместе с ответами остальных.
+    Сводка для /qstats считается один раз после записи и до следующей
+    отдаётся готовой.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS question_stats (
+            question_id INTEGER PRIMARY KEY,
+            answers INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            timeouts INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS question_picks (
+            question_id INTEGER NOT NULL,
+            option INTEGER NOT NULL,
+            picks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (question_id, option)
+        );
+    """
+
+    def __init__(self, path, size, max_options=MAX_OPTIONS, shared=False):
+        self.path = path
+        self.size = size
+        self.max_options = max_options
+        self.shared = shared
+        self._conn = None
+        self._stride = PICKS + max_options
+        self.answers, self.correct, self.timeouts, self.picks = self._empty_totals()
+        # Приращения с прошлой записи: по self._stride счётчиков на вопрос
+        self._pending = array('I', [0]) * (size * self._stride)
+        self._dirty = set()
+        self._flush_lock = None
+        self._summary = {}
+        self.flushes = 0
+
+    def _empty_totals(self):
+        return (
+            array('Q', [0]) * self.size,
+            array('Q', [0]) * self.size,
+            array('Q', [0]) * self.size,
+            array('Q', [0]) * (self.size * self.max_options),
+        )
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.path)
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def record_answer(self, question_id, option, is_correct):
+        """Учитывает ответ на вопрос"""
+        if not 0 <= question_id < self.size or not 0 <= option < self.max_options:
+            return
+        base = question_id * self._stride
+        self.answers[question_id] += 1
+        self.picks[question_id * self.max_options + option] += 1
+        self._pending[base + ANSWERS] += 1
+        self._pending[base + PICKS + option] += 1
+        if is_correct:
+            self.correct[question_id] += 1
+            self._pending[base + CORRECT] += 1
+        self._dirty.add(question_id)
+
+    def record_timeout(self, question_id, count=1):
+        """Учитывает count показов вопроса, оставшихся без ответа вовремя"""
+        if not 0 <= question_id < self.size or count <= 0:
+            return
+        self.timeouts[question_id] += count
+        self._pending[question_id * self._stride + TIMEOUTS] += count
+        self._dirty.add(question_id)
+
+    def load(self):
+        """Загружает накопленные счётчики из базы"""
+        self.answers, self.correct, self.timeouts, self.picks = self._read_totals()
+        self._summary = {}
+        logger.info(f"Статистика вопросов загружена: {sum(self.answers)} ответов")
+
+    def _read_totals(self):
+        """Счётчики из базы в новых массивах (ответы, верные, без ответа вовремя, выборы)"""
+        conn = self._connect()
+        answers, correct, timeouts, picks = self._empty_totals()
+        for question_id, answered, correct_answers, timed_out in conn.execute(
+            "SELECT question_id, answers, correct, timeouts FROM question_stats WHERE question_id < ?", (self.size,)
+        ):
+            answers[question_id] = answered
+            correct[question_id] = correct_answers
+            timeouts[question_id] = timed_out
+        for question_id, option, option_picks in conn.execute(
+            "SELECT question_id, option, picks FROM question_picks WHERE question_id < ? AND option < ?",
+            (self.size, self.max_options)
+        ):
+            picks[question_id * self.max_options + option] = option_picks
+        return answers, correct, timeouts, picks
+
+    def _take_pending(self):
+        """Забирает накопленные приращения: {id вопроса: счётчики}"""
+        dirty, self._dirty = self._dirty, set()
+        taken = {}
+        for question_id in dirty:
+            base = question_id * self._stride
+            taken[question_id] = self._pending[base:base + self._stride]
+            self._pending[base:base + self._stride] = array('I', [0]) * self._stride
+        return taken
+
+    def _restore_pending(self, taken):
+        """Возвращает незаписанные приращения, чтобы записать их в следующий раз"""
+        for question_id, counters in taken.items():
+            base = question_id * self._stride
+            for i, value in enumerate(counters):
+                self._pending[base + i] += value
+            self._dirty.add(question_id)
+
+    def _write(self, taken):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO question_stats (question_id, answers, correct, timeouts) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (question_id) DO UPDATE SET answers = answers + excluded.answers, "
+                "correct = correct + excluded.correct, timeouts = timeouts + excluded.timeouts",
+                (
+                    (question_id, counters[ANSWERS], counters[CORRECT], counters[TIMEOUTS])
+                    for question_id, counters in taken.items()
+                )
+            )
+            conn.executemany(
+                "INSERT INTO question_picks (question_id, option, picks) VALUES (?, ?, ?) "
+                "ON CONFLICT (question_id, option) DO UPDATE SET picks = picks + excluded.picks",
+                (
+                    (question_id, option, picks)
+                    for question_id, counters in taken.items()
+                    for option, picks in enumerate(counters[PICKS:])
+                    if picks
+                )
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _write_and_read(self, taken):
+        """Записывает приращения и читает общие счётчики всех воркеров"""
+        self._write(taken)
+        return self._read_totals()
+
+    async def flush(self):
+        """Прибавляет накопленные приращения к счётчикам в базе"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty and not self.shared:
+                return
+            taken = self._take_pending()
+            try:
+                if not self.shared:
+                    await asyncio.to_thread(self._write, taken)
+                else:
+                    totals = await asyncio.to_thread(self._write_and_read, taken)
+                    self.answers, self.correct, self.timeouts, self.picks = totals
+                    # Ответы, пришедшие во время записи, в базу ещё не попали
+                    for question_id in self._dirty:
+                        self._add_to_totals(question_id)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении статистики вопросов: {e}")
+                self._restore_pending(taken)
+                return
+            self.flushes += 1
+            self._summary = {}
+
+    def _add_to_totals(self, question_id):
+        base = question_id * self._stride
+        self.answers[question_id] += self._pending[base + ANSWERS]
+        self.correct[question_id] += self._pending[base + CORRECT]
+        self.timeouts[question_id] += self._pending[base + TIMEOUTS]
+        picks_base = question_id * self.max_options
+        for option in range(self.max_options):
+            self.picks[picks_base + option] += self._pending[base + PICKS + option]
+
+    def question(self, question_id, options=None):
+        """Счётчики одного вопроса за O(1)"""
+        base = question_id * self.max_options
+        return {
+            "answers": self.answers[question_id],
+            "correct": self.correct[question_id],
+            "timeouts": self.timeouts[question_id],
+            "picks": self.picks[base:base + (options or self.max_options)].tolist(),
+        }
+
+    def summary(self, n=5, min_shown=20):
+        """Итоги по банку и n самых трудных и лёгких вопросов (от min_shown показов).
+
+        Считается проходом по массивам один раз до следующей записи.
+        Вопросы в списках — (id, доля верных, показов).
+        """
+        key = (n, min_shown)
+        cached = self._summary.get(key)
+        if cached is not None:
+            return cached
+        answers, correct, timeouts = self.answers, self.correct, self.timeouts
+        rated = [
+            (correct[i] / shown, i, shown)
+            for i, shown in enumerate(map(int.__add__, answers, timeouts))
+            if shown >= min_shown
+        ]
+        hardest = heapq.nsmallest(n, rated, key=lambda item: (item[0], -item[2], item[1]))
+        # Вопрос не попадает сразу в оба списка, даже если оценённых вопросов мало
+        hardest_ids = {i for _, i, _ in hardest}
+        easiest = heapq.nsmallest(
+            n, (item for item in rated if item[1] not in hardest_ids), key=lambda item: (-item[0], -item[2], item[1])
+        )
+        summary = {
+            "questions": self.size,
+            "answered": sum(1 for value in answers if value),
+            "rated": len(rated),
+            "answers": sum(answers),
+            "correct": sum(correct),
+            "timeouts": sum(timeouts),
+            "hardest": [(i, rate, shown) for rate, i, shown in hardest],
+            "easiest": [(i, rate, shown) for rate, i, shown in easiest],
+        }
+        self._summary[key] = summary
+        return summary
+
+    async def close(self):
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        logger.info(f"Статистика вопросов сохранена (записей: {self.flushes})")
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import random
+import struct
+import time
+from array import array
+from dataclasses import dataclass, field
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from question_sampler import SeenQuestions
+from storage import connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+# Версия формата, флаги, номер вопроса, счёт, chat_id, время активности,
+# размер пула и счётчик показанных вопросов, длины имени, списка вопросов
+# и битовой карты, id сессии, время отправки вопроса, сумма времени ответов,
+# id сообщения с вопросом
+SESSION_HEADER = struct.Struct("<BBHHqdIIHHHIddq")
+SESSION_FORMAT = 3
+# Форматы 1 (без id сессии) и 2 (без таймера вопросов) читаются для совместимости
+SESSION_HEADER_V1 = struct.Struct("<BBHHqdIIHHH")
+SESSION_HEADER_V2 = struct.Struct("<BBHHqdIIHHHI")
+FLAG_PENDING_STEP = 1
+
+
+@dataclass(slots=True)
+class QuizSession:
+    """Состояние викторины пользователя (используется как context.user_data).
+
+    Хранится компактно и сохраняется в базу в упакованном виде (to_bytes).
+    version растёт при каждом изменении — по ней сохраняются только
+    изменившиеся сессии.
+    """
+    # Случайный id викторины: попадает в callback_data кнопок ответа
+    session_id: int = 0
+    question_ids: array = field(default_factory=lambda: array('I'))
+    current_question: int = 0
+    score: int = 0
+    chat_id: int = 0
+    username: str = ""
+    # Ответ получен, а следующий вопрос (или итоги) ещё не отправлен
+    pending_step: bool = False
+    # Когда отправлен текущий вопрос (time.time()) и id этого сообщения
+    question_sent_at: float = 0.0
+    message_id: int = 0
+    # Сумма времени ответов на вопросы этой викторины, секунд
+    answer_time: float = 0.0
+    seen: SeenQuestions | None = None
+    last_active: float = 0.0
+    version: int = 0
+
+    def _changed(self):
+        self.last_active = time.time()
+        self.version += 1
+
+    def start(self, chat_id, username, question_ids):
+        """Начинает новую викторину"""
+        self.session_id = random.getrandbits(32)
+        self.question_ids = array('I', question_ids)
+        self.current_question = 0
+        self.score = 0
+        self.chat_id = chat_id
+        self.username = username
+        self.pending_step = False
+        self.question_sent_at = 0.0
+        self.message_id = 0
+        self.answer_time = 0.0
+        self._changed()
+
+    def question_sent(self, message_id, sent_at=None):
+        """Текущий вопрос отправлен: с этого момента идёт время на ответ"""
+        self.message_id = message_id
+        self.question_sent_at = sent_at or time.time()
+        self._changed()
+
+    def elapsed(self, now=None):
+        """Секунд с отправки текущего вопроса (0, если время отправки неизвестно)"""
+        if not self.question_sent_at:
+            return 0.0
+        return max(0.0, (now or time.time()) - self.question_sent_at)
+
+    @property
+    def awaiting_answer(self):
+        """Вопрос отправлен и ждёт ответа"""
+        return self.question_sent_at > 0 and not self.pending_step and self.current_question < len(self.question_ids)
+
+    def answer(self, is_correct, elapsed=0.0):
+        """Учитывает ответ на текущий вопрос (elapsed — время ответа) и переходит к следующему"""
+        if is_correct:
+            self.score += 1
+        self.answer_time += elapsed
+        self.question_sent_at = 0.0
+        self.current_question += 1
+        self.pending_step = True
+        self._changed()
+
+    def step_sent(self):
+        """Следующий вопрос или итоги отправлены"""
+        self.pending_step = False
+        self._changed()
+
+    def use_seen(self, pool_size):
+        """Возвращает отметки показанных вопросов для пула заданного размера"""
+        if self.seen is None or self.seen.pool_size != pool_size:
+            self.seen = SeenQuestions(pool_size)
+        return self.seen
+
+    def to_bytes(self):
+        """Упаковывает сессию в байты для записи в базу"""
+        username = self.username.encode('utf-8')
+        seen = self.seen
+        bits = seen.bits if seen is not None else b""
+        header = SESSION_HEADER.pack(
+            SESSION_FORMAT,
+            FLAG_PENDING_STEP if self.pending_step else 0,
+            self.current_question,
+            self.score,
+            self.chat_id,
+            self.last_active,
+            seen.pool_size if seen is not None else 0,
+            seen.count if seen is not None else 0,
+            len(username),
+            len(self.question_ids),
+            len(bits),
+            self.session_id,
+            self.question_sent_at,
+            self.answer_time,
+            self.message_id,
+        )
+        return b"".join((header, username, self.question_ids.tobytes(), bytes(bits)))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Восстанавливает сессию из байтов (см. to_bytes)"""
+        version = blob[0]
+        if version == SESSION_FORMAT:
+            header = SESSION_HEADER
+            fields = header.unpack_from(blob)
+        elif version == 2:
+            header = SESSION_HEADER_V2
+            fields = header.unpack_from(blob) + (0.0, 0.0, 0)
+        elif version == 1:
+            header = SESSION_HEADER_V1
+            fields = header.unpack_from(blob) + (0, 0.0, 0.0, 0)
+        else:
+            raise ValueError(f"Неизвестная версия формата сессии: {version}")
+        (
+            version, flags, current_question, score, chat_id, last_active,
+            pool_size, seen_count, username_len, ids_len, bits_len, session_id,
+            question_sent_at, answer_time, message_id
+        ) = fields
+        offset = header.size
+        username = bytes(blob[offset:offset + username_len]).decode('utf-8')
+        offset += username_len
+        question_ids = array('I')
+        question_ids.frombytes(blob[offset:offset + ids_len * question_ids.itemsize])
+        offset += ids_len * question_ids.itemsize
+        seen = None
+        if pool_size:
+            seen = SeenQuestions(pool_size, seen_count, blob[offset:offset + bits_len])
+        return cls(
+            session_id=session_id,
+            question_ids=question_ids,
+            current_question=current_question,
+            score=score,
+            chat_id=chat_id,
+            username=username,
+            pending_step=bool(flags & FLAG_PENDING_STEP),
+            question_sent_at=question_sent_at,
+            message_id=message_id,
+            answer_time=answer_time,
+            seen=seen,
+            last_active=last_active,
+        )
+
+
+class SessionPersistence(BasePersistence):
+    """Сохраняет сессии викторины (user_data) в SQLite.
+
+    Application раз в update_interval передаёт сессии пользователей, с
+    которыми что-то происходило; из них записываются только изменившиеся,
+    все одной транзакцией и не в цикле событий. Сессии старше ttl
+    (по последней активности) при загрузке не поднимаются в память.
+    shard=(номер, всего) — загружать только сессии пользователей этого воркера.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            last_active REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_quiz_sessions_last_active
+            ON quiz_sessions (last_active);
+    """
+
+    def __init__(self, path, ttl, update_interval=5, shard=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path
+        self.ttl = ttl
+        self.shard = shard
+        self._conn = None
+        # Версии сессий, уже записанных в базу
+        self._saved_versions = {}
+        self._pending = {}
+        self._deleted = set()
+        self._write_task = None
+        self._write_lock = None
+        self.writes = 0
+        self.skipped = 0
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.path)
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    async def get_user_data(self):
+        conn = self._connect()
+        expired_before = time.time() - self.ttl
+        conn.execute("DELETE FROM quiz_sessions WHERE last_active < ?", (expired_before,))
+        if self.shard is None:
+            rows = conn.execute("SELECT user_id, data FROM quiz_sessions")
+        else:
+            index, workers = self.shard
+            rows = conn.execute(
+                "SELECT user_id, data FROM quiz_sessions WHERE user_id % ? = ?", (workers, index)
+            )
+        sessions = {}
+        for user_id, blob in rows:
+            try:
+                sessions[user_id] = QuizSession.from_bytes(blob)
+            except Exception as e:
+                logger.error(f"Не удалось восстановить сессию пользователя {user_id}: {e}")
+        self._saved_versions = {user_id: session.version for user_id, session in sessions.items()}
+        logger.info(f"Восстановлено сессий викторины: {len(sessions)}")
+        return sessions
+
+    async def update_user_data(self, user_id, data):
+        if self._saved_versions.get(user_id, 0) == data.version:
+            # Сессия не менялась с последней записи
+            self.skipped += 1
+            return
+        self._saved_versions[user_id] = data.version
+        self._deleted.discard(user_id)
+        self._pending[user_id] = (data.to_bytes(), data.last_active)
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._saved_versions.pop(user_id, None)
+        self._pending.pop(user_id, None)
+        self._deleted.add(user_id)
+        self._schedule_write()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    def _schedule_write(self):
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        """Записывает накопленные сессии одной транзакцией"""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        # Даём Application передать остальные сессии этого прохода
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            while self._pending or self._deleted:
+                pending, self._pending = self._pending, {}
+                deleted, self._deleted = self._deleted, set()
+                try:
+                    await asyncio.to_thread(self._write, pending, deleted)
+                    self.writes += 1
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении сессий викторины: {e}")
+                    for user_id in pending:
+                        self._saved_versions.pop(user_id, None)
+                    break
+
+    def _write(self, pending, deleted):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO quiz_sessions (user_id, data, last_active) VALUES (?, ?, ?)",
+                ((user_id, blob, last_active) for user_id, (blob, last_active) in pending.items())
+            )
+            conn.executemany(
+                "DELETE FROM quiz_sessions WHERE user_id = ?",
+                ((user_id,) for user_id in deleted)
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending or self._deleted:
+            await self._write_pending()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        logger.info(f"Сессии викторины сохранены (записей: {self.writes}, без изменений: {self.skipped})")
+
+    # Остальные данные (bot_data, chat_data, callback_data, диалоги) не сохраняются
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+
+def evict_idle_sessions(application, ttl, now=None):
+    """Выгружает из памяти (и из базы) сессии без активности дольше ttl секунд.
+
+    Вместе с сессией пропадает и битовая карта заданных игроку вопросов:
+    вернувшись, он снова может получить вопросы, которые уже видел.
+    """
+    expired_before = (now or time.time()) - ttl
+    expired = [
+        user_id for user_id, session in application.user_data.items()
+        if session.last_active < expired_before
+    ]
+    for user_id in expired:
+        application.drop_user_data(user_id)
+    return len(expired)
@@ -0,0 +1,88 @@
+from sortedcontainers import SortedList
+
+# Время ответов неизвестно (результаты до появления таймера вопросов):
+# при равных счёте и проценте такие игроки идут после игроков со временем
+NO_TIME = float("inf")
+
+
+def best_time_key(record):
+    """Время ответов лучшей игры для сортировки (NO_TIME, если его нет)"""
+    best_time = record.get("best_time")
+    return NO_TIME if best_time is None else best_time
+
+
+def add_best_time_column(conn, table):
+    """Добавляет столбец best_time в таблицу игроков базы, созданной до таймера вопросов"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if "best_time" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN best_time REAL NOT NULL DEFAULT 9e999")
+
+
+def record_from_row(columns, row):
+    """Запись игрока из строки SQLite (NO_TIME в best_time означает «времени нет»)"""
+    record = dict(zip(columns, row))
+    if record.get("best_time") == NO_TIME:
+        del record["best_time"]
+    return record
+
+
+class RankingIndex:
+    """Упорядоченный индекс рейтинга: место игрока и топ-N за O(log n).
+
+    Ключ элемента — (-score, -percentage, best_time, user_id), поэтому
+    лучшие игроки идут первыми, при равенстве результатов выше тот, кто
+    ответил быстрее, а затем порядок задаёт user_id.
+    """
+
+    def __init__(self, leaderboard=None):
+        self._keys = {}
+        self._sorted = SortedList()
+        if leaderboard:
+            self.rebuild(leaderboard)
+
+    @staticmethod
+    def make_key(user_id_str, record):
+        return (-record["score"], -record["percentage"], best_time_key(record), user_id_str)
+
+    def rebuild(self, leaderboard):
+        """Строит индекс заново по словарю таблицы лидеров"""
+        self._keys = {
+            user_id_str: self.make_key(user_id_str, record)
+            for user_id_str, record in leaderboard.items()
+        }
+        self._sorted = SortedList(self._keys.values())
+
+    def update(self, user_id_str, record):
+        """Добавляет игрока или переставляет его после улучшения результата"""
+        new_key = self.make_key(user_id_str, record)
+        old_key = self._keys.get(user_id_str)
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            self._sorted.remove(old_key)
+        self._sorted.add(new_key)
+        self._keys[user_id_str] = new_key
+
+    def discard(self, user_id_str):
+        """Удаляет игрока из индекса"""
+        old_key = self._keys.pop(user_id_str, None)
+        if old_key is not None:
+            self._sorted.remove(old_key)
+
+    def clear(self):
+        self._keys = {}
+        self._sorted.clear()
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def rank(self, user_id_str):
+        """Возвращает место игрока (с 1) или None, если его нет в индексе"""
+        key = self._keys.get(user_id_str)
+        if key is None:
+            return None
+        return self._sorted.bisect_left(key) + 1
+
+    def top(self, n):
+        """Возвращает user_id лучших n игроков по порядку"""
+        return [key[3] for key in self._sorted.islice(0, n)]
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов (меньше — важнее). Ноль не используется:
+# ExtBot отбрасывает «ложные» rate_limit_args
+PRIORITY_QUIZ = 1  # ответы на кнопки и вопросы викторины
+PRIORITY_DEFAULT = 2  # ответы на команды (/top, /help, ...)
+PRIORITY_BULK = 3  # рассылки
+
+# Общий лимит Bot API на бота (запросов в секунду и запас)
+GLOBAL_RATE = 25.0
+GLOBAL_BURST = 5
+
+# Запросы, которые всегда относятся к ходу викторины
+QUIZ_ENDPOINTS = frozenset({"answerCallbackQuery", "editMessageText"})
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """Забирает токен (возможно, в долг) и возвращает, сколько ждать до его появления"""
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def time_until_token(self, now):
+        """Сколько ждать, пока в корзине появится целый токен"""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Ограничитель исходящих запросов к Bot API с учётом лимитов Telegram.
+
+    Каждый запрос сначала ждёт токен корзины своего чата (отдельные лимиты
+    для личных и групповых чатов), затем — токен общей корзины. Общие
+    токены выдаются из очереди с приоритетами, так что ход викторины
+    обслуживается раньше ответов на /top и /help. При RetryAfter (429)
+    отправка приостанавливается для всех на указанное Telegram время.
+    """
+
+    def __init__(
+        self,
+        global_rate=GLOBAL_RATE,
+        global_burst=GLOBAL_BURST,
+        private_chat_rate=1.0,
+        private_chat_burst=2,
+        group_chat_rate=20 / 60,
+        group_chat_burst=3,
+        max_retries=3,
+        max_idle_chats=10000,
+    ):
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_rate = group_chat_rate
+        self.group_chat_burst = group_chat_burst
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._paused_until = 0.0
+        # Метрики
+        self.queue_depth_max = 0
+        self.requests_total = 0
+        self.retries_total = 0
+        self.wait_time_total = {}
+        self.wait_count = {}
+        self.wait_time_max = {}
+
+    async def initialize(self):
+        # Application и Updater инициализируют один и тот же бот — запускаем диспетчер один раз
+        if self._dispatcher is not None and not self._dispatcher.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self._queue:
+            if not future.done():
+                future.cancel()
+        self._queue.clear()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        """Метрики: глубина очереди, число запросов и повторов, ожидание по приоритетам"""
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_depth_max": self.queue_depth_max,
+            "requests_total": self.requests_total,
+            "retries_total": self.retries_total,
+            "wait_time_total": dict(self.wait_time_total),
+            "wait_count": dict(self.wait_count),
+            "wait_time_max": dict(self.wait_time_max),
+        }
+
+    @staticmethod
+    def request_priority(endpoint, rate_limit_args):
+        if isinstance(rate_limit_args, int):
+            return rate_limit_args
+        if endpoint in QUIZ_ENDPOINTS:
+            return PRIORITY_QUIZ
+        return PRIORITY_DEFAULT
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_chats:
+                # Забываем чаты, корзины которых уже полностью восполнились
+                self._chats = {
+                    key: value for key, value in self._chats.items() if not value.is_idle(now)
+                }
+            # Отрицательные id и строковые @username — группы и каналы
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_chat_rate, self.group_chat_burst, now)
+            else:
+                bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _wait_chat(self, chat_id):
+        if chat_id is None:
+            return
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        now = time.monotonic()
+        delay = self._chat_bucket(chat_id, now).reserve(now)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _acquire_global(self, priority):
+        now = time.monotonic()
+        if not self._queue and now >= self._paused_until and self._global.time_until_token(now) == 0:
+            self._global.reserve(now)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        self.queue_depth_max = max(self.queue_depth_max, len(self._queue))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        """Выдаёт общие токены ожидающим запросам в порядке приоритета"""
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._global.time_until_token(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._global.reserve(now)
+            future.set_result(None)
+
+    def _record_wait(self, priority, waited):
+        self.wait_time_total[priority] = self.wait_time_total.get(priority, 0.0) + waited
+        self.wait_count[priority] = self.wait_count.get(priority, 0) + 1
+        self.wait_time_max[priority] = max(self.wait_time_max.get(priority, 0.0), waited)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = self.request_priority(endpoint, rate_limit_args)
+        chat_id = data.get("chat_id")
+        self.requests_total += 1
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            await self._wait_chat(chat_id)
+            await self._acquire_global(priority)
+            self._record_wait(priority, time.monotonic() - started)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == self.max_retries:
+                    logger.error(f"Лимит Telegram превышен после {self.max_retries} повторов ({endpoint})")
+                    raise
+                self.retries_total += 1
+                retry_after = exc.retry_after
+                if not isinstance(retry_after, (int, float)):
+                    retry_after = retry_after.total_seconds()
+                # Приостанавливаем все отправки, а не только этот запрос
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after + 0.1)
+                logger.warning(f"Flood control: {endpoint}, повтор через {retry_after} с")
+                await asyncio.sleep(retry_after + 0.1)
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsJournal:
+    """Журнал результатов игр: одна JSON-строка на игру, только дописывание.
+
+    Кроме результатов в журнал пишутся изменения списка чатов (поле type),
+    их разбирает хранилище таблицы лидеров.
+
+    У каждой записи есть возрастающий номер seq. Снимок таблицы лидеров
+    запоминает номер последней учтённой записи; при загрузке из журнала
+    повторяются только записи новее снимка, а после записи нового снимка
+    журнал обнуляется. Методы блокирующие — вызываются вне цикла событий.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+
+    def replay(self, after_seq):
+        """Итерирует записи с seq больше after_seq.
+
+        Оборванная последняя строка (падение во время записи) отрезается,
+        чтобы следующая запись не склеилась с ней.
+        """
+        self.records = 0
+        if not os.path.exists(self.path):
+            return
+        valid_size = 0
+        with open(self.path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.endswith(b"\n"):
+                    logger.error(f"Журнал {self.path} оборван на строке {line_number}, хвост отрезан")
+                    os.truncate(self.path, valid_size)
+                    break
+                valid_size += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.error(f"Пропущена повреждённая запись журнала {self.path}, строка {line_number}")
+                    continue
+                self.records += 1
+                if record["seq"] > after_seq:
+                    yield record
+
+    def append(self, records):
+        """Дописывает записи в конец журнала и сбрасывает их на диск"""
+        if not records:
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n" for record in records)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(records)
+
+    def truncate(self):
+        """Очищает журнал (все записи уже есть в снимке)"""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = 0
@@ -0,0 +1,903 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from sortedcontainers import SortedList
+
+from aggregates import LeaderboardAggregates
+from ranking import RankingIndex, add_best_time_column, best_time_key, record_from_row
+from history import WeeklyHistory
+from results_journal import ResultsJournal
+
+logger = logging.getLogger(__name__)
+
+
+def write_json_atomic(path, payload):
+    """Атомарно записывает строку в файл: временный файл + fsync + rename"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    # Синхронизируем каталог, чтобы rename пережил падение системы
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+LEADERBOARD_FILE_FORMAT = 2
+
+
+def read_leaderboard_file(path):
+    """Читает файл таблицы лидеров.
+
+    Возвращает (игроки, статистика или None). Поддерживает как текущий
+    формат {"format", "players", "aggregates"}, так и старый, где файл —
+    просто словарь игроков (так же устроены бэкапы).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_leaderboard(json.load(f))
+
+
+def is_current_format(raw):
+    return isinstance(raw, dict) and "format" in raw and isinstance(raw.get("players"), dict)
+
+
+def parse_leaderboard(raw):
+    """Разбирает содержимое файла таблицы лидеров, см. read_leaderboard_file"""
+    if is_current_format(raw):
+        aggregates = raw.get("aggregates")
+        return raw["players"], LeaderboardAggregates.from_dict(aggregates) if aggregates else None
+    return raw, None
+
+
+def apply_result(record, username, score, total_questions, played, answer_time=None):
+    """Запись игрока после ещё одной игры.
+
+    Сохраняется лучший результат (по счёту, затем проценту, затем по
+    меньшему времени ответов answer_time), а имя, время последней игры
+    и число игр обновляются после каждой игры.
+    """
+    percentage = (score / total_questions) * 100
+    result = {"score": score, "total_questions": total_questions, "percentage": percentage}
+    if answer_time is not None:
+        result["best_time"] = round(answer_time, 2)
+    if record is None:
+        return {
+            "username": username,
+            **result,
+            "last_played": played,
+            "games_played": 1
+        }
+    updated = {
+        **record,
+        "username": username,
+        "last_played": played,
+        "games_played": record.get("games_played", 0) + 1
+    }
+    if (score, percentage, -best_time_key(result)) > (record["score"], record["percentage"], -best_time_key(record)):
+        updated.pop("best_time", None)
+        updated.update(result)
+    return updated
+
+
+def backup_label(timestamp=None):
+    """Метка недели для архива, совпадает с суффиксом файлов бэкапа"""
+    return (timestamp or datetime.now()).strftime('%Y%m%d_%H%M%S')
+
+
+class LeaderboardStorage:
+    """Интерфейс хранилища таблицы лидеров.
+
+    Ключи игроков — строковые user_id, записи — словари с полями
+    username, score, total_questions, percentage, last_played, games_played
+    и необязательным best_time — временем ответов лучшей игры в секундах.
+    """
+
+    # Индекс прошедших недель (WeeklyHistory) или None, если история не ведётся
+    history = None
+
+    def load(self):
+        """Подготавливает хранилище к работе (вызывается один раз при запуске)"""
+
+    def get(self, user_id_str):
+        raise NotImplementedError
+
+    def set(self, user_id_str, record):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def record_result(self, user_id_str, username, score, total_questions, played=None, answer_time=None):
+        """Учитывает результат игры (см. apply_result) и возвращает новую запись игрока"""
+        record = apply_result(
+            self.get(user_id_str), username, score, total_questions, played or datetime.now().isoformat(),
+            answer_time
+        )
+        self.set(user_id_str, record)
+        return record
+
+    def items(self):
+        """Итерирует все записи (user_id_str, record) в произвольном порядке"""
+        raise NotImplementedError
+
+    def top(self, n):
+        """Возвращает n лучших игроков списком пар (user_id_str, record)"""
+        raise NotImplementedError
+
+    def rank(self, user_id_str):
+        """Возвращает место игрока в рейтинге (с 1) или None"""
+        raise NotImplementedError
+
+    def aggregates(self):
+        """Возвращает накопительную статистику (LeaderboardAggregates)"""
+        raise NotImplementedError
+
+    def change_token(self):
+        """Значение, которое меняется, когда таблицу изменил другой процесс.
+
+        None — хранилище принадлежит одному процессу.
+        """
+        return None
+
+    def archive_and_clear(self, label):
+        """Архивирует текущую неделю под меткой label и очищает таблицу.
+
+        Возвращает число заархивированных игроков.
+        """
+        raise NotImplementedError
+
+    def register_chat(self, chat_id):
+        """Запоминает чат, в котором играли (получатель рассылок)"""
+        raise NotImplementedError
+
+    def chat_batch(self, after_chat_id, limit):
+        """Следующие limit чатов с id больше after_chat_id (None — с начала), по возрастанию"""
+        raise NotImplementedError
+
+    def record_deliveries(self, delivered, failed, max_failures):
+        """Учитывает результаты рассылки.
+
+        delivered — id чатов с успешной доставкой (их счётчик ошибок
+        обнуляется), failed — список (chat_id, текст ошибки, окончательная
+        ли ошибка). Чаты с окончательной ошибкой или max_failures ошибками
+        подряд удаляются. Возвращает список удалённых чатов.
+        """
+        raise NotImplementedError
+
+    async def flush(self):
+        """Сохраняет отложенные изменения"""
+
+    async def close(self):
+        """Гарантированно сохраняет изменения и освобождает ресурсы"""
+        await self.flush()
+
+
+class JsonLeaderboardStorage(LeaderboardStorage):
+    """Таблица лидеров, которая живёт в памяти и сбрасывается на диск в фоне.
+
+    С журналом (ResultsJournal) результат игры, новый чат и исход доставки
+    в чат дописываются в журнал одной строкой каждый, а файл таблицы —
+    снимок — переписывается целиком только при уплотнении: когда в журнале
+    накопилось compact_every записей или при сбросе недели. При загрузке
+    к снимку применяются записи журнала, которых в нём ещё нет.
+    """
+
+    def __init__(self, path, flush_delay=5.0, backups=None, journal=None, compact_every=10000, history_path=None):
+        self.path = path
+        self.flush_delay = flush_delay
+        # BackupStore для недель, закрытых archive_and_clear (None — без бэкапов)
+        self.backups = backups
+        self._backup_task = None
+        # База SQLite с индексом прошедших недель (None — без истории)
+        self.history_path = history_path
+        self._history_conn = None
+        self.journal = journal
+        self.compact_every = compact_every
+        # Номер последней записи журнала, учтённой в памяти
+        self._seq = 0
+        self._journal_pending = []
+        self._data = {}
+        self._ranking = RankingIndex()
+        self._aggregates = LeaderboardAggregates()
+        self._chats = SortedList()
+        self._chat_failures = {}
+        self._dirty = False
+        self._flush_task = None
+        self._flush_lock = None
+
+    def load(self):
+        """Загружает таблицу лидеров с диска (один раз при запуске)"""
+        aggregates = None
+        chats = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    raw = json.load(f)
+                self._data, aggregates = parse_leaderboard(raw)
+                if is_current_format(raw):
+                    chats = raw
+            else:
+                self._data = {}
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке таблицы лидеров: {e}")
+            self._data = {}
+        self._seq = chats.get("journal_seq", 0)
+        self._journal_pending = []
+        self._chats = SortedList(chats.get("chats", []))
+        self._chat_failures = {int(chat_id): data for chat_id, data in chats.get("chat_failures", {}).items()}
+        if self._replay_journal():
+            aggregates = None
+        self._ranking.rebuild(self._data)
+        if aggregates is None or aggregates.count != len(self._data):
+            # Старый формат файла или рассинхронизация — пересчитываем один раз
+            aggregates = LeaderboardAggregates.from_records(self._data.values())
+        self._aggregates = aggregates
+        self._dirty = False
+        logger.info(f"Таблица лидеров загружена в память: {len(self._data)} игроков")
+        if self.history_path and self.history is None:
+            self._open_history()
+
+    def _open_history(self):
+        """Открывает индекс истории и добавляет в него бэкапы, которых там ещё нет"""
+        try:
+            self._history_conn = connect_sqlite(self.history_path)
+            self.history = WeeklyHistory(self._history_conn)
+            self.history.ensure_schema()
+            if self.backups is None:
+                return
+            for entry in self.backups.entries():
+                if not self.history.has_week(entry["label"]):
+                    players = self.history.add_week(entry["label"], self.backups.read(entry["label"]))
+                    logger.info(f"Бэкап {entry['file']} добавлен в историю: {players} игроков")
+        except Exception as e:
+            logger.error(f"Ошибка при открытии истории недель: {e}")
+
+    def _replay_journal(self):
+        """Применяет записи журнала новее снимка, возвращает их число"""
+        if self.journal is None:
+            return 0
+        replayed = 0
+        try:
+            for entry in self.journal.replay(self._seq):
+                if entry["seq"] <= self._seq:
+                    # Повтор записи после неудачного уплотнения
+                    continue
+                self._apply_entry(entry)
+                self._seq = entry["seq"]
+                replayed += 1
+        except Exception as e:
+            logger.error(f"Ошибка при чтении журнала результатов: {e}")
+        if replayed:
+            logger.info(f"Из журнала применено записей: {replayed}")
+        return replayed
+
+    def _apply_entry(self, entry):
+        """Применяет запись журнала при загрузке (записи без type — результаты игр)"""
+        kind = entry.get("type", "result")
+        if kind == "result":
+            user_id_str = entry["user_id"]
+            self._data[user_id_str] = apply_result(
+                self._data.get(user_id_str),
+                entry["username"], entry["score"], entry["total_questions"], entry["played"],
+                entry.get("answer_time")
+            )
+        elif kind == "chat":
+            self._chats.add(entry["chat_id"])
+        elif kind == "chat_removed":
+            self._chats.discard(entry["chat_id"])
+            self._chat_failures.pop(entry["chat_id"], None)
+        elif kind == "chat_failure":
+            if entry["failure"] is None:
+                self._chat_failures.pop(entry["chat_id"], None)
+            else:
+                self._chat_failures[entry["chat_id"]] = entry["failure"]
+
+    def _log(self, entry):
+        """Дописывает изменение в журнал (без журнала — отмечает, что нужен новый снимок)"""
+        if self.journal is None:
+            self.mark_dirty()
+            return
+        self._seq += 1
+        self._journal_pending.append({"seq": self._seq, **entry})
+        self._schedule_flush()
+
+    def count(self):
+        return len(self._data)
+
+    def items(self):
+        return iter(self.snapshot().items())
+
+    def top(self, n):
+        return [(user_id_str, self._data[user_id_str]) for user_id_str in self._ranking.top(n)]
+
+    def rank(self, user_id_str):
+        return self._ranking.rank(user_id_str)
+
+    def aggregates(self):
+        return self._aggregates
+
+    def archive_and_clear(self, label):
+        old_leaderboard = self.snapshot()
+        if old_leaderboard and (self.backups is not None or self.history_path):
+            self._schedule_archive(label, old_leaderboard)
+        self.clear()
+        return len(old_leaderboard)
+
+    def _schedule_archive(self, label, leaderboard):
+        """Пишет бэкап недели и добавляет её в историю в фоновом потоке, вне цикла событий"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._archive_week(label, leaderboard)
+            return
+        self._backup_task = loop.create_task(self._archive(self._backup_task, label, leaderboard))
+
+    async def _archive(self, previous, label, leaderboard):
+        if previous is not None:
+            await previous
+        await asyncio.to_thread(self._archive_week, label, leaderboard)
+
+    def _archive_week(self, label, leaderboard):
+        if self.backups is not None:
+            try:
+                self.backups.write(label, leaderboard)
+            except Exception as e:
+                logger.error(f"Ошибка при создании бэкапа недели {label}: {e}")
+        if self.history_path:
+            try:
+                # Своё соединение: основное читается из цикла событий
+                conn = connect_sqlite(self.history_path)
+                try:
+                    history = WeeklyHistory(conn)
+                    history.ensure_schema()
+                    players = history.add_week(label, leaderboard)
+                finally:
+                    conn.close()
+                logger.info(f"Неделя {label} добавлена в историю: {players} игроков")
+            except Exception as e:
+                logger.error(f"Ошибка при добавлении недели {label} в историю: {e}")
+
+    def register_chat(self, chat_id):
+        if chat_id not in self._chats:
+            self._chats.add(chat_id)
+            # Первая игра нового игрока не должна переписывать весь файл таблицы
+            self._log({"type": "chat", "chat_id": chat_id})
+
+    def chat_batch(self, after_chat_id, limit):
+        chats = self._chats.irange(minimum=after_chat_id, inclusive=(False, True))
+        return [chat_id for _, chat_id in zip(range(limit), chats)]
+
+    def chats(self):
+        """Все чаты рассылок и их ошибки доставки: (список id, {chat_id: ошибка})"""
+        return list(self._chats), dict(self._chat_failures)
+
+    def record_deliveries(self, delivered, failed, max_failures):
+        for chat_id in delivered:
+            if self._chat_failures.pop(chat_id, None) is not None:
+                self._log({"type": "chat_failure", "chat_id": chat_id, "failure": None})
+        pruned = []
+        for chat_id, error, permanent in failed:
+            failure = self._chat_failures.get(chat_id, {"failures": 0})
+            failure = {
+                "failures": failure["failures"] + 1,
+                "last_error": error,
+                "last_failed": datetime.now().isoformat(),
+            }
+            if permanent or failure["failures"] >= max_failures:
+                self._chats.discard(chat_id)
+                self._chat_failures.pop(chat_id, None)
+                pruned.append(chat_id)
+                self._log({"type": "chat_removed", "chat_id": chat_id})
+            else:
+                self._chat_failures[chat_id] = failure
+                self._log({"type": "chat_failure", "chat_id": chat_id, "failure": failure})
+        return pruned
+
+    def get(self, user_id_str):
+        return self._data.get(user_id_str)
+
+    def set(self, user_id_str, record):
+        """Заменяет запись игрока и планирует запись на диск.
+
+        Записи не изменяются на месте: снимок для фоновой записи
+        делается поверхностным копированием словаря.
+        """
+        self._put(user_id_str, record)
+        self.mark_dirty()
+
+    def _put(self, user_id_str, record):
+        self._aggregates.replace(self._data.get(user_id_str), record)
+        self._data[user_id_str] = record
+        self._ranking.update(user_id_str, record)
+
+    def record_result(self, user_id_str, username, score, total_questions, played=None, answer_time=None):
+        if self.journal is None:
+            return super().record_result(user_id_str, username, score, total_questions, played, answer_time)
+        played = played or datetime.now().isoformat()
+        record = apply_result(self._data.get(user_id_str), username, score, total_questions, played, answer_time)
+        self._put(user_id_str, record)
+        entry = {
+            "user_id": user_id_str,
+            "username": username,
+            "score": score,
+            "total_questions": total_questions,
+            "played": played,
+        }
+        if answer_time is not None:
+            entry["answer_time"] = answer_time
+        self._log(entry)
+        return record
+
+    def clear(self):
+        """Очищает таблицу лидеров"""
+        self._data = {}
+        self._ranking.clear()
+        self._aggregates.clear()
+        self.mark_dirty()
+
+    def snapshot(self):
+        """Возвращает поверхностную копию таблицы для сериализации"""
+        return dict(self._data)
+
+    def _file_snapshot(self):
+        """Снимок для записи в файл: игроки вместе со статистикой"""
+        return {
+            "format": LEADERBOARD_FILE_FORMAT,
+            "players": self.snapshot(),
+            "aggregates": self._aggregates.to_dict(),
+            "chats": list(self._chats),
+            "chat_failures": dict(self._chat_failures),
+            "journal_seq": self._seq,
+        }
+
+    def mark_dirty(self):
+        """Отмечает таблицу изменённой (нужен новый снимок) и запускает отложенную запись"""
+        self._dirty = True
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (например, из скрипта) пишем сразу
+            self.flush_sync()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        # Начатую запись не прерываем: close() дождётся её через блокировку
+        await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Записывает изменения на диск, не блокируя цикл событий"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty and not self._journal_pending:
+                return
+            if self._backup_task is not None:
+                # Очищенную таблицу пишем только после бэкапа прошедшей недели
+                await self._backup_task
+                self._backup_task = None
+            snapshot, pending = self._take_changes()
+            try:
+                await asyncio.to_thread(self._write, snapshot, pending)
+            except Exception as e:
+                self._restore_changes(snapshot, pending)
+                logger.error(f"Ошибка при сохранении таблицы лидеров: {e}")
+
+    def flush_sync(self):
+        """Синхронная запись на диск (при остановке бота или вне цикла событий)"""
+        if not self._dirty and not self._journal_pending:
+            return
+        snapshot, pending = self._take_changes()
+        try:
+            self._write(snapshot, pending)
+        except Exception as e:
+            self._restore_changes(snapshot, pending)
+            logger.error(f"Ошибка при сохранении таблицы лидеров: {e}")
+
+    def _take_changes(self):
+        """Забирает накопленные записи журнала и, если пора уплотнять, снимок таблицы"""
+        pending, self._journal_pending = self._journal_pending, []
+        snapshot = None
+        if self._dirty or (pending and self.journal.records + len(pending) >= self.compact_every):
+            self._dirty = False
+            snapshot = self._file_snapshot()
+        return snapshot, pending
+
+    def _restore_changes(self, snapshot, pending):
+        self._journal_pending = pending + self._journal_pending
+        if snapshot is not None:
+            self._dirty = True
+
+    async def close(self):
+        """Отменяет отложенную запись и гарантированно сохраняет изменения"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        if self.journal is not None and (self.journal.records or self._journal_pending):
+            # При остановке уплотняем журнал, чтобы следующий запуск прочитал только снимок
+            self._dirty = True
+        await self.flush()
+        if self._history_conn is not None:
+            self._history_conn.close()
+            self._history_conn = None
+            self.history = None
+
+    def _write(self, snapshot, pending=()):
+        if pending:
+            self.journal.append(pending)
+        if snapshot is None:
+            return
+        payload = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+        write_json_atomic(self.path, payload)
+        if self.journal is not None:
+            # Все записи журнала уже в снимке
+            self.journal.truncate()
+        logger.info("Таблица лидеров сохранена")
+
+
+class SqliteLeaderboardStorage(LeaderboardStorage):
+    """Таблица лидеров и история недель в SQLite (режим WAL).
+
+    Рейтинг, место игрока и недельный сброс выполняются индексированными
+    запросами, без загрузки всей таблицы в память.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            user_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            percentage REAL NOT NULL,
+            last_played TEXT NOT NULL,
+            games_played INTEGER NOT NULL DEFAULT 1,
+            best_time REAL NOT NULL DEFAULT 9e999
+        );
+        CREATE TABLE IF NOT EXISTS leaderboard_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            players INTEGER NOT NULL,
+            score_sum INTEGER NOT NULL,
+            percentage_sum REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS score_histogram (
+            score INTEGER PRIMARY KEY,
+            players INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            first_seen TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chat_failures (
+            chat_id INTEGER PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            last_error TEXT NOT NULL,
+            last_failed TEXT NOT NULL
+        );
+    """
+
+    COLUMNS = ("username", "score", "total_questions", "percentage", "last_played", "games_played", "best_time")
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        # Чаты, уже записанные в базу: чтобы не писать на каждый /quiz
+        self._known_chats = set()
+
+    def load(self):
+        self._conn = connect_sqlite(self.path)
+        self._conn.executescript(self.SCHEMA)
+        add_best_time_column(self._conn, "players")
+        # Порядок рейтинга: счёт, процент, время ответов (9e999 — времени нет), user_id
+        self._conn.execute("DROP INDEX IF EXISTS idx_players_rank")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_players_rank_time ON players (score DESC, percentage DESC, best_time, user_id)"
+        )
+        # Прошедшие недели (weekly_results) хранятся в той же базе
+        self.history = WeeklyHistory(self._conn)
+        self.history.ensure_schema()
+        if self._conn.execute("SELECT 1 FROM leaderboard_stats").fetchone() is None:
+            with self._transaction():
+                self._rebuild_aggregates()
+        logger.info(f"Таблица лидеров SQLite открыта: {self.path} ({self.count()} игроков)")
+
+    def _record(self, row):
+        return record_from_row(self.COLUMNS, row)
+
+    def _transaction(self):
+        return write_transaction(self._conn)
+
+    def _rebuild_aggregates(self):
+        """Пересчитывает статистику по таблице players (внутри транзакции)"""
+        self._conn.execute("DELETE FROM leaderboard_stats")
+        self._conn.execute("DELETE FROM score_histogram")
+        self._conn.execute(
+            "INSERT INTO leaderboard_stats (id, players, score_sum, percentage_sum) "
+            "SELECT 1, COUNT(*), COALESCE(SUM(score), 0), COALESCE(SUM(percentage), 0) FROM players"
+        )
+        self._conn.execute(
+            "INSERT INTO score_histogram (score, players) "
+            "SELECT score, COUNT(*) FROM players GROUP BY score"
+        )
+
+    def _apply_aggregates_delta(self, record, sign):
+        """Добавляет (sign=1) или вычитает (sign=-1) запись из статистики"""
+        self._conn.execute(
+            "UPDATE leaderboard_stats SET players = players + ?, "
+            "score_sum = score_sum + ?, percentage_sum = percentage_sum + ? WHERE id = 1",
+            (sign, sign * record["score"], sign * record["percentage"])
+        )
+        self._conn.execute(
+            "INSERT INTO score_histogram (score, players) VALUES (?, ?) "
+            "ON CONFLICT (score) DO UPDATE SET players = players + excluded.players",
+            (record["score"], sign)
+        )
+
+    @staticmethod
+    def _values(record):
+        return (
+            record["username"],
+            record["score"],
+            record["total_questions"],
+            record["percentage"],
+            record["last_played"],
+            record.get("games_played", 1),
+            best_time_key(record),
+        )
+
+    def get(self, user_id_str):
+        row = self._conn.execute(
+            "SELECT username, score, total_questions, percentage, last_played, games_played, best_time "
+            "FROM players WHERE user_id = ?",
+            (user_id_str,)
+        ).fetchone()
+        return self._record(row) if row else None
+
+    def set(self, user_id_str, record):
+        with self._transaction():
+            self._replace(user_id_str, record, self.get(user_id_str))
+
+    def record_result(self, user_id_str, username, score, total_questions, played=None, answer_time=None):
+        # Чтение и запись в одной транзакции: результаты игрока пишут разные воркеры
+        # (его собственный и воркер группового чата), и обновления не должны теряться
+        with self._transaction():
+            old_record = self.get(user_id_str)
+            record = apply_result(
+                old_record, username, score, total_questions, played or datetime.now().isoformat(), answer_time
+            )
+            self._replace(user_id_str, record, old_record)
+        return record
+
+    def _replace(self, user_id_str, record, old_record):
+        """Записывает игрока и обновляет статистику (внутри транзакции)"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO players "
+            "(user_id, username, score, total_questions, percentage, last_played, games_played, best_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id_str, *self._values(record))
+        )
+        if old_record is not None:
+            self._apply_aggregates_delta(old_record, -1)
+        self._apply_aggregates_delta(record, 1)
+
+    def change_token(self):
+        # data_version меняется после каждой транзакции других подключений
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self):
+        row = self._conn.execute("SELECT players FROM leaderboard_stats WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def items(self):
+        cursor = self._conn.execute(
+            "SELECT user_id, username, score, total_questions, percentage, last_played, games_played, best_time "
+            "FROM players"
+        )
+        for row in cursor:
+            yield row[0], self._record(row[1:])
+
+    def top(self, n):
+        rows = self._conn.execute(
+            "SELECT user_id, username, score, total_questions, percentage, last_played, games_played, best_time "
+            "FROM players ORDER BY score DESC, percentage DESC, best_time, user_id LIMIT ?",
+            (n,)
+        ).fetchall()
+        return [(row[0], self._record(row[1:])) for row in rows]
+
+    def rank(self, user_id_str):
+        record = self.get(user_id_str)
+        if record is None:
+            return None
+        score, percentage, best_time = record["score"], record["percentage"], best_time_key(record)
+        better = self._conn.execute(
+            "SELECT COUNT(*) FROM players WHERE score > ? "
+            "OR (score = ? AND percentage > ?) "
+            "OR (score = ? AND percentage = ? AND best_time < ?) "
+            "OR (score = ? AND percentage = ? AND best_time = ? AND user_id < ?)",
+            (score, score, percentage, score, percentage, best_time, score, percentage, best_time, user_id_str)
+        ).fetchone()[0]
+        return better + 1
+
+    def aggregates(self):
+        row = self._conn.execute(
+            "SELECT players, score_sum, percentage_sum FROM leaderboard_stats WHERE id = 1"
+        ).fetchone()
+        if row is None:
+            return LeaderboardAggregates()
+        histogram = []
+        for score, players in self._conn.execute("SELECT score, players FROM score_histogram ORDER BY score"):
+            histogram.extend([0] * (score + 1 - len(histogram)))
+            histogram[score] = players
+        return LeaderboardAggregates(*row, histogram=histogram)
+
+    def archive_and_clear(self, label):
+        with self._transaction():
+            archived = self._conn.execute(
+                "INSERT OR REPLACE INTO weekly_results "
+                "(week, user_id, username, score, total_questions, percentage, last_played, games_played, best_time) "
+                "SELECT ?, user_id, username, score, total_questions, percentage, last_played, games_played, best_time "
+                "FROM players",
+                (label,)
+            ).rowcount
+            if archived:
+                self.history.finish_week(label)
+            self._conn.execute("DELETE FROM players")
+            self._rebuild_aggregates()
+        logger.info(f"Неделя {label} перенесена в историю: {archived} игроков")
+        return archived
+
+    def import_week(self, label, leaderboard):
+        """Импортирует словарь таблицы лидеров как заархивированную неделю"""
+        self.history.add_week(label, leaderboard)
+
+    def import_players(self, leaderboard, chats=(), chat_failures=None):
+        """Импортирует словарь текущей таблицы лидеров одной транзакцией.
+
+        Вместе с игроками в той же транзакции переносятся чаты рассылок
+        и их ошибки доставки ({chat_id: {failures, last_error, last_failed}}).
+        """
+        now = datetime.now().isoformat()
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chats (chat_id, first_seen) VALUES (?, ?)",
+                ((chat_id, now) for chat_id in chats)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chat_failures (chat_id, failures, last_error, last_failed) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (chat_id, failure["failures"], failure["last_error"], failure["last_failed"])
+                    for chat_id, failure in (chat_failures or {}).items()
+                )
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO players "
+                "(user_id, username, score, total_questions, percentage, last_played, games_played, best_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (user_id_str, *self._values(record))
+                    for user_id_str, record in leaderboard.items()
+                )
+            )
+            self._rebuild_aggregates()
+
+    def register_chat(self, chat_id):
+        if chat_id in self._known_chats:
+            return
+        self._conn.execute(
+            "INSERT OR IGNORE INTO chats (chat_id, first_seen) VALUES (?, ?)",
+            (chat_id, datetime.now().isoformat())
+        )
+        self._known_chats.add(chat_id)
+
+    def chat_batch(self, after_chat_id, limit):
+        if after_chat_id is None:
+            rows = self._conn.execute(
+                "SELECT chat_id FROM chats ORDER BY chat_id LIMIT ?", (limit,)
+            )
+        else:
+            rows = self._conn.execute(
+                "SELECT chat_id FROM chats WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+                (after_chat_id, limit)
+            )
+        return [row[0] for row in rows]
+
+    def record_deliveries(self, delivered, failed, max_failures):
+        now = datetime.now().isoformat()
+        pruned = []
+        with self._transaction():
+            self._conn.executemany(
+                "DELETE FROM chat_failures WHERE chat_id = ?",
+                ((chat_id,) for chat_id in delivered)
+            )
+            for chat_id, error, permanent in failed:
+                self._conn.execute(
+                    "INSERT INTO chat_failures (chat_id, failures, last_error, last_failed) "
+                    "VALUES (?, 1, ?, ?) ON CONFLICT (chat_id) DO UPDATE SET "
+                    "failures = failures + 1, last_error = excluded.last_error, "
+                    "last_failed = excluded.last_failed",
+                    (chat_id, error, now)
+                )
+                failures = self._conn.execute(
+                    "SELECT failures FROM chat_failures WHERE chat_id = ?", (chat_id,)
+                ).fetchone()[0]
+                if permanent or failures >= max_failures:
+                    self._conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+                    self._conn.execute("DELETE FROM chat_failures WHERE chat_id = ?", (chat_id,))
+                    self._known_chats.discard(chat_id)
+                    pruned.append(chat_id)
+        return pruned
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def connect_sqlite(path):
+    """Открывает базу SQLite в режиме WAL"""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+@contextmanager
+def write_transaction(conn):
+    """Транзакция записи: блокировка берётся сразу, чтобы не было гонок чтения-записи"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def create_storage(backend, json_path, sqlite_path, flush_delay=5.0, backups=None, journal_path=None,
+                   compact_every=10000, history_path=None):
+    """Создаёт хранилище таблицы лидеров по имени бэкенда ("json" или "sqlite").
+
+    backups (BackupStore), журнал результатов journal_path и база истории
+    недель history_path используются JSON-хранилищем; SQLite хранит
+    прошедшие недели в своей базе и обновляет одну строку игрока на каждую игру.
+    """
+    if backend == "json":
+        return JsonLeaderboardStorage(
+            json_path,
+            flush_delay=flush_delay,
+            backups=backups,
+            journal=ResultsJournal(journal_path) if journal_path else None,
+            compact_every=compact_every,
+            history_path=history_path
+        )
+    if backend == "sqlite":
+        return SqliteLeaderboardStorage(sqlite_path)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
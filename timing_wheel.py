@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel:
+    """Хешированное колесо таймеров: дедлайны всех сессий в одной задаче asyncio.
+
+    Время разбито на тики по tick секунд. Таймер кладётся в слот
+    (тик срабатывания) % slots вместе с номером тика срабатывания, поэтому
+    постановка и отмена стоят O(1) (слот — словарь по ключу), а за тик
+    просматривается один слот. Таймеры, которым ещё ждать полный оборот
+    колеса, остаются в слоте. Истёкшие таймеры передаются в on_expire
+    списками (key, data) не длиннее batch_size; между пачками задача
+    уступает цикл событий обработчикам обновлений.
+
+    on_expire вызывается синхронно и не должен ждать сеть: отправку
+    сообщений он запускает отдельными задачами.
+    """
+
+    def __init__(self, on_expire=None, tick=0.5, slots=512, batch_size=1000):
+        self.on_expire = on_expire
+        self.tick = tick
+        self.batch_size = batch_size
+        self._slots = [{} for _ in range(slots)]
+        # Ключ таймера -> номер слота
+        self._where = {}
+        self._origin = time.monotonic()
+        # Последний обработанный тик
+        self._current = 0
+        self._task = None
+        self.scheduled = 0
+        self.cancelled = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def _now_tick(self):
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def schedule(self, key, delay, data=None):
+        """Ставит таймер key на delay секунд (прежний таймер с тем же ключом заменяется)"""
+        self._remove(key)
+        target = max(self._now_tick() + math.ceil(delay / self.tick), self._current + 1)
+        slot = target % len(self._slots)
+        self._slots[slot][key] = (target, data)
+        self._where[key] = slot
+        self.scheduled += 1
+
+    def cancel(self, key):
+        """Отменяет таймер key, возвращает True, если он был"""
+        if self._remove(key):
+            self.cancelled += 1
+            return True
+        return False
+
+    def _remove(self, key):
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def _advance(self, now_tick):
+        """Проходит тики до now_tick и возвращает истёкшие таймеры"""
+        expired = []
+        if now_tick - self._current > len(self._slots):
+            # Цикл событий стоял дольше оборота колеса: достаточно одного прохода по всем слотам
+            self._current = now_tick - len(self._slots)
+        while self._current < now_tick:
+            self._current += 1
+            slot = self._slots[self._current % len(self._slots)]
+            due = [key for key, (target, _) in slot.items() if target <= self._current]
+            for key in due:
+                _, data = slot.pop(key)
+                del self._where[key]
+                expired.append((key, data))
+        return expired
+
+    async def _run(self):
+        while True:
+            expired = self._advance(self._now_tick())
+            self.expired += len(expired)
+            for start in range(0, len(expired), self.batch_size):
+                try:
+                    self.on_expire(expired[start:start + self.batch_size])
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке истёкших таймеров: {e}")
+                await asyncio.sleep(0)
+            next_tick = self._origin + (self._current + 1) * self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def start(self):
+        """Запускает задачу колеса в текущем цикле событий"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает задачу колеса (поставленные таймеры остаются)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {"scheduled": self.scheduled, "cancelled": self.cancelled, "expired": self.expired}
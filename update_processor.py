@@ -0,0 +1,67 @@
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+# Лимит семафора BaseUpdateProcessor: он берётся до очереди пользователя,
+# поэтому сам ничего не ограничивает — настоящий лимит в do_process_update
+UNBOUNDED_UPDATES = 2**31 - 1
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не более
+    max_concurrent_updates), а обновления одного пользователя — строго
+    по очереди в порядке поступления. Слот из max_concurrent_updates
+    обновление занимает, только когда до него дошла очередь пользователя.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должен быть положительным")
+        super().__init__(UNBOUNDED_UPDATES)
+        self.concurrency_limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # ключ пользователя -> [блокировка, число ожидающих обновлений]
+        self._locks = {}
+
+    @staticmethod
+    def ordering_key(update):
+        """Ключ очереди: пользователь, а если его нет — чат"""
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return ("user", user.id)
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return ("chat", chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        # Сначала очередь пользователя, затем слот: обновления, ждущие своей очереди,
+        # не занимают слоты, и поток нажатий одного пользователя не задерживает остальных
+        key = self.ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock пропускает ожидающих в порядке очереди
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Удаляем блокировку, чтобы память не росла с числом пользователей
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from telegram import Update
+
+from answer_callback import GROUP_ANSWER_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Ждём столько секунд, пока воркер завершится сам, прежде чем остановить его принудительно
+WORKER_STOP_TIMEOUT = 30
+
+
+def update_user_id(data):
+    """Id пользователя из JSON обновления (или id чата, если пользователя нет)"""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def shard_key(data):
+    """Ключ распределения обновления по воркерам.
+
+    Групповой раунд живёт в памяти одного воркера, поэтому /groupquiz и
+    нажатия на его кнопки (данные "g:...") распределяются по id чата,
+    остальные обновления — по id пользователя.
+    """
+    callback = data.get("callback_query")
+    if callback and str(callback.get("data", "")).startswith(GROUP_ANSWER_PREFIX + ":"):
+        chat = (callback.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    message = data.get("message")
+    if message and str(message.get("text", "")).startswith("/groupquiz"):
+        return message["chat"]["id"]
+    return update_user_id(data)
+
+
+def shard_for(user_id, workers):
+    """Номер воркера, который обслуживает пользователя"""
+    return user_id % workers
+
+
+class Supervisor:
+    """Запускает воркеры и распределяет между ними обновления по user_id.
+
+    У каждого воркера своя очередь: все обновления одного пользователя
+    попадают к одному воркеру в порядке поступления, а внутри воркера
+    PerUserUpdateProcessor сохраняет этот порядок. Упавший воркер
+    перезапускается с той же очередью, так что обновления не теряются.
+    """
+
+    def __init__(self, workers, target, target_args=()):
+        self.workers = workers
+        self.target = target
+        self.target_args = target_args
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(workers)]
+        self._processes = [None] * workers
+        self.dispatched = [0] * workers
+        self.restarts = 0
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.workers, self._queues[index], *self.target_args),
+            name=f"quiz-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Запущено воркеров: {self.workers}")
+
+    def dispatch(self, updates):
+        """Раздаёт пачку обновлений (JSON) воркерам, по одной пачке на воркер"""
+        batches = [[] for _ in range(self.workers)]
+        for data in updates:
+            batches[shard_for(shard_key(data), self.workers)].append(data)
+        for index, batch in enumerate(batches):
+            if batch:
+                self._queues[index].put(batch)
+                self.dispatched[index] += len(batch)
+
+    def check_workers(self):
+        """Перезапускает упавшие воркеры"""
+        for index, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапускаю")
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop(self):
+        """Просит воркеры доработать очереди и дожидается их завершения"""
+        for queue in self._queues:
+            queue.put(None)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.error(f"Воркер {index} не завершился вовремя, останавливаю принудительно")
+                process.terminate()
+                process.join()
+        logger.info(f"Воркеры остановлены, обновлений по воркерам: {self.dispatched}")
+
+
+async def serve_worker(bot, index, workers, queue, **build_kwargs):
+    """Обрабатывает обновления из очереди воркера до получения None"""
+    application = bot.build_application(shard=(index, workers), **build_kwargs)
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        logger.info(f"Воркер {index} из {workers} готов")
+        while True:
+            batch = await asyncio.to_thread(queue.get)
+            if batch is None:
+                break
+            for data in batch:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()
+    await bot.post_shutdown(application)
+
+
+def run_worker(index, workers, queue):
+    """Точка входа процесса-воркера"""
+    # Остановкой воркеров управляет супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import bot
+    asyncio.run(serve_worker(bot, index, workers, queue))
+
+
+async def poll_updates(bot, supervisor, timeout=30):
+    """Получает обновления через getUpdates и раздаёт их воркерам"""
+    offset = None
+    async with bot:
+        await bot.delete_webhook()
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=timeout,
+                    read_timeout=timeout + 10,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при получении обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+            if updates:
+                offset = updates[-1].update_id + 1
+                supervisor.dispatch([update.to_dict() for update in updates])
+            supervisor.check_workers()